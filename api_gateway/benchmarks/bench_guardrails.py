@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the guardrail rule engine
+
+Measures per-call cost of input sanitization and output validation on
+realistic query and response sizes, next to the previous multi-pass
+implementation as a reference point.
+
+    cd api_gateway && python -m benchmarks.bench_guardrails [--json results.json]
+"""
+
+import os
+import re
+import sys
+import json
+import timeit
+import argparse
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from src.services.guardrails import GuardrailsService
+
+SHORT_QUERY = "Q3 revenue by region for the north sales team"
+MEDIUM_QUERY = (
+    "Compare quota attainment and commission earned for agents AG-1042, AG-1077 and AG-2210 "
+    "across the last two quarters, broken down by channel and product category, and highlight "
+    "any agent whose pipeline conversion dropped more than ten percent month over month."
+)
+HOSTILE_QUERY = (
+    MEDIUM_QUERY + " <script>alert('x')</script> javascript:void(0) ' or '1'='1 "
+    "union select * from raw_sales_data; drop table agent_performance ' || ' "
+) * 2
+
+PARAGRAPH = (
+    "Revenue in the north region grew 12% quarter over quarter, driven mainly by the enterprise "
+    "channel. Agent AG-1042 exceeded quota at 118% while pipeline conversion for the mid-market "
+    "segment declined slightly. Margin remained stable as commission costs scaled with sales. "
+)
+SHORT_RESPONSE = PARAGRAPH * 2
+# Roughly the 1500 token completion budget of the RAG service
+LONG_RESPONSE = PARAGRAPH * 25
+LONG_RESPONSE_WITH_CLAIMS = LONG_RESPONSE + "The deal closed at 10:30 am on 2024-03-28 for exactly 42 units."
+LONG_RESPONSE_ATTRIBUTED = "Based on the Q1 report, " + LONG_RESPONSE_WITH_CLAIMS
+
+def legacy_sanitize(query: str) -> str:
+    """Previous implementation: six sequential re.sub passes"""
+    sanitized = re.sub(r'<script[^>]*>.*?</script>', '', query, flags=re.IGNORECASE | re.DOTALL)
+    sanitized = re.sub(r'javascript:', '', sanitized, flags=re.IGNORECASE)
+    for pattern in [
+        r'(union|select|insert|update|delete|drop|create|alter)\s+',
+        r'(\'\s*or\s*\'\s*1\s*=\s*1)',
+        r'(\'\s*;\s*--)',
+        r'(\'\s*\|\|\s*\')'
+    ]:
+        sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
+    return sanitized.strip()
+
+def legacy_detect_hallucination(content: str) -> bool:
+    """Previous implementation: one search per claim pattern plus a rescan for sources"""
+    for pattern in [r'\d{1,2}:\d{2}\s*(am|pm)', r'\d{4}-\d{2}-\d{2}', r'exactly\s+\d+', r'precisely\s+\d+']:
+        if re.search(pattern, content, re.IGNORECASE):
+            if not re.search(r'(source|according to|based on)', content, re.IGNORECASE):
+                return True
+    return False
+
+def run_sync(coroutine):
+    """Drive a coroutine that never suspends without event loop overhead"""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("Coroutine suspended")
+
+def measure(fn, number: int) -> float:
+    """Best-of-five mean time per call, in microseconds"""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing run")
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    args = parser.parse_args()
+
+    service = GuardrailsService()
+    cases = []
+
+    for label, query in [("short", SHORT_QUERY), ("medium", MEDIUM_QUERY), ("hostile", HOSTILE_QUERY)]:
+        cases.append((f"sanitize_input[{label}, {len(query)} chars]",
+                      lambda q=query: run_sync(service.sanitize_input(q)),
+                      lambda q=query: legacy_sanitize(q)))
+
+    for label, response in [
+        ("short", SHORT_RESPONSE),
+        ("long", LONG_RESPONSE),
+        ("long+claims", LONG_RESPONSE_WITH_CLAIMS),
+        ("long+attributed", LONG_RESPONSE_ATTRIBUTED),
+    ]:
+        cases.append((f"detect_hallucination[{label}, {len(response)} chars]",
+                      lambda r=response: service._detect_hallucination(r),
+                      lambda r=response: legacy_detect_hallucination(r)))
+
+    results = []
+    print(f"{'case':<48} {'engine us':>10} {'legacy us':>10} {'speedup':>8}")
+    for name, current, legacy in cases:
+        current_us = measure(current, args.number)
+        legacy_us = measure(legacy, args.number)
+        results.append({"case": name, "engine_us": round(current_us, 3), "legacy_us": round(legacy_us, 3)})
+        print(f"{name:<48} {current_us:>10.2f} {legacy_us:>10.2f} {legacy_us / current_us:>7.2f}x")
+
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(results, file, indent=2)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
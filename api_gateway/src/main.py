@@ -1,29 +1,95 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Any, Dict
 import os
+import time
+import json
+import asyncio
+import hashlib
 import httpx
-import redis
 from contextlib import asynccontextmanager
+from datetime import date
 
 from .models import QueryRequest, QueryResponse, DocumentRequest
 from .services.rag_service import RAGService
 from .services.embedding_service import EmbeddingService
 from .services.guardrails import GuardrailsService
+from .services.llm_client import LLMClient
+from .services.response_cache import SemanticResponseCache
+from .services.query_coalescer import QueryCoalescer
+from .services.database import Database
+from .services.document_registry import DocumentRegistry
+from .services.corpus_centroids import CorpusCentroids
+from .services.redis_client import create_redis_client
+from .services.vector_store import create_vector_store
+from .services.bm25_index import BM25Index
+from .services.ingestion_queue import IngestionQueue, QueueFullError
+from .services.ndjson import iter_ndjson
+from .services.sales_analytics import SalesAnalytics
+from .services.query_log import QueryLogWriter
+from .metrics import (
+    REQUESTS_TOTAL, QUERY_DURATION, REQUESTS_IN_PROGRESS, render_metrics, stage_timer, start_stage_timings
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize services
-    app.state.redis_client = redis.Redis(host="redis", port=6379, decode_responses=True)
-    app.state.rag_service = RAGService()
-    app.state.embedding_service = EmbeddingService()
-    app.state.guardrails_service = GuardrailsService()
+    app.state.redis_client = create_redis_client()
+    app.state.redis_binary_client = create_redis_client(decode_responses=False)
+    app.state.database = Database()
+    app.state.llm_client = LLMClient()
+    corpus_centroids = CorpusCentroids(app.state.redis_client)
+    app.state.vector_store = create_vector_store()
+    app.state.lexical_index = (
+        BM25Index(path=os.getenv("BM25_INDEX_PATH") or None)
+        if os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true" else None
+    )
+    app.state.embedding_service = EmbeddingService(
+        llm_client=app.state.llm_client,
+        redis_client=app.state.redis_binary_client
+    )
+    app.state.rag_service = RAGService(
+        llm_client=app.state.llm_client,
+        embedding_service=app.state.embedding_service,
+        document_registry=DocumentRegistry(app.state.database),
+        corpus_centroids=corpus_centroids,
+        vector_store=app.state.vector_store,
+        lexical_index=app.state.lexical_index
+    )
+    app.state.sales_analytics = SalesAnalytics(app.state.database)
+    app.state.query_log = QueryLogWriter(app.state.database)
+    app.state.query_log.start()
+    app.state.response_cache = SemanticResponseCache(app.state.redis_client)
+    app.state.guardrails_service = GuardrailsService(
+        llm_client=app.state.llm_client,
+        corpus_centroids=corpus_centroids,
+        response_cache=app.state.response_cache
+    )
+    app.state.query_coalescer = QueryCoalescer(app.state.redis_client)
+    app.state.ingestion_queue = IngestionQueue(
+        app.state.redis_client,
+        app.state.rag_service,
+        response_cache=app.state.response_cache
+    )
+    await app.state.ingestion_queue.start()
+    # Backfill documents ingested before the lexical index existed without delaying startup
+    lexical_sync = asyncio.create_task(app.state.rag_service.sync_lexical_index())
     
     yield
     
     # Cleanup
-    app.state.redis_client.close()
+    lexical_sync.cancel()
+    await app.state.ingestion_queue.stop()
+    await app.state.query_log.stop()
+    await app.state.llm_client.close()
+    app.state.vector_store.close()
+    if app.state.lexical_index:
+        app.state.lexical_index.close()
+    app.state.database.close()
+    await app.state.redis_client.aclose(close_connection_pool=True)
+    await app.state.redis_binary_client.aclose(close_connection_pool=True)
 
 app = FastAPI(
     title="RAG Commercial Analytics API",
@@ -40,6 +106,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Start the vector search alongside the relevance check instead of after it
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+
+def _retrieval_options(request: QueryRequest) -> Dict[str, Any]:
+    """max_results and context filters, pushed down into the vector and lexical searches.
+
+    max_results is None unless the request set it, so retrieval and MMR keep their configured sizes.
+    """
+    max_results = request.max_results if "max_results" in request.model_fields_set else None
+    return {"max_results": max_results, "where": request.filters.to_where()}
+
+def _cache_scope(retrieval_options: Dict[str, Any]) -> str:
+    """Response cache partition, so answers built from filtered retrieval are not shared"""
+    if retrieval_options["where"] is None and retrieval_options["max_results"] is None:
+        return ""
+    payload = json.dumps(retrieval_options, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+async def _relevance_gated_retrieval(
+    query: str,
+    query_embedding: List[float],
+    rag_service: RAGService,
+    guardrails_service: GuardrailsService,
+    retrieval_options: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Check relevance and return the retrieval results, raising 400 for irrelevant queries"""
+    retrieval = None
+    if SPECULATIVE_RETRIEVAL:
+        retrieval = asyncio.create_task(rag_service.retrieve(query, query_embedding, **retrieval_options))
+        # A discarded retrieval may still fail; consume its outcome so it is not logged as unhandled
+        retrieval.add_done_callback(lambda task: task.cancelled() or task.exception())
+    
+    try:
+        with stage_timer("relevance_check"):
+            is_relevant = await guardrails_service.check_relevance(query, query_embedding=query_embedding)
+    except BaseException:
+        if retrieval:
+            retrieval.cancel()
+        raise
+    
+    if not is_relevant:
+        if retrieval:
+            retrieval.cancel()
+        raise HTTPException(status_code=400, detail="Query not relevant to commercial analytics")
+    
+    return await retrieval if retrieval else await rag_service.retrieve(query, query_embedding, **retrieval_options)
+
+def _log_query(
+    request: QueryRequest,
+    elapsed_seconds: float,
+    status: str,
+    error_message: Optional[str],
+    stage_timings: Dict[str, float]
+):
+    """Queue the outcome for query_logs; the write happens off the request path"""
+    query_log: Optional[QueryLogWriter] = getattr(app.state, "query_log", None)
+    if query_log is None:
+        return
+    user_id = (request.context or {}).get("user_id")
+    query_log.record(
+        request.query,
+        elapsed_seconds * 1000,
+        success=status == "success",
+        error_message=error_message,
+        user_id=str(user_id)[:50] if user_id is not None else None,
+        stage_timings=stage_timings
+    )
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "RAG Commercial Analytics API"}
@@ -48,60 +182,327 @@ async def health_check():
 async def process_query(
     request: QueryRequest,
     rag_service: RAGService = Depends(lambda: app.state.rag_service),
-    guardrails_service: GuardrailsService = Depends(lambda: app.state.guardrails_service)
+    embedding_service: EmbeddingService = Depends(lambda: app.state.embedding_service),
+    guardrails_service: GuardrailsService = Depends(lambda: app.state.guardrails_service),
+    response_cache: SemanticResponseCache = Depends(lambda: app.state.response_cache),
+    query_coalescer: QueryCoalescer = Depends(lambda: app.state.query_coalescer)
 ):
+    started = time.perf_counter()
+    status = "error"
+    error_message = None
+    timings = start_stage_timings()
+    REQUESTS_IN_PROGRESS.labels(endpoint="/query").inc()
     try:
         # Apply input guardrails
-        sanitized_query = await guardrails_service.sanitize_input(request.query)
+        with stage_timer("sanitize"):
+            sanitized_query = await guardrails_service.sanitize_input(request.query)
         
-        # Check query relevance
-        is_relevant = await guardrails_service.check_relevance(sanitized_query)
-        if not is_relevant:
-            raise HTTPException(status_code=400, detail="Query not relevant to commercial analytics")
+        # Serve paraphrases of recently answered queries from the cache
+        with stage_timer("query_embedding"):
+            query_embedding = await embedding_service.generate_single_embedding(sanitized_query)
+        retrieval_options = _retrieval_options(request)
+        cache_scope = _cache_scope(retrieval_options)
+        with stage_timer("cache_lookup"):
+            cached = await response_cache.lookup(query_embedding, scope=cache_scope)
+        if cached:
+            status = "success"
+            return QueryResponse(query=sanitized_query, **cached)
         
-        # Process RAG query
-        response = await rag_service.process_query(sanitized_query)
+        async def answer() -> Dict[str, Any]:
+            # Check query relevance and retrieve context
+            retrieval_results = await _relevance_gated_retrieval(
+                sanitized_query, query_embedding, rag_service, guardrails_service, retrieval_options
+            )
+            
+            # Process RAG query
+            response = await rag_service.process_query(
+                sanitized_query, query_embedding=query_embedding, retrieval_results=retrieval_results,
+                max_results=retrieval_options["max_results"]
+            )
+            
+            # Apply output guardrails
+            with stage_timer("output_validation"):
+                validated_response = await guardrails_service.validate_output(response)
+            
+            result = {
+                "response": validated_response,
+                "sources": response.get("sources", []),
+                "confidence": response.get("confidence", 0.0)
+            }
+            await response_cache.store(
+                query_embedding, sanitized_query, result,
+                compute_ms=(time.perf_counter() - started) * 1000,
+                scope=cache_scope
+            )
+            return result
         
-        # Apply output guardrails
-        validated_response = await guardrails_service.validate_output(response)
+        # Identical queries already in flight share that run instead of starting their own
+        result = await query_coalescer.run(query_coalescer.key(sanitized_query, retrieval_options), answer)
         
-        return QueryResponse(
-            query=sanitized_query,
-            response=validated_response,
-            sources=response.get("sources", []),
-            confidence=response.get("confidence", 0.0)
-        )
+        status = "success"
+        return QueryResponse(query=sanitized_query, **result)
     
+    except HTTPException as e:
+        if e.status_code == 400:
+            status = "rejected"
+        error_message = str(e.detail)
+        raise
     except Exception as e:
+        error_message = str(e)
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        elapsed = time.perf_counter() - started
+        REQUESTS_IN_PROGRESS.labels(endpoint="/query").dec()
+        REQUESTS_TOTAL.labels(endpoint="/query", status=status).inc()
+        QUERY_DURATION.observe(elapsed)
+        _log_query(request, elapsed, status, error_message, timings)
 
-@app.post("/documents/ingest")
+def _sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/query/stream")
+async def stream_query(
+    request: QueryRequest,
+    rag_service: RAGService = Depends(lambda: app.state.rag_service),
+    embedding_service: EmbeddingService = Depends(lambda: app.state.embedding_service),
+    guardrails_service: GuardrailsService = Depends(lambda: app.state.guardrails_service),
+    response_cache: SemanticResponseCache = Depends(lambda: app.state.response_cache)
+):
+    """Server-sent events variant of /query: sources, answer tokens, then a complete event"""
+    started = time.perf_counter()
+    timings = start_stage_timings()
+    try:
+        # Failures before the first event are still reported as HTTP errors
+        with stage_timer("sanitize"):
+            sanitized_query = await guardrails_service.sanitize_input(request.query)
+        
+        with stage_timer("query_embedding"):
+            query_embedding = await embedding_service.generate_single_embedding(sanitized_query)
+        retrieval_options = _retrieval_options(request)
+        cache_scope = _cache_scope(retrieval_options)
+        with stage_timer("cache_lookup"):
+            cached = await response_cache.lookup(query_embedding, scope=cache_scope)
+        
+        retrieval_results = None
+        if not cached:
+            retrieval_results = await _relevance_gated_retrieval(
+                sanitized_query, query_embedding, rag_service, guardrails_service, retrieval_options
+            )
+    
+    except HTTPException as e:
+        status = "rejected" if e.status_code == 400 else "error"
+        REQUESTS_TOTAL.labels(endpoint="/query/stream", status=status).inc()
+        _log_query(request, time.perf_counter() - started, status, str(e.detail), timings)
+        raise
+    except Exception as e:
+        REQUESTS_TOTAL.labels(endpoint="/query/stream", status="error").inc()
+        _log_query(request, time.perf_counter() - started, "error", str(e), timings)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # A client that disconnects mid-stream leaves the outcome at its default
+    outcome = {"status": "error", "error": "Stream interrupted"}
+    
+    async def event_stream():
+        REQUESTS_IN_PROGRESS.labels(endpoint="/query/stream").inc()
+        try:
+            async for event in _stream_events():
+                yield event
+        finally:
+            REQUESTS_IN_PROGRESS.labels(endpoint="/query/stream").dec()
+            _log_query(request, time.perf_counter() - started, outcome["status"], outcome["error"], timings)
+    
+    async def _stream_events():
+        if cached:
+            outcome.update(status="success", error=None)
+            REQUESTS_TOTAL.labels(endpoint="/query/stream", status="success").inc()
+            yield _sse_event("sources", cached["sources"])
+            yield _sse_event("token", cached["response"])
+            yield _sse_event("complete", {
+                "confidence": cached["confidence"],
+                "validation_status": "valid",
+                "cached": True
+            })
+            return
+        
+        sources: List[Dict[str, Any]] = []
+        chunks: List[str] = []
+        try:
+            async for event in rag_service.stream_query(
+                sanitized_query, query_embedding=query_embedding, retrieval_results=retrieval_results,
+                max_results=retrieval_options["max_results"]
+            ):
+                if event["event"] == "sources":
+                    sources = event["data"]
+                elif event["event"] == "token":
+                    chunks.append(event["data"])
+                elif event["event"] == "complete":
+                    # Tokens are already on the wire, so the verdict travels in the final event
+                    content = "".join(chunks)
+                    try:
+                        with stage_timer("output_validation"):
+                            validated_response = await guardrails_service.validate_output({"response": content})
+                    except ValueError as e:
+                        event["data"].update({"validation_status": "rejected", "detail": str(e)})
+                    else:
+                        if validated_response == content:
+                            event["data"]["validation_status"] = "valid"
+                            await response_cache.store(
+                                query_embedding, sanitized_query,
+                                {"response": content, "sources": sources, "confidence": event["data"]["confidence"]},
+                                compute_ms=(time.perf_counter() - started) * 1000,
+                                scope=cache_scope
+                            )
+                        else:
+                            event["data"].update({"validation_status": "replaced", "response": validated_response})
+                
+                yield _sse_event(event["event"], event["data"])
+            
+            outcome.update(status="success", error=None)
+            REQUESTS_TOTAL.labels(endpoint="/query/stream", status="success").inc()
+        
+        except Exception as e:
+            outcome["error"] = str(e)
+            REQUESTS_TOTAL.labels(endpoint="/query/stream", status="error").inc()
+            yield _sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/documents/ingest", status_code=202)
 async def ingest_documents(
     request: DocumentRequest,
-    rag_service: RAGService = Depends(lambda: app.state.rag_service)
+    ingestion_queue: IngestionQueue = Depends(lambda: app.state.ingestion_queue)
 ):
+    """Queue the documents for background ingestion; poll /documents/jobs/{job_id} for the outcome"""
     try:
-        result = await rag_service.ingest_documents(request.documents)
-        return {"status": "success", "processed": result}
+        return await ingestion_queue.submit(request.documents, prune_missing=request.prune_missing)
     
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/metrics")
-async def get_metrics():
-    redis_client = app.state.redis_client
+@app.post("/documents/ingest/stream")
+async def ingest_document_stream(
+    request: Request,
+    prune_missing: bool = False,
+    rag_service: RAGService = Depends(lambda: app.state.rag_service),
+    response_cache: SemanticResponseCache = Depends(lambda: app.state.response_cache)
+):
+    """Ingest a newline-delimited JSON body, one document per line, while it is being uploaded"""
+    parse_errors = []
+    try:
+        result = await rag_service.ingest_stream(
+            iter_ndjson(
+                request.stream(),
+                parse_errors,
+                max_line_bytes=int(os.getenv("INGEST_STREAM_MAX_LINE_BYTES", str(10 * 1024 * 1024)))
+            ),
+            prune_missing=prune_missing,
+            read_errors=parse_errors
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if result["processed"] or result["deleted"]:
+        await response_cache.invalidate()
     
+    if not result["errors"]:
+        status = "success"
+    elif result["processed"]:
+        status = "partial_success"
+    else:
+        status = "failed"
+    
+    return {"status": status, **result}
+
+@app.get("/documents/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    ingestion_queue: IngestionQueue = Depends(lambda: app.state.ingestion_queue)
+):
+    """Status, progress counters and per-batch errors of an ingestion job"""
     try:
-        total_queries = redis_client.get("total_queries") or 0
-        successful_queries = redis_client.get("successful_queries") or 0
-        
-        return {
-            "total_queries": int(total_queries),
-            "successful_queries": int(successful_queries),
-            "success_rate": float(successful_queries) / max(int(total_queries), 1)
-        }
+        job = await ingestion_queue.get_job(job_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _check_period(date_from: date, date_to: date):
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+
+@app.get("/analytics/agent-performance")
+async def get_agent_performance(
+    date_from: date,
+    date_to: date,
+    agent_id: Optional[List[str]] = Query(None),
+    sales_analytics: SalesAnalytics = Depends(lambda: app.state.sales_analytics)
+):
+    """Per-agent sales totals over a period, read from the daily rollups"""
+    _check_period(date_from, date_to)
+    try:
+        agents = await sales_analytics.agent_performance(date_from, date_to, agent_ids=agent_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"date_from": date_from, "date_to": date_to, "agents": agents}
+
+@app.get("/analytics/commercial-metrics")
+async def get_commercial_metrics(
+    date_from: date,
+    date_to: date,
+    agent_id: Optional[List[str]] = Query(None),
+    metric_type: Optional[List[str]] = Query(None),
+    sales_analytics: SalesAnalytics = Depends(lambda: app.state.sales_analytics)
+):
+    """Monthly metrics per agent within a period"""
+    _check_period(date_from, date_to)
+    try:
+        metrics = await sales_analytics.commercial_metrics(
+            date_from, date_to, agent_ids=agent_id, metric_types=metric_type
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"date_from": date_from, "date_to": date_to, "metrics": metrics}
+
+@app.get("/analytics/quota-alerts")
+async def get_quota_alerts(
+    day: Optional[date] = None,
+    threshold: float = Query(50.0, ge=0),
+    sales_analytics: SalesAnalytics = Depends(lambda: app.state.sales_analytics)
+):
+    """Agents below threshold percent of their target on a day (default today)"""
+    day = day or date.today()
+    try:
+        alerts = await sales_analytics.quota_alerts(day, threshold)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"day": day, "threshold": threshold, "alerts": alerts}
+
+@app.get("/analytics/rollup-status")
+async def get_rollup_status(
+    sales_analytics: SalesAnalytics = Depends(lambda: app.state.sales_analytics)
+):
+    """How current the rollups are"""
+    try:
+        status = await sales_analytics.rollup_status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail="Rollups have not been refreshed yet")
+    return status
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus exposition of request, stage and upstream metrics"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,136 @@
+"""
+Prometheus metrics for the API Gateway
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from prometheus_client import (
+    Counter, Histogram, Gauge, CollectorRegistry, REGISTRY,
+    generate_latest, CONTENT_TYPE_LATEST
+)
+from prometheus_client import multiprocess
+
+# Stage latencies range from sub-millisecond regex passes to multi-second completions
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUESTS_TOTAL = Counter(
+    "api_requests_total",
+    "API requests by endpoint and outcome",
+    ["endpoint", "status"]
+)
+
+QUERY_DURATION = Histogram(
+    "api_query_duration_seconds",
+    "End-to-end latency of query requests",
+    buckets=STAGE_BUCKETS
+)
+
+STAGE_DURATION = Histogram(
+    "api_query_stage_duration_seconds",
+    "Latency of each query pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+REQUESTS_IN_PROGRESS = Gauge(
+    "api_requests_in_progress",
+    "Requests currently being served",
+    ["endpoint"],
+    multiprocess_mode="livesum"
+)
+
+UPSTREAM_ERRORS = Counter(
+    "api_upstream_errors_total",
+    "Failed calls to upstream dependencies",
+    ["dependency"]
+)
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "api_response_cache_requests_total",
+    "Semantic response cache lookups by result",
+    ["result"]
+)
+
+RESPONSE_CACHE_LATENCY_SAVED = Counter(
+    "api_response_cache_latency_saved_seconds_total",
+    "Pipeline time avoided by serving cached responses"
+)
+
+RELEVANCE_DECISIONS = Counter(
+    "api_relevance_decisions_total",
+    "Relevance verdicts by the classifier tier that decided them",
+    ["tier"]
+)
+
+CONTEXT_TOKENS = Histogram(
+    "api_context_tokens",
+    "Prompt tokens of the packed retrieval context",
+    buckets=(100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 12000)
+)
+
+CONTEXT_TOKENS_SAVED = Counter(
+    "api_context_tokens_saved_total",
+    "Prompt tokens left out of the context, by reason (duplicate or budget)",
+    ["reason"]
+)
+
+INGEST_JOBS = Counter(
+    "api_ingest_jobs_total",
+    "Ingestion jobs by outcome (queued, rejected, success, partial_success, failed)",
+    ["status"]
+)
+
+INGEST_QUEUE_DEPTH = Gauge(
+    "api_ingest_queue_depth",
+    "Ingestion jobs waiting in the queue",
+    multiprocess_mode="mostrecent"
+)
+
+QUERY_LOG_ENTRIES = Counter(
+    "api_query_log_entries_total",
+    "Query log entries by fate (written, queue_full, write_failed)",
+    ["result"]
+)
+
+QUERY_COALESCED = Counter(
+    "api_query_coalesced_total",
+    "Queries answered by an identical in-flight query (local: same worker, remote: another worker)",
+    ["scope"]
+)
+
+# Stage timings of the request being served, in milliseconds, for query_logs.
+# Tasks spawned by the request (speculative retrieval) share the same dict.
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+
+def start_stage_timings() -> Dict[str, float]:
+    """Collect the stage timings of the current request into the returned dict"""
+    timings: Dict[str, float] = {}
+    _stage_timings.set(timings)
+    return timings
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_DURATION.labels(stage=stage).observe(seconds)
+    timings = _stage_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 3)
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a pipeline stage into api_query_stage_duration_seconds and the request's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+def render_metrics():
+    """Render the exposition payload, aggregating workers in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,11 +1,70 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, date
+
+def date_key(value: Any) -> Optional[int]:
+    """Numeric YYYYMMDD form of a document date, used for range filters"""
+    if isinstance(value, (date, datetime)):
+        return int(value.strftime("%Y%m%d"))
+    try:
+        return int(datetime.fromisoformat(str(value)[:10]).strftime("%Y%m%d"))
+    except ValueError:
+        return None
+
+class QueryFilters(BaseModel):
+    """Structured retrieval filters read from QueryRequest.context; other context keys are ignored"""
+    date_from: Optional[date] = Field(None, description="Only documents dated on or after this day")
+    date_to: Optional[date] = Field(None, description="Only documents dated on or before this day")
+    document_type: Optional[List[str]] = Field(None, description="Document types to search")
+    source: Optional[List[str]] = Field(None, description="Document sources to search")
+
+    @field_validator("document_type", "source", mode="before")
+    @classmethod
+    def _as_list(cls, value: Any) -> Any:
+        return [value] if isinstance(value, str) else value
+
+    @model_validator(mode="after")
+    def _check_range(self) -> "QueryFilters":
+        if self.date_from and self.date_to and self.date_from > self.date_to:
+            raise ValueError("date_from must not be after date_to")
+        for field in ("document_type", "source"):
+            if getattr(self, field) == []:
+                raise ValueError(f"{field} must not be empty")
+        return self
+
+    def to_where(self) -> Optional[Dict[str, Any]]:
+        """Metadata where clause understood by every vector store backend"""
+        clauses: List[Dict[str, Any]] = []
+        if self.document_type:
+            clauses.append({"type": {"$in": self.document_type}})
+        if self.source:
+            clauses.append({"source": {"$in": self.source}})
+        if self.date_from:
+            clauses.append({"date_key": {"$gte": date_key(self.date_from)}})
+        if self.date_to:
+            clauses.append({"date_key": {"$lte": date_key(self.date_to)}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
 class QueryRequest(BaseModel):
     query: str = Field(..., description="The user query for commercial analytics")
-    context: Optional[Dict[str, Any]] = Field(None, description="Additional context for the query")
-    max_results: Optional[int] = Field(10, description="Maximum number of results to return")
+    context: Optional[Dict[str, Any]] = Field(
+        None, description="Additional context for the query; date_from, date_to, document_type and source filter retrieval"
+    )
+    max_results: Optional[int] = Field(10, ge=1, le=50, description="Maximum number of results to return")
+
+    @field_validator("context")
+    @classmethod
+    def _validate_filters(cls, context: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if context:
+            QueryFilters.model_validate(context)
+        return context
+
+    @property
+    def filters(self) -> QueryFilters:
+        return QueryFilters.model_validate(self.context or {})
 
 class QueryResponse(BaseModel):
     query: str
@@ -17,6 +76,7 @@ class QueryResponse(BaseModel):
 class DocumentRequest(BaseModel):
     documents: List[Dict[str, Any]] = Field(..., description="List of documents to ingest")
     collection_name: Optional[str] = Field("commercial_data", description="Vector collection name")
+    prune_missing: bool = Field(False, description="Treat the upload as a full export of its sources and delete documents missing from it")
 
 class DocumentResponse(BaseModel):
     status: str
@@ -0,0 +1,189 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+from .vector_store import matches_where
+
+logger = logging.getLogger(__name__)
+
+# Identifiers such as AG-042, SKU_1234 or EU-WEST stay whole tokens
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SEPARATOR_PATTERN = re.compile(r"[-_./]")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; compound identifiers also yield their parts"""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if _SEPARATOR_PATTERN.search(token):
+            tokens.extend(part for part in _SEPARATOR_PATTERN.split(token) if part)
+    return tokens
+
+class BM25Index:
+    """Incrementally maintained in-process inverted index with Okapi BM25 scoring.
+
+    Complements dense retrieval on exact terms (agent ids, SKUs, region
+    codes) that embeddings blur. Documents are added and removed as they
+    are ingested or pruned. With a path the index is persisted as JSON and
+    other workers pick up a newer file within refresh_seconds.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75, refresh_seconds: float = 30.0):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+        self._dirty = False
+        self._loaded_mtime = 0.0
+        self._checked_at = 0.0
+
+        if path:
+            self._load()
+
+    def count(self) -> int:
+        return len(self._lengths)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._lengths)
+
+    def _remove(self, doc_id: str):
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+
+        self._total_length -= length
+        self._metadatas.pop(doc_id, None)
+        for term in self._doc_terms.pop(doc_id, []):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def _add(self, doc_id: str, frequencies: Dict[str, int], metadata: Dict[str, Any]):
+        length = sum(frequencies.values())
+        self._lengths[doc_id] = length
+        self._doc_terms[doc_id] = list(frequencies)
+        self._metadatas[doc_id] = metadata
+        self._total_length += length
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None):
+        """Index documents, replacing any previous version with the same id"""
+        frequencies = [Counter(tokenize(document or "")) for document in documents]
+        with self._lock:
+            for i, doc_id in enumerate(ids):
+                self._remove(doc_id)
+                self._add(doc_id, frequencies[i], dict(metadatas[i] or {}) if metadatas else {})
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            self._dirty = True
+
+    def search(self, query: str, n_results: int = 10, where: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top documents by BM25 score as (id, score), best first, among those matching where"""
+        self._maybe_reload()
+        terms = set(tokenize(query))
+
+        with self._lock:
+            total_docs = len(self._lengths)
+            if not terms or not total_docs:
+                return []
+
+            average_length = self._total_length / total_docs
+            scores: Dict[str, float] = {}
+            # Each posting's document is tested against the filter once, before scoring
+            allowed: Dict[str, bool] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if where:
+                        if doc_id not in allowed:
+                            allowed[doc_id] = matches_where(self._metadatas.get(doc_id, {}), where)
+                        if not allowed[doc_id]:
+                            continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def _maybe_reload(self):
+        if not self.path or self._dirty or time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+
+        self._checked_at = time.monotonic()
+        try:
+            if os.path.getmtime(self.path) > self._loaded_mtime:
+                self._load()
+        except OSError:
+            pass
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+
+        with self._lock:
+            self._postings, self._lengths, self._doc_terms, self._metadatas = {}, {}, {}, {}
+            self._total_length = 0
+            for doc_id, document in stored["documents"].items():
+                self._add(doc_id, document["terms"], document.get("metadata", {}))
+            self._loaded_mtime = os.path.getmtime(self.path)
+            self._dirty = False
+        logger.info(f"Loaded lexical index with {len(self._lengths)} documents from {self.path}")
+
+    def persist(self):
+        if not self.path or not self._dirty:
+            return
+
+        with self._lock:
+            documents = {
+                doc_id: {
+                    "terms": {term: self._postings[term][doc_id] for term in terms},
+                    "metadata": self._metadatas.get(doc_id, {})
+                }
+                for doc_id, terms in self._doc_terms.items()
+            }
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"documents": documents}, f)
+            os.replace(self.path + ".tmp", self.path)
+            self._loaded_mtime = os.path.getmtime(self.path)
+            self._dirty = False
+
+    def close(self):
+        self.persist()
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Merge ranked id lists by summing 1 / (k + rank); best first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,44 @@
+import os
+from collections import deque
+from typing import Iterator, Tuple, Optional
+
+from .tokens import iter_token_spans
+
+class Chunker:
+    """Splits text into windows of about chunk_tokens tokens, overlapping by overlap_tokens.
+
+    Windows end on word or punctuation boundaries. The text is scanned
+    lazily and only one window of token offsets is held at a time, so
+    chunks of a multi-megabyte document are produced one by one instead of
+    materializing the whole split.
+    """
+
+    def __init__(self, chunk_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None):
+        self.chunk_tokens = chunk_tokens or int(os.getenv("CHUNK_TOKENS", "500"))
+        self.overlap_tokens = overlap_tokens if overlap_tokens is not None else int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+        if self.overlap_tokens >= self.chunk_tokens:
+            raise ValueError("Chunk overlap must be smaller than the chunk size")
+
+    def iter_chunks(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """Yield (start offset, end offset, chunk text) in document order"""
+        window = deque()
+        window_tokens = 0
+        emitted_end = 0
+
+        for span in iter_token_spans(text):
+            window.append(span)
+            window_tokens += span[2]
+            if window_tokens < self.chunk_tokens:
+                continue
+
+            start, end = window[0][0], window[-1][1]
+            yield start, end, text[start:end]
+            emitted_end = end
+
+            # Keep at most overlap_tokens from the tail as the start of the next chunk
+            while window and window_tokens > self.overlap_tokens:
+                window_tokens -= window.popleft()[2]
+
+        if window and window[-1][1] > emitted_end:
+            start, end = window[0][0], window[-1][1]
+            yield start, end, text[start:end]
@@ -0,0 +1,82 @@
+import os
+import re
+import zlib
+from typing import List, Dict, Any, Optional, Set, Tuple
+import logging
+
+from .tokens import count_tokens
+from ..metrics import CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+class ContextPacker:
+    """Selects retrieved chunks for the prompt within a token budget.
+
+    Chunks are taken in relevance order. A chunk is skipped when its word
+    shingles overlap an already selected chunk beyond duplicate_threshold
+    (Jaccard), e.g. near-identical weekly reports, or when it no longer
+    fits the remaining budget; a smaller chunk further down may still fit.
+    """
+
+    def __init__(
+        self,
+        token_budget: Optional[int] = None,
+        duplicate_threshold: Optional[float] = None,
+        shingle_size: int = 3
+    ):
+        self.token_budget = token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+        self.duplicate_threshold = duplicate_threshold or float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.7"))
+        self.shingle_size = shingle_size
+
+    def _shingles(self, text: str) -> Set[int]:
+        words = _WORD_PATTERN.findall(text.lower())
+        if len(words) < self.shingle_size:
+            return {zlib.crc32(" ".join(words).encode("utf-8"))}
+        return {
+            zlib.crc32(" ".join(words[i:i + self.shingle_size]).encode("utf-8"))
+            for i in range(len(words) - self.shingle_size + 1)
+        }
+
+    @staticmethod
+    def _similarity(a: Set[int], b: Set[int]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    @staticmethod
+    def format_chunk(chunk: Dict[str, Any]) -> str:
+        return f"Source: {chunk['source']}\nContent: {chunk['content']}"
+
+    def pack(self, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Chunks to put in the prompt, and the tokens saved by reason"""
+        selected: List[Dict[str, Any]] = []
+        selected_shingles: List[Set[int]] = []
+        saved = {"duplicate": 0, "budget": 0}
+        used = 0
+
+        for chunk in chunks:
+            # Chunks are joined with a newline, counted as one token
+            tokens = count_tokens(self.format_chunk(chunk)) + 1
+            shingles = self._shingles(chunk["content"])
+
+            if any(self._similarity(shingles, other) >= self.duplicate_threshold for other in selected_shingles):
+                saved["duplicate"] += tokens
+                continue
+            if used + tokens > self.token_budget:
+                saved["budget"] += tokens
+                continue
+
+            selected.append(chunk)
+            selected_shingles.append(shingles)
+            used += tokens
+
+        CONTEXT_TOKENS.observe(used)
+        for reason, tokens in saved.items():
+            if tokens:
+                CONTEXT_TOKENS_SAVED.labels(reason=reason).inc(tokens)
+        if saved["duplicate"] or saved["budget"]:
+            logger.debug(f"Packed {len(selected)}/{len(chunks)} chunks in {used} tokens, saved {saved}")
+
+        return selected, saved
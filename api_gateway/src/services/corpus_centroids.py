@@ -0,0 +1,126 @@
+import time
+import base64
+import numpy as np
+from typing import List, Dict, Optional
+from redis.exceptions import WatchError
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CorpusCentroids:
+    """Per document type centroids of the ingested corpus embeddings.
+
+    Running sums of unit-normalized embeddings are kept in Redis so every
+    worker shares them. Chunks that are replaced or deleted are subtracted
+    again, so the centroids follow the stored corpus. Updates are
+    optimistic transactions on the hash, retried when a concurrent batch
+    changed it in between.
+    """
+
+    def __init__(self, redis_client, refresh_seconds: float = 60.0, key: str = "rag:relevance:centroids"):
+        self.redis_client = redis_client
+        self.refresh_seconds = refresh_seconds
+        self.key = key
+        self.max_retries = 5
+        self._matrix: Optional[np.ndarray] = None
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _encode(vector: np.ndarray, count: int) -> str:
+        return f"{count}:" + base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+
+    @staticmethod
+    def _decode(value: str):
+        count, data = value.split(":", 1)
+        return np.frombuffer(base64.b64decode(data), dtype=np.float32), int(count)
+
+    async def add(self, embeddings: List[List[float]], doc_types: List[str]):
+        """Fold a batch of document embeddings into the centroids"""
+        await self.update(embeddings, doc_types)
+
+    async def remove(self, embeddings: List[List[float]], doc_types: List[str]):
+        """Take embeddings of replaced or deleted documents back out of the centroids"""
+        await self.update([], [], embeddings, doc_types)
+
+    @staticmethod
+    def _sums(embeddings: List[List[float]], doc_types: List[str]) -> Dict[str, tuple]:
+        if len(embeddings) == 0:
+            return {}
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        sums = {}
+        for doc_type in set(doc_types):
+            rows = vectors[[i for i, t in enumerate(doc_types) if t == doc_type]]
+            sums[doc_type] = (rows.sum(axis=0), len(rows))
+        return sums
+
+    async def update(
+        self,
+        added: List[List[float]],
+        added_types: List[str],
+        removed: Optional[List[List[float]]] = None,
+        removed_types: Optional[List[str]] = None
+    ):
+        """Add and subtract embeddings in one atomic change of the stored sums"""
+        additions = self._sums(added, added_types)
+        removals = self._sums(removed if removed is not None else [], removed_types or [])
+        if not additions and not removals:
+            return
+
+        for _ in range(self.max_retries):
+            try:
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    await pipe.watch(self.key)
+                    stored = await pipe.hgetall(self.key)
+
+                    updates: Dict[str, str] = {}
+                    emptied = []
+                    for doc_type in set(additions) | set(removals):
+                        total, count = None, 0
+                        if doc_type in stored:
+                            total, count = self._decode(stored[doc_type])
+                        for (vector, rows), sign in ((additions.get(doc_type, (None, 0)), 1), (removals.get(doc_type, (None, 0)), -1)):
+                            if vector is None:
+                                continue
+                            if total is None or total.shape != vector.shape:
+                                # A dimension change starts the type over
+                                total, count = np.zeros_like(vector), 0
+                            total, count = total + sign * vector, count + sign * rows
+                        if count <= 0:
+                            emptied.append(doc_type)
+                        else:
+                            updates[doc_type] = self._encode(total, count)
+
+                    pipe.multi()
+                    if updates:
+                        pipe.hset(self.key, mapping=updates)
+                    if emptied:
+                        pipe.hdel(self.key, *emptied)
+                    await pipe.execute()
+                self._loaded_at = 0.0
+                return
+            except WatchError:
+                continue
+        logger.warning(f"Corpus centroids changed concurrently {self.max_retries} times; update dropped")
+
+    async def max_similarity(self, embedding: List[float]) -> Optional[float]:
+        """Highest cosine similarity between the embedding and any centroid"""
+        if time.monotonic() - self._loaded_at > self.refresh_seconds:
+            stored = await self.redis_client.hgetall(self.key)
+            sums = [self._decode(value)[0] for value in stored.values()]
+            if sums:
+                matrix = np.vstack(sums)
+                self._matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            else:
+                self._matrix = None
+            self._loaded_at = time.monotonic()
+
+        if self._matrix is None or not embedding:
+            return None
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        if vector.shape[0] != self._matrix.shape[1]:
+            return None
+
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return float((self._matrix @ vector).max())
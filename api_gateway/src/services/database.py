@@ -0,0 +1,73 @@
+import os
+import asyncio
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import List, Dict, Any, Optional, Sequence
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Database:
+    """Async facade over a psycopg2 connection pool.
+
+    Queries run in worker threads so they never block the event loop.
+    Connections are opened lazily, so the gateway still starts when
+    Postgres is unavailable. The pool raises instead of waiting once all
+    its connections are out, so callers queue on a semaphore of the same
+    size before taking one.
+    """
+
+    def __init__(self, max_connections: Optional[int] = None):
+        max_connections = max_connections or int(os.getenv("DB_POOL_MAX", "10"))
+        self._slots = asyncio.Semaphore(max_connections)
+        self.pool = ThreadedConnectionPool(
+            minconn=0,
+            maxconn=max_connections,
+            host=os.getenv('DB_HOST', 'localhost'),
+            port=os.getenv('DB_PORT', 5432),
+            user=os.getenv('POSTGRES_USER', 'postgres'),
+            password=os.getenv('POSTGRES_PASSWORD', 'password'),
+            database=os.getenv('POSTGRES_DB', 'rag_analytics'),
+            connect_timeout=5
+        )
+
+    def _run(self, operation):
+        conn = self.pool.getconn()
+        try:
+            with conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    return operation(cursor)
+        finally:
+            self.pool.putconn(conn, close=conn.closed != 0)
+
+    async def _call(self, operation):
+        async with self._slots:
+            return await asyncio.to_thread(self._run, operation)
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence[Any]] = None) -> List[Dict[str, Any]]:
+        def operation(cursor):
+            cursor.execute(sql, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+        return await self._call(operation)
+
+    async def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> int:
+        def operation(cursor):
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+        return await self._call(operation)
+
+    async def execute_values(self, sql: str, rows: List[Sequence[Any]], template: Optional[str] = None) -> None:
+        """Run a multi-row statement, e.g. INSERT ... VALUES %s, in one round-trip per page"""
+        if not rows:
+            return
+
+        def operation(cursor):
+            execute_values(cursor, sql, rows, template=template, page_size=1000)
+
+        await self._call(operation)
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,77 @@
+import hashlib
+import json
+from typing import List, Dict, Any, Iterable
+import logging
+
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+# Bump when the metadata written to the vector store changes, so existing
+# documents are re-stored on their next ingest (2: numeric date_key,
+# 3: chunked with parent_id and offsets)
+METADATA_VERSION = 3
+
+class DocumentRegistry:
+    """Tracks what is indexed in the vector store through document_metadata"""
+
+    def __init__(self, database: Database):
+        self.database = database
+
+    @staticmethod
+    def content_hash(doc: Dict[str, Any]) -> str:
+        """Hash the fields that end up in the vector store"""
+        payload = json.dumps({
+            "content": doc.get("content", ""),
+            "source": doc.get("source", "unknown"),
+            "date": doc.get("date", ""),
+            "type": doc.get("type", "document"),
+            "metadata_version": METADATA_VERSION
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get_hashes(self, document_ids: List[str]) -> Dict[str, str]:
+        if not document_ids:
+            return {}
+
+        rows = await self.database.fetch_all(
+            "SELECT document_id, content_hash FROM document_metadata WHERE document_id = ANY(%s)",
+            (document_ids,)
+        )
+        return {row["document_id"]: row["content_hash"] for row in rows}
+
+    async def upsert(self, records: List[Dict[str, Any]]) -> None:
+        await self.database.execute_values(
+            """
+            INSERT INTO document_metadata (document_id, source, document_type, title, content_hash)
+            VALUES %s
+            ON CONFLICT (document_id) DO UPDATE SET
+                source = EXCLUDED.source,
+                document_type = EXCLUDED.document_type,
+                title = EXCLUDED.title,
+                content_hash = EXCLUDED.content_hash,
+                last_updated = CURRENT_TIMESTAMP
+            """,
+            [
+                (r["document_id"], r["source"], r["document_type"], r.get("title"), r["content_hash"])
+                for r in records
+            ]
+        )
+
+    async def find_missing(self, sources: Iterable[str], present_ids: Iterable[str]) -> List[str]:
+        """Documents registered for these sources that are absent from a full export"""
+        rows = await self.database.fetch_all(
+            """
+            SELECT document_id FROM document_metadata
+            WHERE source = ANY(%s) AND NOT (document_id = ANY(%s))
+            """,
+            (list(sources), list(present_ids))
+        )
+        return [row["document_id"] for row in rows]
+
+    async def delete(self, document_ids: List[str]) -> None:
+        if document_ids:
+            await self.database.execute(
+                "DELETE FROM document_metadata WHERE document_id = ANY(%s)",
+                (document_ids,)
+            )
@@ -1,32 +1,105 @@
 import os
-from openai import OpenAI
-from typing import List, Dict, Any
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
 import logging
 
+from .llm_client import LLMClient
+from ..metrics import UPSTREAM_ERRORS
+
 logger = logging.getLogger(__name__)
 
 class EmbeddingService:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, llm_client: Optional[LLMClient] = None, redis_client=None):
+        self.llm_client = llm_client or LLMClient()
         self.embedding_model = "text-embedding-3-large"
-    
+        # Shortened output (e.g. 256, 512, 1024); unset keeps the native 3072
+        self.dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+        # Shared cache tier; needs a client without decode_responses to hold raw float32 bytes
+        self.redis_client = redis_client
+        self.cache_ttl = int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+        self._local_cache: OrderedDict = OrderedDict()
+        self._local_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", "2000"))
+
+    def _cache_key(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"emb:{self.embedding_model}:{self.get_embedding_dimension()}:{digest}"
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._local_cache[key] = vector
+        self._local_cache.move_to_end(key)
+        if len(self._local_cache) > self._local_cache_size:
+            self._local_cache.popitem(last=False)
+
     async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, fetching only cache misses from the API"""
         try:
-            response = self.openai_client.embeddings.create(
-                model=self.embedding_model,
-                input=texts
-            )
-            
-            return [embedding.embedding for embedding in response.data]
-            
+            keys = [self._cache_key(text) for text in texts]
+            found: Dict[str, np.ndarray] = {}
+
+            for key in set(keys):
+                if key in self._local_cache:
+                    self._local_cache.move_to_end(key)
+                    found[key] = self._local_cache[key]
+
+            missing = list(dict.fromkeys(key for key in keys if key not in found))
+            if missing and self.redis_client is not None:
+                for key, vector in zip(missing, await self._redis_get(missing)):
+                    if vector is not None:
+                        found[key] = vector
+                        self._remember(key, vector)
+
+            # Each distinct uncached text is sent once, in first-seen order
+            pending = {key: text for key, text in zip(keys, texts) if key not in found}
+            if pending:
+                params = {"dimensions": self.dimensions} if self.dimensions else {}
+                embeddings = await self.llm_client.create_embeddings(
+                    list(pending.values()), model=self.embedding_model, **params
+                )
+                fetched = {
+                    key: np.asarray(embedding, dtype=np.float32)
+                    for key, embedding in zip(pending.keys(), embeddings)
+                }
+                for key, vector in fetched.items():
+                    self._remember(key, vector)
+                found.update(fetched)
+                await self._redis_set(fetched)
+
+            return [found[key].tolist() for key in keys]
+
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
-    
+
+    async def _redis_get(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        try:
+            values = await self.redis_client.mget(keys)
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return [None] * len(keys)
+
+        return [np.frombuffer(value, dtype=np.float32) if value else None for value in values]
+
+    async def _redis_set(self, vectors: Dict[str, np.ndarray]):
+        if self.redis_client is None or not vectors:
+            return
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, vector in vectors.items():
+            pipe.set(key, vector.tobytes(), ex=self.cache_ttl)
+
+        try:
+            await pipe.execute()
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.warning(f"Embedding cache write failed: {e}")
+
     async def generate_single_embedding(self, text: str) -> List[float]:
         embeddings = await self.generate_embeddings([text])
         return embeddings[0] if embeddings else []
-    
+
     def get_embedding_dimension(self) -> int:
-        # text-embedding-3-large has 3072 dimensions
-        return 3072
\ No newline at end of file
+        # text-embedding-3-large has 3072 dimensions unless shortened
+        return self.dimensions or 3072
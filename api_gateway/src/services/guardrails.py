@@ -1,49 +1,133 @@
 import os
 import re
-from openai import OpenAI
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 import logging
 
+from .llm_client import LLMClient
+from .corpus_centroids import CorpusCentroids
+from .rule_engine import RuleSet
+from .response_cache import SemanticResponseCache
+from ..metrics import RELEVANCE_DECISIONS, UPSTREAM_ERRORS
+
 logger = logging.getLogger(__name__)
 
 class GuardrailsService:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        corpus_centroids: Optional[CorpusCentroids] = None,
+        response_cache: Optional[SemanticResponseCache] = None
+    ):
+        self.llm_client = llm_client or LLMClient()
+        self.corpus_centroids = corpus_centroids
+        # Its ingest epoch tells when remembered verdicts predate the current corpus
+        self.response_cache = response_cache
         self.commercial_terms = [
             'sales', 'revenue', 'performance', 'agent', 'target', 'quota',
             'commission', 'pipeline', 'conversion', 'roi', 'margin', 'profit'
         ]
+        # Whole words only, plurals included: "roi" must not match "roiling"
+        self._commercial_term_pattern = re.compile(
+            r'\b(?:' + '|'.join(self.commercial_terms) + r')s?\b', re.IGNORECASE
+        )
+        # Centroid similarity above/below these bounds is decided locally
+        self.centroid_relevant_threshold = float(os.getenv("RELEVANCE_CENTROID_RELEVANT", "0.45"))
+        self.centroid_irrelevant_threshold = float(os.getenv("RELEVANCE_CENTROID_IRRELEVANT", "0.15"))
+        self._seen_queries: OrderedDict = OrderedDict()
+        self._seen_queries_epoch: Optional[str] = None
+        self._seen_queries_max = int(os.getenv("RELEVANCE_SEEN_QUERIES_MAX", "10000"))
+        
+        # Rule sets are compiled once; each is applied in a single pass over the text
+        self.sanitize_rules = RuleSet([
+            # Script tags and javascript
+            ('script_tag', r'(?s:<script[^>]*>.*?</script>)'),
+            ('javascript_uri', r'javascript:'),
+            # SQL injection patterns
+            ('sql_keyword', r'(union|select|insert|update|delete|drop|create|alter)\s+'),
+            ('sql_tautology', r"(\'\s*or\s*\'\s*1\s*=\s*1)"),
+            ('sql_comment', r"(\'\s*;\s*--)"),
+            ('sql_concat', r"(\'\s*\|\|\s*\')"),
+        ])
+        self.refusal_rules = RuleSet([
+            ('refusal', r"i don't have|cannot find|don't know"),
+        ])
+        # Overly specific claims only count when the text attributes no source
+        self.claim_rules = RuleSet([
+            ('specific_time', r'\d{1,2}:\d{2}\s*(am|pm)'),
+            ('specific_date', r'\d{4}-\d{2}-\d{2}'),
+            ('exact_number', r'exactly\s+\d+'),
+            ('precise_number', r'precisely\s+\d+'),
+        ])
+        self.attribution_rules = RuleSet([
+            ('source_attribution', r'(source|according to|based on)'),
+        ])
+    
+    def add_sanitize_rule(self, name: str, pattern: str):
+        """Strip an additional pattern from user input"""
+        self.sanitize_rules.add(name, pattern)
+    
+    def add_claim_rule(self, name: str, pattern: str, attribution: bool = False):
+        """Flag an additional unsourced claim pattern, or accept another form of source attribution"""
+        if attribution:
+            self.attribution_rules.add(name, pattern)
+        else:
+            self.claim_rules.add(name, pattern)
     
     async def sanitize_input(self, query: str) -> str:
         """Sanitize user input to prevent security issues"""
         if not query:
             raise ValueError("Query cannot be empty")
         
-        # Remove script tags and javascript
-        sanitized = re.sub(r'<script[^>]*>.*?</script>', '', query, flags=re.IGNORECASE | re.DOTALL)
-        sanitized = re.sub(r'javascript:', '', sanitized, flags=re.IGNORECASE)
-        
-        # Remove SQL injection patterns
-        sql_patterns = [
-            r'(union|select|insert|update|delete|drop|create|alter)\s+',
-            r'(\'\s*or\s*\'\s*1\s*=\s*1)',
-            r'(\'\s*;\s*--)',
-            r'(\'\s*\|\|\s*\')'
-        ]
-        
-        for pattern in sql_patterns:
-            sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
-        
-        # Limit length
-        if len(sanitized) > 1000:
+        # Limit length before any regex work; sanitizing only ever shortens the query
+        if len(query) > 1000:
             raise ValueError("Query too long - potential security issue")
         
+        # Remove script tags, javascript and SQL injection patterns
+        # Repeat until stable so a removal cannot splice a new match together,
+        # e.g. "java<script></script>script:"; clean input costs a single pass
+        sanitized, removed = self.sanitize_rules.subn(query)
+        while removed:
+            sanitized, removed = self.sanitize_rules.subn(sanitized)
+        
         return sanitized.strip()
     
-    async def check_relevance(self, query: str) -> bool:
-        """Check if query is relevant to commercial analytics"""
+    async def check_relevance(self, query: str, query_embedding: Optional[List[float]] = None) -> bool:
+        """Check if query is relevant to commercial analytics.
+
+        Clear cases are decided locally, cheapest tier first: previously
+        classified queries, commercial vocabulary, then similarity to the
+        corpus centroids. Only ambiguous queries reach the LLM.
+        """
+        normalized = " ".join(query.lower().split())
+        
+        # The request's cache lookup has just refreshed the epoch; an ingest since the verdicts were made retires them
+        if self.response_cache and self.response_cache.epoch != self._seen_queries_epoch:
+            self._seen_queries.clear()
+            self._seen_queries_epoch = self.response_cache.epoch
+        
+        if normalized in self._seen_queries:
+            self._seen_queries.move_to_end(normalized)
+            return self._decide(normalized, self._seen_queries[normalized], "seen")
+        
+        if self._commercial_term_pattern.search(query):
+            return self._decide(normalized, True, "lexical")
+        
+        if self.corpus_centroids and query_embedding:
+            try:
+                similarity = await self.corpus_centroids.max_similarity(query_embedding)
+            except Exception as e:
+                UPSTREAM_ERRORS.labels(dependency="redis").inc()
+                logger.warning(f"Centroid relevance tier unavailable: {e}")
+                similarity = None
+            
+            if similarity is not None and similarity >= self.centroid_relevant_threshold:
+                return self._decide(normalized, True, "centroid")
+            if similarity is not None and similarity <= self.centroid_irrelevant_threshold:
+                return self._decide(normalized, False, "centroid")
+        
         try:
-            response = self.openai_client.chat.completions.create(
+            result = await self.llm_client.chat_completion(
                 model="gpt-4-turbo",
                 messages=[
                     {
@@ -56,17 +140,26 @@ class GuardrailsService:
                     }
                 ],
                 max_tokens=10,
-                temperature=0.0
+                temperature=0.0,
+                timeout=10.0
             )
             
-            result = response.choices[0].message.content.strip()
-            return result == "RELEVANT"
+            return self._decide(normalized, result.strip() == "RELEVANT", "llm")
             
         except Exception as e:
             logger.error(f"Error checking relevance: {e}")
-            # Default to True if service fails
+            # Default to True if service fails, without remembering the verdict
+            RELEVANCE_DECISIONS.labels(tier="fallback").inc()
             return True
     
+    def _decide(self, normalized_query: str, is_relevant: bool, tier: str) -> bool:
+        self._seen_queries[normalized_query] = is_relevant
+        if len(self._seen_queries) > self._seen_queries_max:
+            self._seen_queries.popitem(last=False)
+        
+        RELEVANCE_DECISIONS.labels(tier=tier).inc()
+        return is_relevant
+    
     async def validate_output(self, response: Dict[str, Any]) -> str:
         """Validate LLM output for quality and safety"""
         content = response.get("response", "")
@@ -75,15 +168,11 @@ class GuardrailsService:
             raise ValueError("Empty response generated")
         
         # Check for "I don't know" responses
-        if any(phrase in content.lower() for phrase in ["i don't have", "cannot find", "don't know"]):
+        if self.refusal_rules.search(content):
             return "I don't have sufficient information in the knowledge base to answer this question accurately."
         
         # Check for commercial context
-        has_commercial_context = any(
-            term in content.lower() for term in self.commercial_terms
-        )
-        
-        if not has_commercial_context and len(content) > 100:
+        if len(content) > 100 and not self._commercial_term_pattern.search(content):
             logger.warning("Response may lack commercial context")
         
         # Check for potential hallucinations
@@ -95,20 +184,11 @@ class GuardrailsService:
     def _detect_hallucination(self, content: str) -> bool:
         """Basic hallucination detection"""
         # Check for overly specific claims without source attribution
-        specific_patterns = [
-            r'\d{1,2}:\d{2}\s*(am|pm)',  # Specific times
-            r'\d{4}-\d{2}-\d{2}',        # Specific dates
-            r'exactly\s+\d+',            # Exact numbers
-            r'precisely\s+\d+',          # Precise numbers
-        ]
-        
-        for pattern in specific_patterns:
-            if re.search(pattern, content, re.IGNORECASE):
-                # Check if source is mentioned nearby
-                if not re.search(r'(source|according to|based on)', content, re.IGNORECASE):
-                    return True
+        # Most responses make no such claim, so attribution is rarely scanned
+        if self.claim_rules.search(content) is None:
+            return False
         
-        return False
+        return self.attribution_rules.search(content) is None
     
     def check_data_freshness(self, timestamp: str) -> bool:
         """Check if data is fresh enough for reliable analysis"""
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+from typing import List, Dict, Any, Optional
+import logging
+
+from .rag_service import RAGService
+from .response_cache import SemanticResponseCache
+from ..metrics import INGEST_JOBS, INGEST_QUEUE_DEPTH, UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Moves the next job to the processing list and stamps it in the same step,
+# so a job in the processing list always carries a claim time
+_CLAIM_JOB = """
+local job_id = redis.call('lmove', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+if job_id then
+    redis.call('hset', ARGV[1] .. job_id, 'status', 'running', 'claimed_at', ARGV[2], 'heartbeat', ARGV[2])
+end
+return job_id
+"""
+
+# Requeues a job whose last sign of life is older than the stale limit; checked
+# and moved in one step, so a job another worker has just claimed is left alone
+_REQUEUE_STALE_JOB = """
+local job = redis.call('hmget', KEYS[3], 'heartbeat', 'claimed_at', 'submitted_at')
+local alive = job[1] or job[2] or job[3]
+if alive and tonumber(ARGV[2]) - tonumber(alive) <= tonumber(ARGV[3]) then
+    return 0
+end
+if redis.call('lrem', KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call('hdel', KEYS[3], 'heartbeat', 'claimed_at')
+redis.call('hset', KEYS[3], 'status', 'queued')
+redis.call('lpush', KEYS[2], ARGV[1])
+return 1
+"""
+
+class QueueFullError(Exception):
+    """Raised when a submission would push the queue past its depth limit"""
+
+class IngestionQueue:
+    """Redis-backed queue of ingestion jobs processed by a pool of worker tasks.
+
+    A job is a hash holding status and counters plus a payload key with
+    the documents. Workers move job ids from the queue to a processing
+    list and stamp a heartbeat in one script, so a job whose worker died
+    is still known; jobs whose heartbeat is older than stale_seconds are
+    put back in the queue, at startup and periodically after that.
+    Every gateway process runs its own workers against the same queue.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        rag_service: RAGService,
+        response_cache: Optional[SemanticResponseCache] = None,
+        max_depth: Optional[int] = None,
+        workers: Optional[int] = None,
+        prefix: str = "rag:ingest"
+    ):
+        self.redis_client = redis_client
+        self.rag_service = rag_service
+        self.response_cache = response_cache
+        self.max_depth = max_depth or int(os.getenv("INGEST_QUEUE_MAX_DEPTH", "100"))
+        self.workers = workers or int(os.getenv("INGEST_WORKERS", "2"))
+        self.job_ttl = int(os.getenv("INGEST_JOB_TTL", str(7 * 24 * 3600)))
+        self.stale_seconds = int(os.getenv("INGEST_JOB_STALE_SECONDS", "600"))
+        # Wait between claim attempts on an empty queue
+        self.poll_seconds = 1
+        self.prefix = prefix
+        self.queue_key = f"{prefix}:queue"
+        self.processing_key = f"{prefix}:processing"
+        self._tasks: List[asyncio.Task] = []
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _payload_key(self, job_id: str) -> str:
+        return f"{self.prefix}:payload:{job_id}"
+
+    async def submit(self, documents: List[Dict[str, Any]], prune_missing: bool = False) -> Dict[str, Any]:
+        """Store the documents and queue a job, raising QueueFullError past max_depth"""
+        # Cheap pre-check, so a full queue rejects before the payload is serialized and uploaded
+        if await self.redis_client.llen(self.queue_key) >= self.max_depth:
+            INGEST_JOBS.labels(status="rejected").inc()
+            raise QueueFullError(f"Ingestion queue is full ({self.max_depth} jobs)")
+
+        job_id = uuid.uuid4().hex
+        job_key, payload_key = self._job_key(job_id), self._payload_key(job_id)
+        payload = await asyncio.to_thread(json.dumps, documents, default=str)
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.set(payload_key, payload, ex=self.job_ttl)
+        pipe.hset(job_key, mapping={
+            "job_id": job_id,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "total": len(documents),
+            "prune_missing": int(prune_missing)
+        })
+        pipe.expire(job_key, self.job_ttl)
+        pipe.rpush(self.queue_key, job_id)
+        depth = (await pipe.execute())[-1]
+
+        # Concurrent submissions can all pass the pre-check; checking the length after
+        # the push keeps the limit exact
+        if depth > self.max_depth:
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.lrem(self.queue_key, 1, job_id)
+            pipe.delete(job_key, payload_key)
+            await pipe.execute()
+            INGEST_JOBS.labels(status="rejected").inc()
+            raise QueueFullError(f"Ingestion queue is full ({self.max_depth} jobs)")
+
+        INGEST_JOBS.labels(status="queued").inc()
+        INGEST_QUEUE_DEPTH.set(depth)
+        return {"job_id": job_id, "status": "queued", "queue_depth": depth}
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.redis_client.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+
+        for field in ("total", "processed", "chunks", "skipped", "deleted", "failed_batches"):
+            if field in job:
+                job[field] = int(job[field])
+        for field in ("submitted_at", "claimed_at", "started_at", "finished_at", "heartbeat"):
+            if field in job:
+                job[field] = float(job[field])
+        job["prune_missing"] = job.get("prune_missing") == "1"
+        job["errors"] = json.loads(job.get("errors", "[]"))
+        if job["status"] == "queued":
+            position = await self.redis_client.lpos(self.queue_key, job_id)
+            job["queue_position"] = position + 1 if position is not None else None
+        return job
+
+    async def start(self):
+        await self._recover_stale_jobs()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        # An interrupted job stays in the processing list and is recovered once stale
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _recover_stale_jobs(self):
+        try:
+            for job_id in await self.redis_client.lrange(self.processing_key, 0, -1):
+                requeued = await self.redis_client.eval(
+                    _REQUEUE_STALE_JOB, 3, self.processing_key, self.queue_key, self._job_key(job_id),
+                    job_id, time.time(), self.stale_seconds
+                )
+                if requeued:
+                    logger.warning(f"Requeued stale ingestion job {job_id}")
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.error(f"Failed to recover stale ingestion jobs: {e}")
+
+    async def _worker(self, worker_index: int):
+        recovered_at = time.monotonic()
+        while True:
+            try:
+                # Jobs orphaned by another gateway process are picked up while running, not only at startup
+                if worker_index == 0 and time.monotonic() - recovered_at > self.stale_seconds:
+                    recovered_at = time.monotonic()
+                    await self._recover_stale_jobs()
+
+                job_id = await self.redis_client.eval(
+                    _CLAIM_JOB, 2, self.queue_key, self.processing_key, self._job_key(""), time.time()
+                )
+                if job_id is None:
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                INGEST_QUEUE_DEPTH.set(await self.redis_client.llen(self.queue_key))
+                await self._run_job(job_id)
+                await self.redis_client.lrem(self.processing_key, 1, job_id)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                UPSTREAM_ERRORS.labels(dependency="redis").inc()
+                logger.error(f"Ingestion worker {worker_index} error: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _run_job(self, job_id: str):
+        job_key = self._job_key(job_id)
+        payload = await self.redis_client.get(self._payload_key(job_id))
+        if payload is None:
+            await self.redis_client.hset(job_key, mapping={
+                "status": "failed", "finished_at": time.time(),
+                "errors": json.dumps([{"batch": None, "document_ids": [], "error": "Job payload expired"}])
+            })
+            INGEST_JOBS.labels(status="failed").inc()
+            return
+
+        await self.redis_client.hset(job_key, mapping={"started_at": time.time(), "heartbeat": time.time()})
+        documents = await asyncio.to_thread(json.loads, payload)
+        prune_missing = await self.redis_client.hget(job_key, "prune_missing") == "1"
+
+        async def report(progress: Dict[str, Any]):
+            # A missed progress update must not abort the ingestion itself
+            try:
+                await self.redis_client.hset(job_key, mapping={
+                    "processed": progress["processed"],
+                    "chunks": progress["chunks"],
+                    "failed_batches": progress["failed_batches"],
+                    "heartbeat": time.time()
+                })
+            except Exception as e:
+                UPSTREAM_ERRORS.labels(dependency="redis").inc()
+                logger.warning(f"Failed to report progress of ingestion job {job_id}: {e}")
+
+        try:
+            result = await self.rag_service.ingest_documents(
+                documents, prune_missing=prune_missing, on_progress=report
+            )
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            result = {"processed": 0, "chunks": 0, "skipped": 0, "deleted": 0,
+                      "errors": [{"batch": None, "document_ids": [], "error": str(e)}]}
+
+        if (result["processed"] or result["deleted"]) and self.response_cache:
+            await self.response_cache.invalidate()
+
+        if not result["errors"]:
+            status = "success"
+        elif result["processed"]:
+            status = "partial_success"
+        else:
+            status = "failed"
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(job_key, mapping={
+            "status": status,
+            "finished_at": time.time(),
+            "processed": result["processed"],
+            "chunks": result["chunks"],
+            "skipped": result["skipped"],
+            "deleted": result["deleted"],
+            "failed_batches": len(result["errors"]),
+            "errors": json.dumps(result["errors"], default=str)
+        })
+        pipe.delete(self._payload_key(job_id))
+        await pipe.execute()
+        INGEST_JOBS.labels(status=status).inc()
+        logger.info(f"Ingestion job {job_id} finished: {status}, {result['processed']} documents")
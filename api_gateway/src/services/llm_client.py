@@ -0,0 +1,130 @@
+import os
+import asyncio
+import httpx
+from openai import AsyncOpenAI
+from typing import List, Dict, Any, Optional, AsyncIterator
+import logging
+
+from ..metrics import UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+class LLMClient:
+    """Shared async OpenAI client for chat completions and embeddings.
+
+    A single instance is created in the app lifespan and handed to every
+    service, so all OpenAI traffic goes through one pooled HTTP client and
+    one concurrency cap.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        self.max_concurrency = max_concurrency or int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+        self.timeout = timeout or float(os.getenv("OPENAI_TIMEOUT", "30"))
+        max_connections = max_connections or int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))
+        if max_retries is None:
+            max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=5.0)
+        )
+        self.openai_client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_API_URL") or None,
+            http_client=self.http_client,
+            max_retries=max_retries
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str = "gpt-4-turbo",
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.0,
+        timeout: Optional[float] = None
+    ) -> str:
+        """Run a chat completion and return the message content"""
+        params = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+
+        async with self._semaphore:
+            try:
+                response = await self.openai_client.chat.completions.create(
+                    **params,
+                    timeout=timeout or self.timeout
+                )
+            except Exception:
+                UPSTREAM_ERRORS.labels(dependency="openai").inc()
+                raise
+
+        return response.choices[0].message.content
+
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        model: str = "gpt-4-turbo",
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.0,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Run a chat completion and yield content deltas as they arrive"""
+        params = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            params["max_tokens"] = max_tokens
+
+        # The concurrency slot is held until the stream is fully consumed
+        async with self._semaphore:
+            try:
+                stream = await self.openai_client.chat.completions.create(
+                    **params,
+                    stream=True,
+                    timeout=timeout or self.timeout
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception:
+                UPSTREAM_ERRORS.labels(dependency="openai").inc()
+                raise
+
+    async def create_embeddings(
+        self,
+        texts: List[str],
+        model: str,
+        timeout: Optional[float] = None,
+        dimensions: Optional[int] = None
+    ) -> List[List[float]]:
+        """Embed a batch of texts, preserving input order.
+
+        dimensions shortens text-embedding-3 vectors server-side; it is sent
+        as a raw body field since this client version has no parameter for it.
+        """
+        params = {"extra_body": {"dimensions": dimensions}} if dimensions else {}
+        async with self._semaphore:
+            try:
+                response = await self.openai_client.embeddings.create(
+                    model=model,
+                    input=texts,
+                    timeout=timeout or self.timeout,
+                    **params
+                )
+            except Exception:
+                UPSTREAM_ERRORS.labels(dependency="openai").inc()
+                raise
+
+        return [embedding.embedding for embedding in sorted(response.data, key=lambda e: e.index)]
+
+    async def close(self):
+        await self.http_client.aclose()
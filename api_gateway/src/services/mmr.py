@@ -0,0 +1,42 @@
+import numpy as np
+from typing import List
+
+def maximal_marginal_relevance(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5
+) -> List[int]:
+    """Indices of up to k candidates in selection order, trading relevance against redundancy.
+
+    Each step picks the candidate maximizing
+    lambda_mult * relevance - (1 - lambda_mult) * (highest cosine similarity
+    to a candidate already picked). The pairwise similarities come from one
+    matrix product and every step updates all remaining candidates at once,
+    so the cost is a single (n, n) product plus k vector passes. lambda_mult
+    1.0 keeps the relevance order; lower values favour diversity.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    count = min(k, len(relevance))
+    if count <= 0:
+        return []
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = similarity[first].copy()
+    available = np.ones(len(relevance), dtype=bool)
+    available[first] = False
+
+    while len(selected) < count:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, similarity[pick], out=redundancy)
+
+    return selected
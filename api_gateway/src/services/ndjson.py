@@ -0,0 +1,70 @@
+import json
+from typing import List, Dict, Any, AsyncIterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+async def iter_ndjson(
+    chunks: AsyncIterator[bytes],
+    errors: List[Dict[str, Any]],
+    max_line_bytes: int = 10 * 1024 * 1024
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield one JSON object per line of a streamed body as the bytes arrive.
+
+    Only the line being read is buffered. Malformed lines, lines that are
+    not objects and lines longer than max_line_bytes are skipped and
+    recorded in errors, so one bad record does not abort the upload.
+    """
+    parts: List[bytes] = []
+    size = 0
+    line_number = 0
+    oversized = False
+
+    def parse(line: bytes):
+        try:
+            doc = json.loads(line)
+        except ValueError as e:
+            errors.append({"batch": None, "document_ids": [], "error": f"Line {line_number}: invalid JSON: {e}"})
+            return None
+        if not isinstance(doc, dict):
+            errors.append({"batch": None, "document_ids": [], "error": f"Line {line_number}: expected a JSON object"})
+            return None
+        return doc
+
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline == -1:
+                break
+
+            line_number += 1
+            if oversized:
+                oversized = False
+            else:
+                parts.append(chunk[start:newline])
+                line = b"".join(parts).strip()
+                doc = parse(line) if line else None
+                if doc is not None:
+                    yield doc
+            parts, size = [], 0
+            start = newline + 1
+
+        if oversized:
+            continue
+        rest = chunk[start:]
+        parts.append(rest)
+        size += len(rest)
+        if size > max_line_bytes:
+            # The remainder of the line is dropped as it arrives instead of buffered
+            errors.append({"batch": None, "document_ids": [], "error": f"Line {line_number + 1}: longer than {max_line_bytes} bytes"})
+            logger.warning(f"Skipping NDJSON line {line_number + 1} longer than {max_line_bytes} bytes")
+            parts, size = [], 0
+            oversized = True
+
+    line = b"".join(parts).strip()
+    if line and not oversized:
+        line_number += 1
+        doc = parse(line)
+        if doc is not None:
+            yield doc
@@ -0,0 +1,156 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+import logging
+
+from ..metrics import QUERY_COALESCED, UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only while it still belongs to the flight that took it
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class QueryCoalescer:
+    """Single-flight execution of identical concurrent queries.
+
+    Requests with the same normalized query and retrieval options share one
+    pipeline run: the first starts it and later arrivals await its outcome,
+    errors included. Nothing is kept once the run finishes, so unlike the
+    response cache there is no staleness window.
+
+    With distributed enabled, one flight per worker then competes for a
+    Redis lock on the key. The holder computes and writes the result under
+    its flight id before releasing the lock; the others poll for that
+    result, and take over if the holder fails or the lock expires. When
+    Redis is unreachable each worker simply computes on its own.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        distributed: Optional[bool] = None,
+        lock_seconds: Optional[float] = None,
+        poll_seconds: Optional[float] = None,
+        prefix: str = "rag:flight"
+    ):
+        self.redis_client = redis_client
+        self.enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        if distributed is None:
+            distributed = os.getenv("SINGLE_FLIGHT_DISTRIBUTED", "false").lower() == "true"
+        self.distributed = distributed and redis_client is not None
+        # Longer than a full pipeline run, so a live holder never loses the lock
+        self.lock_seconds = lock_seconds or float(os.getenv("SINGLE_FLIGHT_LOCK_SECONDS", "90"))
+        self.poll_seconds = poll_seconds or float(os.getenv("SINGLE_FLIGHT_POLL_MS", "50")) / 1000
+        self.prefix = prefix
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(query: str, options: Dict[str, Any]) -> str:
+        """Flight key: the query with case and whitespace normalized, plus the options shaping the answer"""
+        normalized = " ".join(query.lower().split())
+        payload = json.dumps({"query": normalized, "options": options}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Result of compute(), shared with every concurrent caller passing the same key"""
+        if not self.enabled:
+            return await compute()
+
+        flight = self._inflight.get(key)
+        if flight is not None:
+            QUERY_COALESCED.labels(scope="local").inc()
+        else:
+            # A task of its own, so a caller that goes away does not cancel the others' answer
+            flight = asyncio.create_task(self._fly(key, compute))
+            self._inflight[key] = flight
+            flight.add_done_callback(lambda task: self._land(key, task))
+        return await asyncio.shield(flight)
+
+    def _land(self, key: str, flight: asyncio.Task):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # Consume the outcome in case every caller was cancelled meanwhile
+        flight.cancelled() or flight.exception()
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.prefix}:lock:{key}"
+
+    def _result_key(self, flight_id: str) -> str:
+        return f"{self.prefix}:result:{flight_id}"
+
+    async def _fly(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        if not self.distributed:
+            return await compute()
+
+        flight_id = uuid.uuid4().hex
+        try:
+            leading, result = await self._join(key, flight_id)
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.warning(f"Single-flight coordination failed, computing locally: {e}")
+            return await compute()
+
+        if result is not None:
+            QUERY_COALESCED.labels(scope="remote").inc()
+            return result
+
+        # Leading, or the holder outlived our wait; either way compute here
+        try:
+            result = await compute()
+        except BaseException:
+            if leading:
+                await self._release(key, flight_id, None)
+            raise
+        if leading:
+            await self._release(key, flight_id, result)
+        return result
+
+    async def _join(self, key: str, flight_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Take the key's lock, or wait for its holder's result; returns (leading, remote result)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_seconds
+        lock_key = self._lock_key(key)
+
+        while loop.time() < deadline:
+            holder = await self.redis_client.set(
+                lock_key, flight_id, nx=True, px=int(self.lock_seconds * 1000), get=True
+            )
+            if holder is None:
+                return True, None
+
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_seconds)
+                # Lock first: the holder writes its result before releasing,
+                # so a released lock means the result read next is final
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.get(lock_key)
+                pipe.get(self._result_key(holder))
+                current, payload = await pipe.execute()
+                if payload is not None:
+                    return False, json.loads(payload)
+                if current != holder:
+                    # The holder failed or its lock expired; compete again
+                    break
+
+        return False, None
+
+    async def _release(self, key: str, flight_id: str, result: Optional[Dict[str, Any]]):
+        """Hand the result to waiting workers and release the lock; without a result they retry"""
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            if result is not None:
+                # Only readable by workers that saw this flight's id, so it cannot go stale
+                pipe.set(self._result_key(flight_id), json.dumps(result, default=str), px=int(self.lock_seconds * 1000))
+            pipe.eval(_RELEASE_LOCK, 1, self._lock_key(key), flight_id)
+            await pipe.execute()
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.warning(f"Single-flight release failed: {e}")
@@ -0,0 +1,121 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+import logging
+
+from .database import Database
+from ..metrics import QUERY_LOG_ENTRIES, UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+class QueryLogWriter:
+    """Buffers query outcomes in memory and writes them to query_logs from a background task.
+
+    record() only enqueues, so logging adds no database round-trip to a
+    request. The writer flushes a multi-row INSERT once batch_size entries
+    are waiting or flush_seconds after the first one. When the queue is
+    full or Postgres rejects a batch, entries are dropped and counted in
+    api_query_log_entries_total rather than held back or retried.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        flush_seconds: Optional[float] = None
+    ):
+        self.database = database
+        self.batch_size = batch_size or int(os.getenv("QUERY_LOG_BATCH_SIZE", "200"))
+        self.flush_seconds = flush_seconds or float(os.getenv("QUERY_LOG_FLUSH_SECONDS", "2"))
+        self.max_backoff_seconds = 30.0
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue or int(os.getenv("QUERY_LOG_QUEUE_SIZE", "10000")))
+        self._task: Optional[asyncio.Task] = None
+        self._failures = 0
+
+    def record(
+        self,
+        query_text: str,
+        response_time_ms: float,
+        success: bool,
+        error_message: Optional[str] = None,
+        user_id: Optional[str] = None,
+        stage_timings: Optional[Dict[str, float]] = None
+    ):
+        """Queue one query outcome without waiting"""
+        entry = (
+            query_text,
+            int(round(response_time_ms)),
+            success,
+            error_message,
+            user_id,
+            json.dumps(stage_timings) if stage_timings else None,
+            datetime.now(timezone.utc)
+        )
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            QUERY_LOG_ENTRIES.labels(result="queue_full").inc()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and flush what is still queued"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        remaining = []
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+        for start in range(0, len(remaining), self.batch_size):
+            await self._write(remaining[start:start + self.batch_size])
+
+    async def _next_batch(self) -> List[Tuple[Any, ...]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.flush_seconds
+
+        while len(batch) < self.batch_size:
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            remaining = deadline - loop.time()
+            if len(batch) >= self.batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            if not await self._write(batch):
+                # Entries arriving meanwhile overflow the queue and are counted as dropped
+                await asyncio.sleep(min(self.max_backoff_seconds, 2 ** self._failures))
+
+    async def _write(self, batch: List[Tuple[Any, ...]]) -> bool:
+        try:
+            await self.database.execute_values(
+                """
+                INSERT INTO query_logs
+                    (query_text, response_time_ms, success, error_message, user_id, stage_timings, timestamp)
+                VALUES %s
+                """,
+                batch
+            )
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="postgres").inc()
+            QUERY_LOG_ENTRIES.labels(result="write_failed").inc(len(batch))
+            self._failures += 1
+            logger.warning(f"Dropped {len(batch)} query log entries: {e}")
+            return False
+
+        QUERY_LOG_ENTRIES.labels(result="written").inc(len(batch))
+        self._failures = 0
+        return True
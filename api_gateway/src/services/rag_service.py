@@ -1,33 +1,81 @@
 import os
+import time
+import asyncio
 import httpx
-import chromadb
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Iterator, Callable, Awaitable
 import json
 import logging
 
+from .llm_client import LLMClient
+from .embedding_service import EmbeddingService
+from .document_registry import DocumentRegistry
+from .corpus_centroids import CorpusCentroids
+from .vector_store import VectorStore, create_vector_store
+from .bm25_index import BM25Index, reciprocal_rank_fusion
+from .context_packer import ContextPacker
+from .mmr import maximal_marginal_relevance
+from .chunker import Chunker
+from ..models import date_key
+from ..metrics import UPSTREAM_ERRORS, stage_timer, observe_stage
+
 logger = logging.getLogger(__name__)
 
 class RAGService:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.chromadb_client = chromadb.HttpClient(host="chromadb", port=8000)
-        self.collection = self.chromadb_client.get_or_create_collection("commercial_data")
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        document_registry: Optional[DocumentRegistry] = None,
+        corpus_centroids: Optional[CorpusCentroids] = None,
+        vector_store: Optional[VectorStore] = None,
+        lexical_index: Optional[BM25Index] = None,
+        context_packer: Optional[ContextPacker] = None,
+        chunker: Optional[Chunker] = None
+    ):
+        self.llm_client = llm_client or LLMClient()
+        self.embedding_service = embedding_service or EmbeddingService(llm_client=self.llm_client)
+        self.document_registry = document_registry
+        self.corpus_centroids = corpus_centroids
+        self.vector_store = vector_store or create_vector_store()
+        self.lexical_index = lexical_index
+        self.context_packer = context_packer or ContextPacker()
+        self.chunker = chunker or Chunker()
+        # Candidates fetched from each retriever, and fused results kept when
+        # exact-term hits exist and MMR is off (MMR cuts the fused pool itself);
+        # lexical hits up to the given rank enter the context even when their
+        # dense distance is above the threshold
+        self.retrieval_candidates = int(os.getenv("HYBRID_CANDIDATES", "10"))
+        self.hybrid_results = int(os.getenv("HYBRID_RESULTS", "5"))
+        self.lexical_context_rank = int(os.getenv("HYBRID_LEXICAL_CONTEXT_RANK", "3"))
+        # Results kept by MMR reranking (0 disables it) and its relevance weight;
+        # 1.0 keeps the retrieval order, lower values drop near-duplicates sooner
+        self.mmr_top_k = int(os.getenv("MMR_TOP_K", "5"))
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.5"))
+        self.ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", "100"))
+        self.ingest_max_concurrent_batches = int(os.getenv("INGEST_MAX_CONCURRENT_BATCHES", "4"))
+        self.ingest_stream_batch_documents = int(os.getenv("INGEST_STREAM_BATCH_DOCUMENTS", "200"))
         
-    async def process_query(self, query: str) -> Dict[str, Any]:
+    async def process_query(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]] = None,
+        retrieval_results: Optional[Dict[str, Any]] = None,
+        max_results: Optional[int] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         try:
-            # Perform vector search
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=10,
-                include=["documents", "metadatas", "distances"]
-            )
+            results = retrieval_results or await self.retrieve(query, query_embedding, max_results, where)
             
-            # Assemble context
-            context = self._assemble_context(results)
+            # Rerank for diversity, then assemble context
+            with stage_timer("rerank"):
+                reranked = self._rerank(results, max_results)
+            with stage_timer("context_assembly"):
+                context = self._assemble_context(reranked)
             
             # Generate response with LLM
-            response = await self._generate_response(query, context)
+            with stage_timer("llm_generation"):
+                response = await self._generate_response(query, context)
             
             return {
                 "response": response,
@@ -39,26 +87,202 @@ class RAGService:
             logger.error(f"Error processing query: {e}")
             raise
     
+    async def stream_query(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]] = None,
+        retrieval_results: Optional[Dict[str, Any]] = None,
+        max_results: Optional[int] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield the sources, then answer tokens as generated, then the confidence"""
+        try:
+            results = retrieval_results or await self.retrieve(query, query_embedding, max_results, where)
+            with stage_timer("rerank"):
+                reranked = self._rerank(results, max_results)
+            with stage_timer("context_assembly"):
+                context = self._assemble_context(reranked)
+            yield {"event": "sources", "data": context}
+            
+            generation_started = time.perf_counter()
+            async for token in self.llm_client.stream_chat_completion(
+                model="gpt-4-turbo",
+                messages=self._build_messages(query, context),
+                max_tokens=1500,
+                temperature=0.3,
+                timeout=60.0
+            ):
+                yield {"event": "token", "data": token}
+            observe_stage("llm_generation", time.perf_counter() - generation_started)
+            
+            yield {"event": "complete", "data": {"confidence": self._calculate_confidence(results["distances"][0])}}
+            
+        except Exception as e:
+            logger.error(f"Error streaming query: {e}")
+            raise
+    
+    async def retrieve(
+        self,
+        query: str,
+        query_embedding: Optional[List[float]] = None,
+        max_results: Optional[int] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Top documents for the query; max_results and the metadata filter are applied inside each search"""
+        if query_embedding is None:
+            query_embedding = await self.embedding_service.generate_single_embedding(query)
+        
+        n_results = max_results or self.retrieval_candidates
+        # Perform vector search, and BM25 search alongside it
+        with stage_timer("vector_search"):
+            dense, lexical = await asyncio.gather(
+                self._dense_search(query_embedding, n_results, where),
+                self._lexical_search(query, n_results, where)
+            )
+            if not lexical:
+                return dense
+            # With MMR on, the whole fused pool is reranked and cut afterwards
+            limit = n_results if self.mmr_top_k > 0 else min(self.hybrid_results, n_results)
+            return await self._fuse(query_embedding, dense, lexical, limit)
+    
+    async def _dense_search(
+        self,
+        query_embedding: List[float],
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        try:
+            return await asyncio.to_thread(
+                self.vector_store.query,
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include_embeddings=self.mmr_top_k > 0
+            )
+        except Exception:
+            UPSTREAM_ERRORS.labels(dependency=self.vector_store.backend).inc()
+            raise
+    
+    async def _lexical_search(
+        self,
+        query: str,
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        if not self.lexical_index:
+            return []
+        
+        try:
+            return await asyncio.to_thread(self.lexical_index.search, query, n_results, where)
+        except Exception as e:
+            # Dense results alone are still a complete answer
+            logger.warning(f"Lexical search failed: {e}")
+            return []
+    
+    async def _fuse(
+        self,
+        query_embedding: List[float],
+        dense: Dict[str, Any],
+        lexical: List[Tuple[str, float]],
+        limit: int
+    ) -> Dict[str, Any]:
+        """Merge dense and BM25 rankings with reciprocal-rank fusion, in Chroma's result layout"""
+        dense_ids = dense["ids"][0]
+        lexical_ids = [doc_id for doc_id, _ in lexical]
+        fused = reciprocal_rank_fusion([dense_ids, lexical_ids])[:limit]
+        
+        dense_embeddings = dense.get("embeddings")
+        dense_embeddings = dense_embeddings[0] if dense_embeddings is not None else [None] * len(dense_ids)
+        records = {
+            doc_id: (document, metadata, distance, embedding)
+            for doc_id, document, metadata, distance, embedding in zip(
+                dense_ids, dense["documents"][0], dense["metadatas"][0], dense["distances"][0], dense_embeddings
+            )
+        }
+        
+        # Lexical-only hits are fetched with their embeddings so every result keeps a real cosine distance
+        missing = [doc_id for doc_id, _ in fused if doc_id not in records]
+        if missing:
+            try:
+                stored = await asyncio.to_thread(self.vector_store.get, ids=missing, include_embeddings=True)
+            except Exception:
+                UPSTREAM_ERRORS.labels(dependency=self.vector_store.backend).inc()
+                raise
+            
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+            for doc_id, document, metadata, embedding in zip(
+                stored["ids"], stored["documents"], stored["metadatas"], stored["embeddings"]
+            ):
+                vector = np.asarray(embedding, dtype=np.float32)
+                similarity = float(vector @ query_vector) / max(float(np.linalg.norm(vector)), 1e-12)
+                records[doc_id] = (document, metadata, 1.0 - similarity, embedding)
+        
+        lexical_ranks = {doc_id: rank for rank, doc_id in enumerate(lexical_ids)}
+        # Ids the lexical index still holds but the store no longer does are dropped
+        ids = [doc_id for doc_id, _ in fused if doc_id in records]
+        results = {
+            "ids": [ids],
+            "documents": [[records[doc_id][0] for doc_id in ids]],
+            "metadatas": [[records[doc_id][1] for doc_id in ids]],
+            "distances": [[records[doc_id][2] for doc_id in ids]],
+            "lexical_ranks": [[lexical_ranks.get(doc_id) for doc_id in ids]]
+        }
+        if dense.get("embeddings") is not None:
+            results["embeddings"] = [[records[doc_id][3] for doc_id in ids]]
+        return results
+    
+    def _rerank(self, results: Dict[str, Any], max_results: Optional[int] = None) -> Dict[str, Any]:
+        """Keep the results that best balance relevance and novelty, in selection order.
+
+        An explicit max_results sets how many are kept, otherwise mmr_top_k does.
+        """
+        embeddings = results.get("embeddings")
+        if self.mmr_top_k <= 0 or embeddings is None or not results["ids"] or len(results["ids"][0]) == 0:
+            return results
+        
+        # Distances are cosine distances to the query, so relevance is their complement
+        relevance = 1.0 - np.asarray(results["distances"][0], dtype=np.float32)
+        # Exact-term hits rank with the best dense hit, so only redundancy can push them out
+        lexical_ranks = results.get("lexical_ranks", [[]])[0]
+        exact_term_hits = [
+            i for i, rank in enumerate(lexical_ranks) if rank is not None and rank < self.lexical_context_rank
+        ]
+        if exact_term_hits:
+            relevance[exact_term_hits] = np.maximum(relevance[exact_term_hits], relevance.max())
+        k = max_results or self.mmr_top_k
+        order = maximal_marginal_relevance(relevance, np.asarray(embeddings[0]), k, self.mmr_lambda)
+        return {
+            key: [[results[key][0][i] for i in order]]
+            for key in ("ids", "documents", "metadatas", "distances", "lexical_ranks", "embeddings")
+            if results.get(key) is not None
+        }
+    
     def _assemble_context(self, results: Dict[str, Any]) -> List[Dict[str, Any]]:
         documents = results.get("documents", [[]])[0]
         metadatas = results.get("metadatas", [[]])[0]
         distances = results.get("distances", [[]])[0]
+        lexical_ranks = results.get("lexical_ranks", [[]])[0]
         
         context = []
         for i, doc in enumerate(documents):
-            if i < len(distances) and distances[i] < 0.3:  # Relevance threshold
+            lexical_rank = lexical_ranks[i] if i < len(lexical_ranks) else None
+            exact_term_hit = lexical_rank is not None and lexical_rank < self.lexical_context_rank
+            if i < len(distances) and (distances[i] < 0.3 or exact_term_hit):  # Relevance threshold
                 context.append({
                     "content": doc,
                     "source": metadatas[i].get("source", "unknown") if i < len(metadatas) else "unknown",
                     "relevance_score": 1 - distances[i]
                 })
         
+        # Results arrive best first; keep the prompt within budget and free of repeats
+        context, _ = self.context_packer.pack(context)
         return context
     
-    async def _generate_response(self, query: str, context: List[Dict[str, Any]]) -> str:
-        context_text = "\n".join([f"Source: {ctx['source']}\nContent: {ctx['content']}" for ctx in context])
+    def _build_messages(self, query: str, context: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        context_text = "\n".join([ContextPacker.format_chunk(ctx) for ctx in context])
         
-        messages = [
+        return [
             {
                 "role": "system",
                 "content": "You are a commercial analytics expert. Use only the provided context to answer questions about sales performance. If the context doesn't contain relevant information, clearly state that."
@@ -68,15 +292,15 @@ class RAGService:
                 "content": f"Context:\n{context_text}\n\nQuestion: {query}"
             }
         ]
-        
-        response = self.openai_client.chat.completions.create(
+    
+    async def _generate_response(self, query: str, context: List[Dict[str, Any]]) -> str:
+        return await self.llm_client.chat_completion(
             model="gpt-4-turbo",
-            messages=messages,
+            messages=self._build_messages(query, context),
             max_tokens=1500,
-            temperature=0.3
+            temperature=0.3,
+            timeout=60.0
         )
-        
-        return response.choices[0].message.content
     
     def _calculate_confidence(self, distances: List[float]) -> float:
         if not distances:
@@ -91,31 +315,422 @@ class RAGService:
         confidence = 1 - avg_distance
         return max(0.0, min(1.0, confidence))
     
-    async def ingest_documents(self, documents: List[Dict[str, Any]]) -> int:
+    async def ingest_documents(
+        self,
+        documents: List[Dict[str, Any]],
+        prune_missing: bool = False,
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """Chunk, embed and store new or changed documents in batches, reporting failures per batch.
+
+        on_progress, if given, is awaited with running counts after every batch.
+        """
+        pending, rejected = self._prepare_documents(documents)
+        result = await self._ingest_prepared(pending, on_progress)
+        result["errors"].extend(self._rejection_errors(rejected))
+        
+        if prune_missing:
+            # Rejected documents are still part of the export and must keep their vectors
+            result["deleted"], prune_error = await self._prune_missing(pending + [doc for doc in rejected if doc["id"]])
+            if prune_error:
+                result["errors"].append(prune_error)
+        
+        return await self._finish_ingest(result)
+    
+    async def ingest_stream(
+        self,
+        documents: AsyncIterator[Dict[str, Any]],
+        prune_missing: bool = False,
+        batch_documents: Optional[int] = None,
+        read_errors: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """Ingest documents from an async iterator, batch_documents at a time.
+
+        Only the current batch is held in memory, plus the id and source of
+        every document when prune_missing needs the full export. Stores are
+        persisted once at the end. read_errors collects records the iterator
+        could not read; they are reported, and any of them cancels pruning
+        since the export is then incomplete.
+        """
+        batch_documents = batch_documents or self.ingest_stream_batch_documents
+        result = {"processed": 0, "chunks": 0, "skipped": 0, "deleted": 0, "errors": [], "batches": 0}
+        seen = []
+        
+        async def flush(batch):
+            pending, rejected = self._prepare_documents(batch)
+            if prune_missing:
+                seen.extend({"id": doc["id"], "source": doc.get("source", "unknown")} for doc in pending + rejected if doc["id"])
+            part = await self._ingest_prepared(pending, first_batch=result["batches"])
+            for key in ("processed", "chunks", "skipped", "batches"):
+                result[key] += part[key]
+            result["errors"].extend(part["errors"] + self._rejection_errors(rejected))
+        
+        batch = []
+        async for doc in documents:
+            batch.append(doc)
+            if len(batch) >= batch_documents:
+                await flush(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+        
+        if read_errors:
+            result["errors"].extend(read_errors)
+            if prune_missing:
+                logger.warning(f"Skipping prune after {len(read_errors)} unreadable records")
+                prune_missing = False
+        
+        if prune_missing:
+            result["deleted"], prune_error = await self._prune_missing(seen)
+            if prune_error:
+                result["errors"].append(prune_error)
+        
+        return await self._finish_ingest(result)
+    
+    def _prepare_documents(self, documents: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Documents with text content, with their resolved id and content hash, and those rejected for non-text content"""
+        pending, rejected = [], []
+        for doc in documents:
+            content = doc.get("content")
+            if content is not None and not isinstance(content, str):
+                rejected.append({**doc, "id": str(doc["id"]) if doc.get("id") else None})
+                continue
+            # Empty and whitespace-only documents have nothing to embed
+            if not content or not content.strip():
+                continue
+            
+            content_hash = DocumentRegistry.content_hash(doc)
+            pending.append({
+                **doc,
+                "id": str(doc.get("id") or f"doc_{content_hash[:16]}"),
+                "content_hash": content_hash
+            })
+        return pending, rejected
+    
+    @staticmethod
+    def _rejection_errors(rejected: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{
+            "batch": None,
+            "document_ids": [doc["id"]] if doc["id"] else [],
+            "error": f"Content must be text, got {type(doc['content']).__name__}"
+        } for doc in rejected]
+    
+    async def _ingest_prepared(
+        self,
+        pending: List[Dict[str, Any]],
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        first_batch: int = 0
+    ) -> Dict[str, Any]:
+        """Embed and store the new or changed documents among pending, numbering batches from first_batch"""
+        # Only documents that are new or whose hash changed need embedding
+        known_hashes = await self._known_hashes([doc["id"] for doc in pending])
+        changed = [doc for doc in pending if known_hashes.get(doc["id"]) != doc["content_hash"]]
+        # A document repeated in one upload is stored once, in its last version
+        changed = list({doc["id"]: doc for doc in changed}.values())
+        
+        progress: Dict[str, Dict[str, Any]] = {}
+        processed_count, chunk_count, batch_count, errors = 0, 0, 0, []
+        in_flight = set()
+        
+        async def collect(done):
+            nonlocal processed_count, chunk_count
+            for task in done:
+                stored, error, parent_ids = task.result()
+                chunk_count += stored
+                if error:
+                    errors.append(error)
+                processed_count += await self._complete_documents(progress, parent_ids, failed=error is not None)
+            if on_progress:
+                await on_progress({"processed": processed_count, "chunks": chunk_count, "failed_batches": len(errors)})
+        
+        # Batches are produced lazily and at most ingest_max_concurrent_batches are in flight,
+        # so only that many batches of chunk text exist at any time
+        for batch in self._iter_chunk_batches(changed, progress):
+            if len(in_flight) >= self.ingest_max_concurrent_batches:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                await collect(done)
+            in_flight.add(asyncio.create_task(self._ingest_batch(first_batch + batch_count, batch)))
+            batch_count += 1
+        if in_flight:
+            done, _ = await asyncio.wait(in_flight)
+            await collect(done)
+        
+        # Documents the chunker found nothing in never reach a batch; complete them so old chunks are removed
+        unchunked = [progress.pop(doc_id) for doc_id, state in list(progress.items()) if not state["chunk_ids"]]
+        if unchunked:
+            processed_count += await self._store_completed(unchunked)
+        
+        return {
+            "processed": processed_count,
+            "chunks": chunk_count,
+            "skipped": len(pending) - len(changed),
+            "deleted": 0,
+            "errors": errors,
+            "batches": batch_count
+        }
+    
+    async def _finish_ingest(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist the stores if anything changed and order the errors by batch"""
+        errors = result["errors"]
+        if result["processed"] or result["deleted"]:
+            try:
+                await asyncio.to_thread(self.vector_store.persist)
+                if self.lexical_index:
+                    await asyncio.to_thread(self.lexical_index.persist)
+            except Exception as e:
+                logger.error(f"Error persisting vector store: {e}")
+                errors.append({"batch": None, "document_ids": [], "error": f"Persist failed: {e}"})
+        
+        return {
+            "processed": result["processed"],
+            "chunks": result["chunks"],
+            "skipped": result["skipped"],
+            "deleted": result["deleted"],
+            "errors": sorted(errors, key=lambda error: error["batch"] if error["batch"] is not None else -1)
+        }
+    
+    async def _known_hashes(self, document_ids: List[str]) -> Dict[str, str]:
+        if not self.document_registry:
+            return {}
+        
         try:
-            processed_count = 0
+            return await self.document_registry.get_hashes(document_ids)
+        except Exception as e:
+            # Without the registry every document is treated as changed
+            UPSTREAM_ERRORS.labels(dependency="postgres").inc()
+            logger.warning(f"Document registry unavailable, ingesting all documents: {e}")
+            return {}
+    
+    @staticmethod
+    def _document_metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = {
+            "source": doc.get("source", "unknown"),
+            "date": doc.get("date", ""),
+            "type": doc.get("type", "document"),
+            "parent_id": doc["id"]
+        }
+        # Chroma metadata cannot hold None, so undated documents omit the key
+        numeric_date = date_key(doc["date"]) if doc.get("date") else None
+        if numeric_date is not None:
+            metadata["date_key"] = numeric_date
+        return metadata
+    
+    def _iter_chunk_batches(
+        self,
+        documents: List[Dict[str, Any]],
+        progress: Dict[str, Dict[str, Any]]
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Yield batches of chunk records, tracking in progress how many chunks each document produced"""
+        batch = []
+        for doc in documents:
+            metadata = self._document_metadata(doc)
+            state = progress[doc["id"]] = {"doc": doc, "chunk_ids": [], "outstanding": 0, "failed": False, "chunked": False}
             
-            for doc in documents:
-                # Extract text content
-                content = doc.get("content", "")
-                if not content:
-                    continue
+            chunks = self.chunker.iter_chunks(doc["content"])
+            current = next(chunks, None)
+            while current is not None:
+                following = next(chunks, None)
+                start, end, text = current
+                index = len(state["chunk_ids"])
+                # Documents that fit one chunk keep their own id, as before chunking existed
+                chunk_id = doc["id"] if index == 0 and following is None else f"{doc['id']}#{index}"
+                state["chunk_ids"].append(chunk_id)
+                state["outstanding"] += 1
+                # Marked before the last chunk is handed out, so completion is never missed
+                state["chunked"] = following is None
                 
-                # Generate embedding and store
-                self.collection.add(
-                    documents=[content],
-                    metadatas=[{
-                        "source": doc.get("source", "unknown"),
-                        "date": doc.get("date", ""),
-                        "type": doc.get("type", "document")
-                    }],
-                    ids=[doc.get("id", f"doc_{processed_count}")]
+                batch.append({
+                    "id": chunk_id,
+                    "content": text,
+                    "metadata": {**metadata, "chunk_index": index, "chunk_start": start, "chunk_end": end}
+                })
+                if len(batch) >= self.ingest_batch_size:
+                    yield batch
+                    batch = []
+                current = following
+        
+        if batch:
+            yield batch
+    
+    async def _ingest_batch(
+        self,
+        batch_index: int,
+        batch: List[Dict[str, Any]]
+    ) -> Tuple[int, Optional[Dict[str, Any]], List[str]]:
+        ids = [chunk["id"] for chunk in batch]
+        contents = [chunk["content"] for chunk in batch]
+        metadatas = [chunk["metadata"] for chunk in batch]
+        parent_ids = [metadata["parent_id"] for metadata in metadatas]
+        
+        embeddings = None
+        try:
+            embeddings = await self.embedding_service.generate_embeddings(contents)
+            # Read before the upsert, so replaced chunks can be taken out of the centroids
+            replaced = await self._centroid_vectors(ids)
+            await asyncio.to_thread(
+                self.vector_store.upsert,
+                ids=ids,
+                embeddings=embeddings,
+                documents=contents,
+                metadatas=metadatas
+            )
+            if self.lexical_index:
+                await asyncio.to_thread(self.lexical_index.upsert, ids, contents, metadatas)
+        
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency=self.vector_store.backend if embeddings is not None else "openai").inc()
+            logger.error(f"Error ingesting batch {batch_index}: {e}")
+            return 0, {
+                "batch": batch_index,
+                "document_ids": list(dict.fromkeys(parent_ids)),
+                "error": str(e)
+            }, parent_ids
+        
+        if self.corpus_centroids:
+            try:
+                await self.corpus_centroids.update(
+                    embeddings, [metadata["type"] for metadata in metadatas], *replaced
                 )
-                
-                processed_count += 1
-            
-            return processed_count
-            
+            except Exception as e:
+                UPSTREAM_ERRORS.labels(dependency="redis").inc()
+                logger.warning(f"Failed to update corpus centroids for batch {batch_index}: {e}")
+        
+        return len(ids), None, parent_ids
+    
+    async def _complete_documents(
+        self,
+        progress: Dict[str, Dict[str, Any]],
+        parent_ids: List[str],
+        failed: bool
+    ) -> int:
+        """Account for a finished batch; documents whose chunks are all stored are cleaned up and registered"""
+        completed = []
+        for parent_id in parent_ids:
+            state = progress[parent_id]
+            state["outstanding"] -= 1
+            state["failed"] = state["failed"] or failed
+            if state["outstanding"] == 0 and state["chunked"]:
+                completed.append(progress.pop(parent_id))
+        
+        return await self._store_completed([state for state in completed if not state["failed"]])
+    
+    async def _store_completed(self, stored: List[Dict[str, Any]]) -> int:
+        """Remove stale chunks of fully stored documents and record them in the registry"""
+        if not stored:
+            return 0
+        
+        await self._delete_stale_chunks(stored)
+        
+        if self.document_registry:
+            try:
+                await self.document_registry.upsert([{
+                    "document_id": state["doc"]["id"],
+                    "source": state["doc"].get("source", "unknown"),
+                    "document_type": state["doc"].get("type", "document"),
+                    "title": state["doc"].get("title"),
+                    "content_hash": state["doc"]["content_hash"]
+                } for state in stored])
+            except Exception as e:
+                # Vectors are stored; the documents are simply re-embedded next run
+                UPSTREAM_ERRORS.labels(dependency="postgres").inc()
+                logger.warning(f"Failed to record {len(stored)} documents in document registry: {e}")
+        
+        return len(stored)
+    
+    async def _chunk_ids(self, parent_ids: List[str]) -> List[str]:
+        """Stored ids of the given documents: their chunks, plus vectors stored whole before chunking"""
+        stored = await asyncio.to_thread(self.vector_store.get, where={"parent_id": {"$in": parent_ids}})
+        return list(dict.fromkeys(stored["ids"] + parent_ids))
+    
+    async def _centroid_vectors(self, ids: List[str]) -> Tuple[List[List[float]], List[str]]:
+        """Stored embeddings and types of the given ids, for subtracting them from the corpus centroids"""
+        if not self.corpus_centroids or not ids:
+            return [], []
+        
+        try:
+            stored = await asyncio.to_thread(self.vector_store.get, ids=ids, include_embeddings=True)
+        except Exception as e:
+            # The centroids only steer the relevance fast path; a drift is preferable to a failed ingest
+            UPSTREAM_ERRORS.labels(dependency=self.vector_store.backend).inc()
+            logger.warning(f"Failed to read replaced vectors for corpus centroids: {e}")
+            return [], []
+        return list(stored["embeddings"]), [metadata.get("type", "document") for metadata in stored["metadatas"]]
+    
+    async def _remove_from_centroids(self, removed: Tuple[List[List[float]], List[str]]):
+        if not self.corpus_centroids or not removed[1]:
+            return
+        
+        try:
+            await self.corpus_centroids.remove(*removed)
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.warning(f"Failed to update corpus centroids for deleted chunks: {e}")
+    
+    async def _delete_stale_chunks(self, states: List[Dict[str, Any]]):
+        """Remove chunks left over from a previous, longer version of re-ingested documents"""
+        current = {chunk_id for state in states for chunk_id in state["chunk_ids"]}
+        try:
+            stale = [
+                chunk_id for chunk_id in await self._chunk_ids([state["doc"]["id"] for state in states])
+                if chunk_id not in current
+            ]
+            if stale:
+                removed = await self._centroid_vectors(stale)
+                await asyncio.to_thread(self.vector_store.delete, stale)
+                if self.lexical_index:
+                    await asyncio.to_thread(self.lexical_index.delete, stale)
+                await self._remove_from_centroids(removed)
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency=self.vector_store.backend).inc()
+            logger.warning(f"Failed to remove stale chunks: {e}")
+    
+    async def _prune_missing(self, documents: List[Dict[str, Any]]) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Delete vectors of documents that disappeared from a full export of their sources"""
+        if not self.document_registry:
+            return 0, {"batch": None, "document_ids": [], "error": "Pruning requires the document registry"}
+        
+        sources = {doc.get("source", "unknown") for doc in documents}
+        try:
+            missing_ids = await self.document_registry.find_missing(sources, [doc["id"] for doc in documents])
+            if missing_ids:
+                chunk_ids = await self._chunk_ids(missing_ids)
+                removed = await self._centroid_vectors(chunk_ids)
+                await asyncio.to_thread(self.vector_store.delete, chunk_ids)
+                if self.lexical_index:
+                    await asyncio.to_thread(self.lexical_index.delete, chunk_ids)
+                await self._remove_from_centroids(removed)
+                await self.document_registry.delete(missing_ids)
+            return len(missing_ids), None
+        
+        except Exception as e:
+            logger.error(f"Error pruning removed documents: {e}")
+            return 0, {"batch": None, "document_ids": [], "error": str(e)}
+    
+    async def sync_lexical_index(self, page_size: int = 1000):
+        """Rebuild the lexical index from the vector store when they disagree, e.g. on first start"""
+        if not self.lexical_index:
+            return
+        
+        try:
+            total = await asyncio.to_thread(self.vector_store.count)
+            if total == self.lexical_index.count():
+                return
+        
+            logger.info(f"Rebuilding lexical index from {total} stored documents")
+            seen = set()
+            for offset in range(0, total, page_size):
+                page = await asyncio.to_thread(self.vector_store.get, limit=page_size, offset=offset)
+                if not page["ids"]:
+                    break
+                await asyncio.to_thread(self.lexical_index.upsert, page["ids"], page["documents"], page["metadatas"])
+                seen.update(page["ids"])
+        
+            stale = [doc_id for doc_id in self.lexical_index.ids() if doc_id not in seen]
+            if stale:
+                await asyncio.to_thread(self.lexical_index.delete, stale)
+            await asyncio.to_thread(self.lexical_index.persist)
+        
         except Exception as e:
-            logger.error(f"Error ingesting documents: {e}")
-            raise
\ No newline at end of file
+            # Retrieval falls back to dense results for documents missing from the index
+            UPSTREAM_ERRORS.labels(dependency=self.vector_store.backend).inc()
+            logger.error(f"Error rebuilding lexical index: {e}")
@@ -0,0 +1,37 @@
+import os
+from urllib.parse import quote
+from redis.asyncio import Redis, BlockingConnectionPool
+import logging
+
+logger = logging.getLogger(__name__)
+
+def redis_url() -> str:
+    """Redis endpoint from REDIS_URL, or from REDIS_HOST/REDIS_PORT/REDIS_DB"""
+    url = os.getenv("REDIS_URL")
+    if url:
+        return url
+
+    host = os.getenv("REDIS_HOST", "redis")
+    port = os.getenv("REDIS_PORT", "6379")
+    db = os.getenv("REDIS_DB", "0")
+    password = os.getenv("REDIS_PASSWORD")
+    # Quoted, so passwords containing @, : or / still parse
+    auth = f":{quote(password, safe='')}@" if password else ""
+    return f"redis://{auth}{host}:{port}/{db}"
+
+def create_redis_client(decode_responses: bool = True) -> Redis:
+    """Async Redis client on a bounded connection pool.
+
+    Callers wait up to REDIS_POOL_TIMEOUT for a free connection instead
+    of opening unbounded sockets under load.
+    """
+    pool = BlockingConnectionPool.from_url(
+        redis_url(),
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "5")),
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "2")),
+        socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "2")),
+        health_check_interval=30,
+        decode_responses=decode_responses
+    )
+    return Redis(connection_pool=pool)
@@ -0,0 +1,213 @@
+import os
+import time
+import json
+import uuid
+import base64
+import numpy as np
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional
+from redis.exceptions import WatchError
+import logging
+
+from ..metrics import RESPONSE_CACHE_REQUESTS, RESPONSE_CACHE_LATENCY_SAVED, UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Epoch seen by the current request's lookup; its answer may only be cached under that epoch
+_lookup_epoch: ContextVar[Optional[str]] = ContextVar("response_cache_lookup_epoch", default=None)
+
+class SemanticResponseCache:
+    """Redis-backed cache of /query responses keyed on the query embedding.
+
+    Embeddings are bucketed with random-hyperplane LSH so a lookup only
+    compares against the handful of cached queries that share a bucket,
+    then accepts the best candidate above the cosine similarity threshold.
+    All keys live under an epoch that is bumped on invalidation, so stale
+    entries are never served and simply age out through their TTL. A
+    response is stored only if the epoch is still the one its request's
+    lookup saw, checked atomically with the write.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        similarity_threshold: Optional[float] = None,
+        ttl_seconds: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        prefix: str = "rag:cache"
+    ):
+        self.redis_client = redis_client
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.similarity_threshold = similarity_threshold or float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+        self.ttl_seconds = ttl_seconds or int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+        self.prefix = prefix
+        # 8 bands of 12 bits: near-duplicates almost always share a band
+        self.bands = 8
+        self.bits_per_band = 12
+        self._planes: Optional[np.ndarray] = None
+        # Last epoch seen; lookups assume it and retry only when it moved
+        self._epoch = "0"
+
+    @property
+    def epoch(self) -> str:
+        """Ingest epoch as last seen by this worker; changes after every invalidation"""
+        return self._epoch
+
+    def _hyperplanes(self, dimension: int) -> np.ndarray:
+        # Seeded so every worker derives the same buckets
+        if self._planes is None or self._planes.shape[1] != dimension:
+            rng = np.random.default_rng(20240101)
+            self._planes = rng.standard_normal(
+                (self.bands * self.bits_per_band, dimension)
+            ).astype(np.float32)
+        return self._planes
+
+    def _bucket_codes(self, vector: np.ndarray) -> List[int]:
+        bits = (self._hyperplanes(vector.shape[0]) @ vector) > 0
+        weights = 1 << np.arange(self.bits_per_band)
+        return [int(code) for code in bits.reshape(self.bands, self.bits_per_band) @ weights]
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _encode_vector(vector: np.ndarray) -> str:
+        return base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")
+
+    @staticmethod
+    def _decode_vector(data: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+    def _key(self, epoch: str, *parts: Any) -> str:
+        return ":".join([self.prefix, epoch, *[str(p) for p in parts]])
+
+    def _bucket_keys(self, epoch: str, codes: List[int], scope: str = "") -> List[str]:
+        # Scoped entries (e.g. filtered queries) live in their own buckets
+        parts = ["bucket", scope] if scope else ["bucket"]
+        return [self._key(epoch, *parts, band, code) for band, code in enumerate(codes)]
+
+    async def lookup(self, embedding: List[float], scope: str = "") -> Optional[Dict[str, Any]]:
+        """Return the cached response for a semantically equivalent query in the same scope"""
+        if not self.enabled or not embedding:
+            return None
+
+        started = time.perf_counter()
+        try:
+            vector = self._normalize(embedding)
+            codes = self._bucket_codes(vector)
+
+            # Epoch and bucket members in one round-trip, assuming the epoch is unchanged
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.get(f"{self.prefix}:epoch")
+            pipe.sunion(self._bucket_keys(self._epoch, codes, scope))
+            epoch, candidate_ids = await pipe.execute()
+            epoch = epoch or "0"
+            _lookup_epoch.set(epoch)
+            if epoch != self._epoch:
+                self._epoch = epoch
+                candidate_ids = await self.redis_client.sunion(self._bucket_keys(epoch, codes, scope))
+
+            best_entry, best_score = None, self.similarity_threshold
+            if candidate_ids:
+                candidate_ids = list(candidate_ids)
+                pipe = self.redis_client.pipeline(transaction=False)
+                for entry_id in candidate_ids:
+                    pipe.hgetall(self._key(epoch, "entry", entry_id))
+                for entry_id, entry in zip(candidate_ids, await pipe.execute()):
+                    if not entry:
+                        continue
+                    score = float(self._decode_vector(entry["embedding"]) @ vector)
+                    if score >= best_score:
+                        best_entry, best_score = (entry_id, entry), score
+
+            if best_entry is None:
+                RESPONSE_CACHE_REQUESTS.labels(result="miss").inc()
+                return None
+
+            entry_id, entry = best_entry
+            await self.redis_client.zadd(self._key(epoch, "lru"), {entry_id: time.time()})
+            saved_ms = float(entry.get("compute_ms", 0)) - (time.perf_counter() - started) * 1000
+            RESPONSE_CACHE_REQUESTS.labels(result="hit").inc()
+            RESPONSE_CACHE_LATENCY_SAVED.inc(max(saved_ms, 0.0) / 1000)
+
+            return json.loads(entry["response"])
+
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            RESPONSE_CACHE_REQUESTS.labels(result="error").inc()
+            logger.warning(f"Response cache lookup failed: {e}")
+            return None
+
+    async def store(
+        self,
+        embedding: List[float],
+        query: str,
+        response: Dict[str, Any],
+        compute_ms: float,
+        scope: str = ""
+    ):
+        """Cache a response under the query embedding, visible only to lookups in the same scope"""
+        if not self.enabled or not embedding:
+            return
+
+        try:
+            vector = self._normalize(embedding)
+            entry_id = uuid.uuid4().hex
+            epoch_key = f"{self.prefix}:epoch"
+            seen_epoch = _lookup_epoch.get()
+
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                # The write only commits if no invalidation lands between reading the epoch and writing
+                await pipe.watch(epoch_key)
+                epoch = await pipe.get(epoch_key) or "0"
+                if seen_epoch is not None and epoch != seen_epoch:
+                    # Computed from the collection as it was before an ingest
+                    return
+
+                entry_key = self._key(epoch, "entry", entry_id)
+                lru_key = self._key(epoch, "lru")
+                pipe.multi()
+                pipe.hset(entry_key, mapping={
+                    "query": query,
+                    "response": json.dumps(response, default=str),
+                    "embedding": self._encode_vector(vector),
+                    "compute_ms": compute_ms
+                })
+                pipe.expire(entry_key, self.ttl_seconds)
+                for bucket_key in self._bucket_keys(epoch, self._bucket_codes(vector), scope):
+                    pipe.sadd(bucket_key, entry_id)
+                    pipe.expire(bucket_key, self.ttl_seconds)
+                pipe.zadd(lru_key, {entry_id: time.time()})
+                pipe.expire(lru_key, self.ttl_seconds)
+                pipe.zcard(lru_key)
+                entry_count = (await pipe.execute())[-1]
+
+            if entry_count > self.max_entries:
+                await self._evict(epoch, entry_count - self.max_entries)
+
+        except WatchError:
+            # Invalidated while storing; the answer may predate the ingest
+            return
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.warning(f"Response cache store failed: {e}")
+
+    async def _evict(self, epoch: str, overflow: int):
+        """Drop the least recently used entries beyond max_entries"""
+        evicted = await self.redis_client.zpopmin(self._key(epoch, "lru"), overflow)
+        entry_keys = [self._key(epoch, "entry", entry_id) for entry_id, _ in evicted]
+        if entry_keys:
+            # Bucket members pointing at evicted entries are skipped on lookup
+            await self.redis_client.delete(*entry_keys)
+
+    async def invalidate(self):
+        """Invalidate every cached response, e.g. after the collection changes"""
+        try:
+            self._epoch = str(await self.redis_client.incr(f"{self.prefix}:epoch"))
+        except Exception as e:
+            UPSTREAM_ERRORS.labels(dependency="redis").inc()
+            logger.error(f"Response cache invalidation failed: {e}")
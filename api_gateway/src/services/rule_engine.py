@@ -0,0 +1,139 @@
+import re
+from typing import List, Tuple, Iterator, Optional
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+_CATEGORY_CLASSES = {
+    sre_parse.CATEGORY_DIGIT: r'\d',
+    sre_parse.CATEGORY_SPACE: r'\s',
+    sre_parse.CATEGORY_WORD: r'\w',
+}
+
+def _char_class(char: str, ignorecase: bool) -> List[str]:
+    chars = {char, char.swapcase()} if ignorecase else {char}
+    return [re.escape(c) for c in sorted(chars)]
+
+def _leading_chars(pattern, ignorecase: bool) -> Optional[List[str]]:
+    """Character class items a match of the parsed pattern can start with.
+
+    Returns None when that cannot be bounded (e.g. optional first item),
+    in which case no prefilter is used.
+    """
+    for op, av in pattern:
+        if op is sre_parse.AT:
+            # Zero-width anchors such as \b do not consume the first character
+            continue
+        if op is sre_parse.LITERAL:
+            return _char_class(chr(av), ignorecase)
+        if op is sre_parse.IN:
+            items = []
+            for item_op, item_av in av:
+                if item_op is sre_parse.LITERAL:
+                    items += _char_class(chr(item_av), ignorecase)
+                elif item_op is sre_parse.RANGE:
+                    low, high = chr(item_av[0]), chr(item_av[1])
+                    items.append(f"{re.escape(low)}-{re.escape(high)}")
+                    if ignorecase and low.isalpha() and high.isalpha():
+                        items.append(f"{re.escape(low.swapcase())}-{re.escape(high.swapcase())}")
+                elif item_op is sre_parse.CATEGORY and item_av in _CATEGORY_CLASSES:
+                    items.append(_CATEGORY_CLASSES[item_av])
+                else:
+                    return None
+            return items
+        if op is sre_parse.SUBPATTERN:
+            _, add_flags, del_flags, subpattern = av
+            scoped_ignorecase = (ignorecase or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            return _leading_chars(subpattern, scoped_ignorecase)
+        if op is sre_parse.BRANCH:
+            items = []
+            for branch in av[1]:
+                branch_items = _leading_chars(branch, ignorecase)
+                if branch_items is None:
+                    return None
+                items += branch_items
+            return items
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            return _leading_chars(av[2], ignorecase)
+        return None
+    return None
+
+class RuleSet:
+    """Named regex rules compiled into a single alternation.
+
+    Each rule becomes a named group of one pattern, so matching, scanning
+    or stripping every rule costs one pass over the text however many
+    rules are registered. Rules keep their own flags through scoped inline
+    flags, e.g. r'(?s:<script.*?</script>)'.
+
+    The characters any rule can start with are derived from the parsed
+    rules and put in a leading lookahead, so positions that cannot start a
+    match are rejected without trying every alternative.
+    """
+
+    def __init__(self, rules: Optional[List[Tuple[str, str]]] = None, flags: int = re.IGNORECASE):
+        self.flags = flags
+        self._rules: List[Tuple[str, str]] = []
+        self._pattern: Optional[re.Pattern] = None
+        for name, pattern in rules or []:
+            self.add(name, pattern)
+
+    def add(self, name: str, pattern: str) -> "RuleSet":
+        """Register a rule; the combined pattern is rebuilt once, not per call"""
+        if not name.isidentifier():
+            raise ValueError(f"Rule name must be a valid identifier: {name}")
+        if any(existing == name for existing, _ in self._rules):
+            raise ValueError(f"Duplicate rule name: {name}")
+
+        # Compile on its own first so a bad rule is reported by name
+        re.compile(pattern, self.flags)
+        self._rules.append((name, pattern))
+        self._pattern = self._compile()
+        return self
+
+    def _compile(self) -> re.Pattern:
+        alternation = "|".join(f"(?P<{name}>{pattern})" for name, pattern in self._rules)
+
+        leading = []
+        for _, pattern in self._rules:
+            items = _leading_chars(sre_parse.parse(pattern, self.flags), bool(self.flags & re.IGNORECASE))
+            if items is None:
+                return re.compile(alternation, self.flags)
+            leading += items
+
+        char_class = "".join(dict.fromkeys(leading))
+        return re.compile(f"(?=[{char_class}])(?:{alternation})", self.flags)
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _ in self._rules]
+
+    @property
+    def pattern(self) -> Optional[str]:
+        return self._pattern.pattern if self._pattern else None
+
+    def finditer(self, text: str) -> Iterator[Tuple[str, re.Match]]:
+        """Yield (rule name, match) for every non-overlapping match, left to right"""
+        if self._pattern is None:
+            return
+        for match in self._pattern.finditer(text):
+            yield match.lastgroup, match
+
+    def search(self, text: str) -> Optional[str]:
+        """Name of the leftmost matching rule, if any"""
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(text)
+        return match.lastgroup if match else None
+
+    def sub(self, text: str, replacement: str = "") -> str:
+        """Replace every match of every rule in one pass"""
+        return self.subn(text, replacement)[0]
+
+    def subn(self, text: str, replacement: str = "") -> Tuple[str, int]:
+        """Like sub, also returning the number of replacements made"""
+        if self._pattern is None:
+            return text, 0
+        return self._pattern.subn(replacement, text)
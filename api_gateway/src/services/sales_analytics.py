@@ -0,0 +1,83 @@
+from datetime import date
+from typing import List, Dict, Any, Optional
+import logging
+
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+class SalesAnalytics:
+    """Read access to the sales rollups kept by database/scripts/refresh_rollups.py.
+
+    agent_performance holds one row per agent and day and commercial_metrics
+    one row per agent, metric and month, so these queries read a few index
+    ranges instead of aggregating raw_sales_data.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+
+    async def agent_performance(
+        self,
+        date_from: date,
+        date_to: date,
+        agent_ids: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Sales totals per agent over a period, best first"""
+        return await self.database.fetch_all(
+            """
+            SELECT
+                agent_id,
+                SUM(sales_total) AS total_sales,
+                SUM(transaction_count) AS total_transactions,
+                ROUND(SUM(sales_total) / NULLIF(SUM(transaction_count), 0), 2) AS avg_transaction
+            FROM agent_performance
+            WHERE performance_date BETWEEN %s AND %s
+                AND (%s::text[] IS NULL OR agent_id = ANY(%s::text[]))
+            GROUP BY agent_id
+            ORDER BY total_sales DESC
+            """,
+            (date_from, date_to, agent_ids, agent_ids)
+        )
+
+    async def commercial_metrics(
+        self,
+        date_from: date,
+        date_to: date,
+        agent_ids: Optional[List[str]] = None,
+        metric_types: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Monthly metrics whose period lies within date_from and date_to"""
+        return await self.database.fetch_all(
+            """
+            SELECT agent_id, metric_type, metric_value, period_start, period_end, calculation_date
+            FROM commercial_metrics
+            WHERE period_start >= %s AND period_end <= %s
+                AND (%s::text[] IS NULL OR agent_id = ANY(%s::text[]))
+                AND (%s::text[] IS NULL OR metric_type = ANY(%s::text[]))
+            ORDER BY period_start, agent_id, metric_type
+            """,
+            (date_from, date_to, agent_ids, agent_ids, metric_types, metric_types)
+        )
+
+    async def quota_alerts(self, day: date, threshold: float = 50.0) -> List[Dict[str, Any]]:
+        """Agents with a target whose sales on day are below threshold percent of it"""
+        return await self.database.fetch_all(
+            """
+            SELECT agent_id, sales_total AS current_sales, target_total, quota_percentage
+            FROM agent_performance
+            WHERE performance_date = %s AND target_total > 0 AND quota_percentage < %s
+            ORDER BY quota_percentage
+            """,
+            (day, threshold)
+        )
+
+    async def rollup_status(self) -> Optional[Dict[str, Any]]:
+        """Last refresh of the rollups, or None before the first one"""
+        rows = await self.database.fetch_all(
+            """
+            SELECT high_water_mark::text AS high_water_mark, refreshed_at, last_groups_refreshed
+            FROM rollup_state WHERE rollup_name = 'sales'
+            """
+        )
+        return rows[0] if rows else None
@@ -0,0 +1,46 @@
+import re
+import math
+from typing import Iterator, Tuple
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to the estimate below
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Words, numbers and single punctuation marks, matched lazily over the text
+_SPAN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_encoding = None
+
+def _get_encoding():
+    global _encoding, tiktoken
+    if _encoding is None and tiktoken is not None:
+        try:
+            # gpt-4-turbo and text-embedding-3 models share cl100k_base
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # The BPE file is downloaded on first use and may be unreachable
+            logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+            tiktoken = None
+    return _encoding
+
+def span_tokens(length: int) -> int:
+    """Estimated BPE tokens in a word of the given length (about 4 characters per token)"""
+    return max(1, math.ceil(length / 4))
+
+def iter_token_spans(text: str, start: int = 0) -> Iterator[Tuple[int, int, int]]:
+    """Yield (start, end, estimated tokens) for each word or punctuation mark, without copying the text"""
+    for match in _SPAN_PATTERN.finditer(text, start):
+        yield match.start(), match.end(), span_tokens(match.end() - match.start())
+
+def estimate_tokens(text: str) -> int:
+    return sum(tokens for _, _, tokens in iter_token_spans(text))
+
+def count_tokens(text: str) -> int:
+    """Tokens in text for the chat models, exact when tiktoken is available"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
@@ -0,0 +1,504 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class VectorStore(ABC):
+    """Storage and cosine top-k search over document embeddings.
+
+    Methods are synchronous; async callers run them through
+    asyncio.to_thread. Query results use Chroma's layout (one list per
+    query embedding under ids, documents, metadatas and distances) so
+    backends are interchangeable.
+    """
+
+    backend = "vector_store"
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ):
+        """Insert documents or replace those with the same id"""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include_embeddings: bool = False
+    ) -> Dict[str, List[List[Any]]]:
+        """Nearest documents by cosine distance, optionally filtered on metadata"""
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        include_embeddings: bool = False,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, List[Any]]:
+        """Stored documents by id, by metadata filter, or a page of all documents; flat ids/documents/metadatas lists"""
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """Remove documents by id; unknown ids are ignored"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored documents"""
+
+    def persist(self):
+        """Flush pending changes to durable storage, if the backend keeps any locally"""
+
+    def close(self):
+        self.persist()
+
+class ChromaVectorStore(VectorStore):
+    """Collection on a Chroma server"""
+
+    backend = "chroma"
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, collection: str = "commercial_data"):
+        import chromadb
+
+        self.client = chromadb.HttpClient(
+            host=host or os.getenv("CHROMA_HOST", "chromadb"),
+            port=port or int(os.getenv("CHROMA_PORT", "8000"))
+        )
+        self.collection = self.client.get_or_create_collection(
+            collection,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def query(self, query_embeddings, n_results=10, where=None, include_embeddings=False):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where or None,
+            include=["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+        )
+
+    def get(self, ids=None, limit=None, offset=0, include_embeddings=False, where=None):
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        if ids is not None:
+            return self.collection.get(ids=ids, where=where or None, include=include)
+        return self.collection.get(limit=limit, offset=offset, where=where or None, include=include)
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+def _compare(value: Any, condition: Any) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+
+    for operator, operand in condition.items():
+        try:
+            if operator == "$eq":
+                ok = value == operand
+            elif operator == "$ne":
+                ok = value != operand
+            elif operator == "$in":
+                ok = value in operand
+            elif operator == "$nin":
+                ok = value not in operand
+            elif operator == "$gt":
+                ok = value is not None and value > operand
+            elif operator == "$gte":
+                ok = value is not None and value >= operand
+            elif operator == "$lt":
+                ok = value is not None and value < operand
+            elif operator == "$lte":
+                ok = value is not None and value <= operand
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+        except TypeError:
+            # Mismatched types never match, as in Chroma
+            ok = False
+        if not ok:
+            return False
+    return True
+
+def matches_where(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Chroma-style where filter against one metadata dict"""
+    if not where:
+        return True
+
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif not _compare(metadata.get(key), condition):
+            return False
+    return True
+
+class NumpyVectorStore(VectorStore):
+    """In-process index over one contiguous matrix of unit-normalized rows.
+
+    A query is a single matrix-vector product plus argpartition, which for
+    collections up to a few hundred thousand documents is faster than the
+    network round-trip to a vector database. Rows are stored normalized,
+    so the dot product is the cosine similarity. Deletes move the last
+    row into the freed slot to keep the matrix dense.
+
+    With quantization set to float16 or int8 (one scale per row), the
+    search matrix holds 2 or 4 times fewer bytes. Candidates are scored on
+    it, then a shortlist of rescore_factor * n_results rows is re-scored at
+    full precision. Full-precision rows are read from the memory-mapped
+    vectors.npy, so only rows changed since the last persist stay in RAM
+    (without a path every row does). int8 also scores faster than float32;
+    float16 only saves memory, as NumPy converts it in software.
+
+    Changing the embedding dimension requires rebuilding the index.
+
+    With a path, the index is loaded from and persisted to that directory
+    as vectors.npy plus records.json, and other workers pick up a newer
+    copy within refresh_seconds. Each persist rewrites the whole index, so
+    only one process may ingest into a path; another writer's rows would
+    be overwritten.
+    """
+
+    backend = "numpy"
+    quantizations = ("none", "float16", "int8")
+    # Rows upcast to float32 at a time when scoring a quantized matrix;
+    # small blocks stay cache-resident, large ones are bandwidth-bound
+    score_chunk_rows = 2048
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        quantization: str = "none",
+        rescore_factor: int = 4,
+        refresh_seconds: float = 30.0
+    ):
+        if quantization not in self.quantizations:
+            raise ValueError(f"Unknown quantization: {quantization}")
+
+        self.path = path
+        self.quantization = quantization
+        self.rescore_factor = max(rescore_factor, 1)
+        self.refresh_seconds = refresh_seconds
+        self._dtype = {"none": np.float32, "float16": np.float16, "int8": np.int8}[quantization]
+        self._lock = threading.RLock()
+        self._matrix = np.empty((0, 0), dtype=self._dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._size = 0
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        # Full-precision rows of a quantized index: persisted ones on disk,
+        # rows written since the last persist in memory
+        self._full_disk: Optional[np.ndarray] = None
+        self._full_pending: Dict[int, np.ndarray] = {}
+        self._dirty = False
+        self._loaded_mtime = 0.0
+        self._checked_at = 0.0
+
+        if path:
+            self._load()
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization != "none"
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    def _quantize(self, vectors: np.ndarray):
+        """Search matrix rows and their scales for normalized float32 vectors"""
+        if self.quantization == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(self._dtype), np.ones(len(vectors), dtype=np.float32)
+
+    def _full_row(self, row: int) -> np.ndarray:
+        pending = self._full_pending.get(row)
+        return pending if pending is not None else np.asarray(self._full_disk[row], dtype=np.float32)
+
+    def _full_rows(self, rows: np.ndarray) -> np.ndarray:
+        if not self.quantized:
+            return self._matrix[rows]
+        return np.vstack([self._full_row(int(row)) for row in rows])
+
+    def _reserve(self, rows: int, dimension: int):
+        if self._size == 0 and self._matrix.shape[1] != dimension:
+            self._matrix = np.empty((0, dimension), dtype=self._dtype)
+        elif self._matrix.shape[1] != dimension:
+            raise ValueError(f"Embedding dimension {dimension} does not match index dimension {self._matrix.shape[1]}")
+
+        needed = self._size + rows
+        if needed > self._matrix.shape[0]:
+            # Grow geometrically so repeated batches amortize the copy
+            capacity = max(needed, 2 * self._matrix.shape[0], 1024)
+            grown = np.empty((capacity, dimension), dtype=self._dtype)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        codes, scales = self._quantize(vectors)
+        with self._lock:
+            new_ids = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in self._rows]
+            self._reserve(len(new_ids), vectors.shape[1])
+
+            for doc_id in new_ids:
+                self._rows[doc_id] = self._size
+                self._ids.append(doc_id)
+                self._documents.append("")
+                self._metadatas.append({})
+                self._size += 1
+
+            rows = [self._rows[doc_id] for doc_id in ids]
+            self._matrix[rows] = codes
+            self._scales[rows] = scales
+            for row, vector, document, metadata in zip(rows, vectors, documents, metadatas):
+                if self.quantized:
+                    self._full_pending[row] = vector
+                self._documents[row] = document
+                self._metadatas[row] = dict(metadata or {})
+            self._dirty = True
+
+    def delete(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                row = self._rows.pop(doc_id, None)
+                if row is None:
+                    continue
+
+                last = self._size - 1
+                if row != last:
+                    self._matrix[row] = self._matrix[last]
+                    self._scales[row] = self._scales[last]
+                    if self.quantized:
+                        self._full_pending[row] = self._full_row(last)
+                    self._ids[row] = self._ids[last]
+                    self._documents[row] = self._documents[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+
+                self._full_pending.pop(last, None)
+                self._ids.pop()
+                self._documents.pop()
+                self._metadatas.pop()
+                self._size = last
+                self._dirty = True
+
+    def count(self) -> int:
+        self._maybe_reload()
+        return self._size
+
+    def get(self, ids=None, limit=None, offset=0, include_embeddings=False, where=None):
+        self._maybe_reload()
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+            else:
+                rows = range(self._size)
+            if where:
+                rows = [row for row in rows if matches_where(self._metadatas[row], where)]
+            if ids is None:
+                rows = list(rows)[offset:None if limit is None else offset + limit]
+
+            results = {
+                "ids": [self._ids[row] for row in rows],
+                "documents": [self._documents[row] for row in rows],
+                "metadatas": [self._metadatas[row] for row in rows]
+            }
+            if include_embeddings:
+                vectors = self._full_rows(np.asarray(rows, dtype=np.int64)) if rows else np.empty((0, 0))
+                results["embeddings"] = vectors.astype(np.float32).tolist()
+        return results
+
+    def _scores(self, queries: np.ndarray, candidates: Optional[np.ndarray]) -> np.ndarray:
+        """Similarity of every candidate row to every query, shape (rows, queries)"""
+        if not self.quantized:
+            vectors = self._matrix[:self._size] if candidates is None else self._matrix[candidates]
+            return vectors @ queries.T
+
+        total = self._size if candidates is None else len(candidates)
+        scores = np.empty((total, len(queries)), dtype=np.float32)
+        # Upcast in chunks so a query never materializes a float32 copy of the index
+        for start in range(0, total, self.score_chunk_rows):
+            end = min(start + self.score_chunk_rows, total)
+            rows = slice(start, end) if candidates is None else candidates[start:end]
+            block = self._matrix[rows].astype(np.float32)
+            scores[start:end] = (block @ queries.T) * self._scales[rows][:, None]
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+            return top[np.argsort(-scores[top])]
+        return np.argsort(-scores)
+
+    def query(self, query_embeddings, n_results=10, where=None, include_embeddings=False):
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if include_embeddings:
+            results["embeddings"] = []
+        if not query_embeddings:
+            return results
+
+        self._maybe_reload()
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            candidates = None
+            if where:
+                candidates = np.fromiter(
+                    (i for i, metadata in enumerate(self._metadatas) if matches_where(metadata, where)),
+                    dtype=np.int64
+                )
+
+            total = self._size if candidates is None else len(candidates)
+            if total and queries.shape[1] != self._matrix.shape[1]:
+                raise ValueError(f"Query dimension {queries.shape[1]} does not match index dimension {self._matrix.shape[1]}")
+
+            scores = self._scores(queries, candidates) if total else np.empty((0, len(queries)), dtype=np.float32)
+            k = min(n_results, total)
+            shortlist_size = min(k * self.rescore_factor, total) if self.quantized else k
+
+            for column, query in enumerate(queries):
+                top = self._top(scores[:, column], shortlist_size)
+                rows = top if candidates is None else candidates[top]
+                similarities = scores[top, column]
+
+                if self.quantized and len(rows):
+                    similarities = self._full_rows(rows) @ query
+                    order = self._top(similarities, k)
+                    rows, similarities = rows[order], similarities[order]
+
+                results["ids"].append([self._ids[row] for row in rows])
+                results["documents"].append([self._documents[row] for row in rows])
+                results["metadatas"].append([self._metadatas[row] for row in rows])
+                results["distances"].append([float(1.0 - similarity) for similarity in similarities])
+                if include_embeddings:
+                    vectors = self._full_rows(rows) if len(rows) else np.empty((0, queries.shape[1]))
+                    results["embeddings"].append(vectors.astype(np.float32).tolist())
+
+        return results
+
+    def _files(self):
+        return os.path.join(self.path, "vectors.npy"), os.path.join(self.path, "records.json")
+
+    def _maybe_reload(self):
+        if not self.path or self._dirty or time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+
+        self._checked_at = time.monotonic()
+        try:
+            if os.path.getmtime(self._files()[1]) > self._loaded_mtime:
+                self._load()
+        except OSError:
+            pass
+
+    def _load(self):
+        vectors_file, records_file = self._files()
+        if not os.path.exists(vectors_file) or not os.path.exists(records_file):
+            return
+
+        mtime = os.path.getmtime(records_file)
+        with open(records_file, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        full = np.load(vectors_file, mmap_mode="r")
+        size = len(records["ids"])
+        if full.shape[0] != size:
+            # Caught between a writer's two file swaps; the next check loads the finished pair
+            return
+
+        matrix = np.empty((size, full.shape[1]), dtype=self._dtype)
+        scales = np.ones(size, dtype=np.float32)
+        for start in range(0, size, self.score_chunk_rows):
+            end = min(start + self.score_chunk_rows, size)
+            matrix[start:end], scales[start:end] = self._quantize(np.asarray(full[start:end], dtype=np.float32))
+
+        with self._lock:
+            self._ids = records["ids"]
+            self._documents = records["documents"]
+            self._metadatas = records["metadatas"]
+            self._size = size
+            self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._matrix, self._scales = matrix, scales
+            self._full_disk = full if self.quantized else None
+            self._full_pending.clear()
+            self._loaded_mtime = mtime
+            self._dirty = False
+        logger.info(f"Loaded {self._size} vectors from {self.path} ({self.quantization} quantization)")
+
+    def persist(self):
+        if not self.path or not self._dirty:
+            return
+
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            vectors_file, records_file = self._files()
+            dimension = self._matrix.shape[1]
+
+            # Write side files first and swap them in, so a crash never leaves a torn index
+            full = np.lib.format.open_memmap(
+                vectors_file + ".tmp", mode="w+", dtype=np.float32, shape=(self._size, dimension)
+            )
+            if not self.quantized:
+                full[:] = self._matrix[:self._size]
+            else:
+                if self._full_disk is not None:
+                    persisted = min(self._size, self._full_disk.shape[0])
+                    full[:persisted] = self._full_disk[:persisted]
+                for row, vector in self._full_pending.items():
+                    full[row] = vector
+            full.flush()
+            del full
+
+            with open(records_file + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}, f)
+            os.replace(vectors_file + ".tmp", vectors_file)
+            os.replace(records_file + ".tmp", records_file)
+            self._loaded_mtime = os.path.getmtime(records_file)
+
+            if self.quantized:
+                self._full_disk = np.load(vectors_file, mmap_mode="r")
+                self._full_pending.clear()
+            self._dirty = False
+
+def create_vector_store() -> VectorStore:
+    """Vector store selected by VECTOR_STORE_BACKEND (chroma or numpy)"""
+    backend = os.getenv("VECTOR_STORE_BACKEND", "chroma").lower()
+    if backend == "numpy":
+        return NumpyVectorStore(
+            path=os.getenv("VECTOR_STORE_PATH") or None,
+            quantization=os.getenv("VECTOR_STORE_QUANTIZATION", "none").lower(),
+            rescore_factor=int(os.getenv("VECTOR_STORE_RESCORE_FACTOR", "4"))
+        )
+    if backend == "chroma":
+        return ChromaVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
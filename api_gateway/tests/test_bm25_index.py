@@ -0,0 +1,29 @@
+from src.services.bm25_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+def test_tokenize_keeps_identifiers_whole():
+    """Test that agent ids and SKUs are indexed whole and by their parts"""
+    assert tokenize("Agent AG-042 sold SKU_1234") == ["agent", "ag-042", "ag", "042", "sold", "sku_1234", "sku", "1234"]
+
+def test_search_ranks_exact_terms_and_tracks_updates(tmp_path):
+    """Test BM25 ranking, replacement, deletion and persistence"""
+    index = BM25Index(path=str(tmp_path / "bm25.json"))
+    index.upsert(
+        ["a", "b", "c"],
+        ["Sales report for region EU-WEST", "Agent AG-042 closed 12 deals", "Quarterly sales summary"]
+    )
+
+    assert index.search("how did AG-042 do", 2)[0][0] == "b"
+
+    index.upsert(["b"], ["Agent AG-077 closed 3 deals"])
+    index.delete(["c"])
+    assert index.search("042") == []
+    index.persist()
+
+    reloaded = BM25Index(path=str(tmp_path / "bm25.json"))
+    assert reloaded.count() == 2
+    assert {doc_id for doc_id, _ in reloaded.search("ag-077 eu-west")} == {"a", "b"}
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    """Test that documents ranked by both retrievers come first"""
+    fused = reciprocal_rank_fusion([["x", "y", "z"], ["y", "w"]])
+    assert [doc_id for doc_id, _ in fused] == ["y", "x", "w", "z"]
@@ -0,0 +1,29 @@
+import pytest
+
+from src.services.chunker import Chunker
+
+def test_chunks_respect_size_overlap_and_offsets():
+    """Test that chunks cover the text in order, overlap, and carry their source offsets"""
+    text = " ".join(f"word{i}" for i in range(100))
+    chunker = Chunker(chunk_tokens=20, overlap_tokens=4)
+
+    chunks = list(chunker.iter_chunks(text))
+
+    assert len(chunks) > 1
+    for start, end, chunk in chunks:
+        assert text[start:end] == chunk
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(text)
+    # Each chunk starts inside the previous one
+    assert all(b[0] < a[1] for a, b in zip(chunks, chunks[1:]))
+
+def test_chunks_are_generated_lazily():
+    """Test that the first chunk of a large document is available without splitting the rest"""
+    chunker = Chunker(chunk_tokens=50, overlap_tokens=0)
+    chunks = chunker.iter_chunks("revenue " * 1_000_000)
+
+    start, end, first = next(chunks)
+    assert start == 0 and first.startswith("revenue")
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        Chunker(chunk_tokens=10, overlap_tokens=10)
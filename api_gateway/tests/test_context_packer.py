@@ -0,0 +1,30 @@
+from src.services.context_packer import ContextPacker
+
+WEEKLY = "Weekly report for the north region: revenue reached 120k with 14 new accounts and churn stable at 2 percent."
+
+def chunk(content, score):
+    return {"content": content, "source": "crm", "relevance_score": score}
+
+def test_near_duplicates_are_dropped_in_relevance_order():
+    """Test that a near-identical chunk is skipped and the more relevant copy kept"""
+    packer = ContextPacker(token_budget=1000)
+    chunks = [
+        chunk(WEEKLY, 0.9),
+        chunk(WEEKLY.replace("120k", "121k"), 0.85),
+        chunk("South region pipeline grew after the spring campaign.", 0.8)
+    ]
+
+    selected, saved = packer.pack(chunks)
+
+    assert [c["relevance_score"] for c in selected] == [0.9, 0.8]
+    assert saved["duplicate"] > 0 and saved["budget"] == 0
+
+def test_budget_is_never_exceeded():
+    """Test that chunks past the budget are skipped while smaller ones still fit"""
+    packer = ContextPacker(token_budget=60)
+    chunks = [chunk(WEEKLY, 0.9), chunk(" ".join(["pipeline"] * 200), 0.8), chunk("Q3 closed at 1.2M.", 0.7)]
+
+    selected, saved = packer.pack(chunks)
+
+    assert [c["relevance_score"] for c in selected] == [0.9, 0.7]
+    assert saved["budget"] > 0
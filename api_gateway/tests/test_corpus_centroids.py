@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from unittest.mock import Mock, AsyncMock
+
+from src.services.corpus_centroids import CorpusCentroids
+from src.services.rag_service import RAGService
+from src.services.vector_store import NumpyVectorStore
+from tests.test_response_cache import FakeRedis
+
+class CentroidRedis(FakeRedis):
+    """FakeRedis with HDEL, and an optional write by another worker between a read and its commit"""
+
+    def __init__(self):
+        super().__init__()
+        self.concurrent_writes = []
+
+    async def hgetall(self, key):
+        stored = await super().hgetall(key)
+        if self.concurrent_writes:
+            await super().hset(key, self.concurrent_writes.pop(0))
+        return stored
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+
+def _stored(centroids, redis_client):
+    return {
+        doc_type: (np.round(total.astype(float), 6).tolist(), count)
+        for doc_type, (total, count) in (
+            (doc_type, centroids._decode(value)) for doc_type, value in redis_client.data.get(centroids.key, {}).items()
+        )
+    }
+
+@pytest.mark.asyncio
+async def test_concurrent_update_is_retried_instead_of_lost():
+    """Test that a batch committed between another batch's read and write survives both"""
+    redis_client = CentroidRedis()
+    centroids = CorpusCentroids(redis_client)
+    other = CorpusCentroids(redis_client)
+    redis_client.concurrent_writes.append({"report": other._encode(np.asarray([0.0, 1.0], dtype=np.float32), 1)})
+
+    await centroids.add([[2.0, 0.0]], ["report"])
+
+    assert _stored(centroids, redis_client) == {"report": ([1.0, 1.0], 2)}
+
+@pytest.mark.asyncio
+async def test_removing_every_vector_of_a_type_drops_its_centroid():
+    """Test that subtraction undoes addition and empties types instead of keeping zero vectors"""
+    redis_client = CentroidRedis()
+    centroids = CorpusCentroids(redis_client)
+
+    await centroids.add([[3.0, 4.0], [0.0, 1.0]], ["report", "memo"])
+    await centroids.remove([[0.0, 2.0]], ["memo"])
+
+    assert _stored(centroids, redis_client) == {"report": ([0.6, 0.8], 1)}
+
+@pytest.mark.asyncio
+async def test_reingest_and_prune_subtract_replaced_chunks():
+    """Test that centroids follow the store when documents are rewritten, shrink, or disappear"""
+    redis_client = CentroidRedis()
+    centroids = CorpusCentroids(redis_client)
+    vector_store = NumpyVectorStore()
+    embedding_service = Mock(generate_embeddings=AsyncMock(
+        side_effect=lambda texts: [[1.0, 0.0] if "north" in text else [0.0, 1.0] for text in texts]
+    ))
+    document_registry = Mock(get_hashes=AsyncMock(return_value={}), upsert=AsyncMock(), delete=AsyncMock())
+    rag_service = RAGService(
+        llm_client=Mock(), embedding_service=embedding_service, vector_store=vector_store,
+        document_registry=document_registry, corpus_centroids=centroids
+    )
+
+    await rag_service.ingest_documents([
+        {"id": "a", "content": "north sales", "type": "report"},
+        {"id": "b", "content": "north margins", "type": "report"}
+    ])
+    await rag_service.ingest_documents([{"id": "a", "content": "south sales", "type": "report"}])
+    assert _stored(centroids, redis_client) == {"report": ([1.0, 1.0], 2)}
+
+    document_registry.find_missing = AsyncMock(return_value=["b"])
+    await rag_service.ingest_documents([{"id": "a", "content": "south sales", "type": "report"}], prune_missing=True)
+    assert _stored(centroids, redis_client) == {"report": ([0.0, 1.0], 1)}
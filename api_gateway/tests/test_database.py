@@ -0,0 +1,45 @@
+import time
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock
+from psycopg2.pool import PoolError
+
+from src.services.database import Database
+
+class ExhaustiblePool:
+    """Stand-in for ThreadedConnectionPool: raises PoolError when every connection is out"""
+
+    def __init__(self, maxconn):
+        self.maxconn = maxconn
+        self.in_use = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        with self.lock:
+            if self.in_use >= self.maxconn:
+                raise PoolError("connection pool exhausted")
+            self.in_use += 1
+            self.peak = max(self.peak, self.in_use)
+
+        conn = MagicMock(closed=0)
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = lambda sql, params: time.sleep(0.02)
+        cursor.fetchall.return_value = [{"value": 1}]
+        return conn
+
+    def putconn(self, conn, close=False):
+        with self.lock:
+            self.in_use -= 1
+
+@pytest.mark.asyncio
+async def test_calls_beyond_pool_size_wait_for_a_connection():
+    """Test that more concurrent queries than connections queue instead of failing"""
+    database = Database(max_connections=2)
+    database.pool = ExhaustiblePool(maxconn=2)
+    
+    results = await asyncio.gather(*[database.fetch_all("SELECT 1") for _ in range(8)])
+    
+    assert results == [[{"value": 1}]] * 8
+    assert database.pool.peak == 2
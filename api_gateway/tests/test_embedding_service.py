@@ -0,0 +1,41 @@
+import pytest
+import numpy as np
+from unittest.mock import Mock, AsyncMock
+
+from src.services.embedding_service import EmbeddingService
+
+@pytest.mark.asyncio
+async def test_batch_only_fetches_misses_in_original_order():
+    """Test that cached texts are not re-embedded and results keep input order"""
+    llm_client = Mock(create_embeddings=AsyncMock(
+        side_effect=lambda texts, model: [[float(len(text)), 0.0] for text in texts]
+    ))
+    service = EmbeddingService(llm_client=llm_client)
+
+    await service.generate_embeddings(["aa", "bbb"])
+    embeddings = await service.generate_embeddings(["c", "aa", "c", "bbb"])
+
+    assert embeddings == [[1.0, 0.0], [2.0, 0.0], [1.0, 0.0], [3.0, 0.0]]
+    assert llm_client.create_embeddings.await_args_list[1].args[0] == ["c"]
+
+@pytest.mark.asyncio
+async def test_redis_tier_hit_skips_api():
+    """Test that vectors found in Redis are decoded from float32 bytes"""
+    llm_client = Mock(create_embeddings=AsyncMock())
+    redis_client = Mock(mget=AsyncMock(return_value=[np.array([0.5, 0.25], dtype=np.float32).tobytes()]))
+    service = EmbeddingService(llm_client=llm_client, redis_client=redis_client)
+
+    assert await service.generate_single_embedding("q3 revenue") == [0.5, 0.25]
+    llm_client.create_embeddings.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_configured_dimensions_are_requested(monkeypatch):
+    """Test that EMBEDDING_DIMENSIONS shortens embeddings and reports the active dimension"""
+    monkeypatch.setenv("EMBEDDING_DIMENSIONS", "256")
+    llm_client = Mock(create_embeddings=AsyncMock(return_value=[[0.1] * 256]))
+    service = EmbeddingService(llm_client=llm_client)
+
+    await service.generate_single_embedding("q3 revenue")
+
+    assert service.get_embedding_dimension() == 256
+    assert llm_client.create_embeddings.await_args.kwargs["dimensions"] == 256
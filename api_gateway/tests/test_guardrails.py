@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import Mock, AsyncMock
+
+from src.services.guardrails import GuardrailsService
+
+def make_guardrails(similarity=None, llm_verdict="RELEVANT"):
+    llm_client = Mock(chat_completion=AsyncMock(return_value=llm_verdict))
+    centroids = Mock(max_similarity=AsyncMock(return_value=similarity))
+    return GuardrailsService(llm_client=llm_client, corpus_centroids=centroids), llm_client
+
+@pytest.mark.asyncio
+async def test_lexical_tier_skips_llm():
+    """Test that queries with commercial vocabulary are accepted locally"""
+    guardrails, llm_client = make_guardrails()
+
+    assert await guardrails.check_relevance("Q3 revenue by region", query_embedding=[0.1])
+    llm_client.chat_completion.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_lexical_tier_matches_whole_words_and_plurals():
+    """Test that commercial terms match as words, plurals included, but not inside other words"""
+    guardrails, llm_client = make_guardrails(similarity=0.3, llm_verdict="NOT_RELEVANT")
+
+    assert await guardrails.check_relevance("top agents this month", query_embedding=[0.1])
+    assert await guardrails.check_relevance("ROI by channel", query_embedding=[0.1])
+    llm_client.chat_completion.assert_not_awaited()
+
+    assert not await guardrails.check_relevance("why is the sea roiling", query_embedding=[0.1])
+    assert not await guardrails.check_relevance("the agenda for friday", query_embedding=[0.1])
+    assert llm_client.chat_completion.await_count == 2
+
+@pytest.mark.asyncio
+async def test_centroid_tier_decides_clear_cases():
+    """Test that centroid similarity outside the ambiguous band skips the LLM"""
+    guardrails, llm_client = make_guardrails(similarity=0.05)
+
+    assert not await guardrails.check_relevance("what is the weather in Rome", query_embedding=[0.1])
+    llm_client.chat_completion.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_ambiguous_query_falls_back_to_llm_once():
+    """Test that ambiguous queries reach the LLM and the verdict is remembered"""
+    guardrails, llm_client = make_guardrails(similarity=0.3, llm_verdict="NOT_RELEVANT")
+
+    assert not await guardrails.check_relevance("how did Marco do", query_embedding=[0.1])
+    assert not await guardrails.check_relevance("How did  Marco do", query_embedding=[0.1])
+    llm_client.chat_completion.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_sanitize_strips_every_rule_in_one_pass():
+    """Test that the compiled rule set strips scripts and SQL patterns, including spliced ones"""
+    guardrails, _ = make_guardrails()
+
+    sanitized = await guardrails.sanitize_input(
+        "<script>alert(1)</script>revenue' or '1=1 SELECT * java<script></script>script:x"
+    )
+    assert sanitized == "revenue * x"
+
+@pytest.mark.asyncio
+async def test_sanitize_rejects_oversized_input_before_stripping():
+    """Test that an overlong query is refused without running the rule set over it"""
+    guardrails, _ = make_guardrails()
+    guardrails.sanitize_rules = Mock()
+
+    with pytest.raises(ValueError, match="too long"):
+        await guardrails.sanitize_input("<script></script>" * 100)
+    guardrails.sanitize_rules.subn.assert_not_called()
+
+def test_hallucination_requires_unattributed_claim():
+    """Test that specific claims are flagged only when no source is given"""
+    guardrails, _ = make_guardrails()
+
+    assert not guardrails._detect_hallucination("Revenue grew steadily last quarter.")
+    assert guardrails._detect_hallucination("Revenue grew exactly 42 percent on 2024-03-28.")
+    assert not guardrails._detect_hallucination("According to the Q1 report, revenue grew exactly 42 percent.")
+
+    guardrails.add_claim_rule("per_report", r"per the \w+ report", attribution=True)
+    assert not guardrails._detect_hallucination("Per the Q1 report, revenue grew exactly 42 percent.")
+
+@pytest.mark.asyncio
+async def test_remembered_verdicts_are_dropped_after_an_ingest():
+    """Test that a new ingest epoch sends previously classified queries through the tiers again"""
+    llm_client = Mock(chat_completion=AsyncMock(return_value="NOT_RELEVANT"))
+    response_cache = Mock(epoch="0")
+    guardrails = GuardrailsService(llm_client=llm_client, response_cache=response_cache)
+
+    assert not await guardrails.check_relevance("how did Marco do")
+    assert not await guardrails.check_relevance("how did Marco do")
+    llm_client.chat_completion.assert_awaited_once()
+
+    response_cache.epoch = "1"
+    llm_client.chat_completion.return_value = "RELEVANT"
+    assert await guardrails.check_relevance("how did Marco do")
+    assert llm_client.chat_completion.await_count == 2
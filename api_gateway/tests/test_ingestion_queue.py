@@ -0,0 +1,69 @@
+import json
+import pytest
+from unittest.mock import Mock, AsyncMock
+
+from src.services.ingestion_queue import IngestionQueue, QueueFullError
+
+def _redis(execute_result):
+    pipe = Mock(execute=AsyncMock(return_value=execute_result))
+    return Mock(pipeline=Mock(return_value=pipe)), pipe
+
+@pytest.mark.asyncio
+async def test_submit_rejects_past_max_depth():
+    redis_client, pipe = _redis([True, 5, True, 3])
+    # Another submission got in between the pre-check and the push
+    redis_client.llen = AsyncMock(return_value=1)
+    queue = IngestionQueue(redis_client, rag_service=Mock(), max_depth=2)
+    
+    with pytest.raises(QueueFullError):
+        await queue.submit([{"id": "doc1", "content": "x"}])
+    
+    # The job that overflowed the queue is taken back out
+    pipe.lrem.assert_called_once()
+    pipe.delete.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_submit_to_full_queue_uploads_nothing():
+    """Test that a queue already at max_depth rejects before writing the payload"""
+    redis_client, pipe = _redis([])
+    redis_client.llen = AsyncMock(return_value=2)
+    queue = IngestionQueue(redis_client, rag_service=Mock(), max_depth=2)
+    
+    with pytest.raises(QueueFullError):
+        await queue.submit([{"id": "doc1", "content": "x" * 1000}])
+    
+    redis_client.pipeline.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_run_job_records_outcome_and_invalidates_cache():
+    redis_client, pipe = _redis([True, 1])
+    redis_client.get = AsyncMock(return_value=json.dumps([{"id": "doc1", "content": "x"}]))
+    redis_client.hget = AsyncMock(return_value="0")
+    redis_client.hset = AsyncMock()
+    rag_service = Mock(ingest_documents=AsyncMock(return_value={
+        "processed": 1, "chunks": 2, "skipped": 0, "deleted": 0, "errors": []
+    }))
+    cache = Mock(invalidate=AsyncMock())
+    queue = IngestionQueue(redis_client, rag_service, response_cache=cache)
+    
+    await queue._run_job("job1")
+    
+    assert rag_service.ingest_documents.await_args.kwargs["prune_missing"] is False
+    cache.invalidate.assert_awaited_once()
+    final = pipe.hset.call_args.kwargs["mapping"]
+    assert final["status"] == "success"
+    assert final["chunks"] == 2
+
+@pytest.mark.asyncio
+async def test_recovery_checks_and_requeues_each_job_in_one_script():
+    """Test that staleness is judged inside Redis, next to the move, for every job in the processing list"""
+    redis_client = Mock(lrange=AsyncMock(return_value=["job1", "job2"]), eval=AsyncMock(side_effect=[1, 0]))
+    queue = IngestionQueue(redis_client, rag_service=Mock())
+    queue.stale_seconds = 600
+    
+    await queue._recover_stale_jobs()
+    
+    first, second = redis_client.eval.await_args_list
+    assert first.args[1:5] == (3, queue.processing_key, queue.queue_key, queue._job_key("job1"))
+    assert first.args[5] == "job1" and first.args[7] == 600
+    assert second.args[4] == queue._job_key("job2")
@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from src.services.llm_client import LLMClient
+
+@pytest.mark.asyncio
+async def test_chat_completion_respects_concurrency_cap():
+    """Test that no more than max_concurrency calls are in flight"""
+    client = LLMClient(api_key="test", max_concurrency=2)
+    in_flight = 0
+    peak = 0
+
+    async def fake_create(**kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="RELEVANT"))])
+
+    client.openai_client.chat.completions.create = AsyncMock(side_effect=fake_create)
+
+    results = await asyncio.gather(*[
+        client.chat_completion([{"role": "user", "content": "q"}]) for _ in range(6)
+    ])
+
+    assert results == ["RELEVANT"] * 6
+    assert peak == 2
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_create_embeddings_preserves_input_order():
+    """Test that embeddings are returned in input order"""
+    client = LLMClient(api_key="test")
+    client.openai_client.embeddings.create = AsyncMock(return_value=SimpleNamespace(data=[
+        SimpleNamespace(index=1, embedding=[0.0, 1.0]),
+        SimpleNamespace(index=0, embedding=[1.0, 0.0]),
+    ]))
+
+    embeddings = await client.create_embeddings(["a", "b"], model="text-embedding-3-large")
+
+    assert embeddings == [[1.0, 0.0], [0.0, 1.0]]
+    await client.close()
@@ -1,35 +1,52 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, AsyncMock, patch
 
 from src.main import app
+from src.services.query_coalescer import QueryCoalescer
 
 client = TestClient(app)
 
+def _query_state(guardrails, rag=None):
+    """Patch app.state with the /query dependencies, answering from the given guardrails and RAG mocks"""
+    return patch.multiple(
+        app.state, create=True,
+        guardrails_service=guardrails,
+        rag_service=rag or Mock(retrieve=AsyncMock(return_value={"documents": [[]], "metadatas": [[]], "distances": [[]]})),
+        embedding_service=Mock(generate_single_embedding=AsyncMock(return_value=[0.1, 0.2])),
+        response_cache=Mock(lookup=AsyncMock(return_value=None), store=AsyncMock()),
+        query_coalescer=QueryCoalescer(distributed=False),
+        query_log=Mock()
+    )
+
 def test_health_check():
     """Test health check endpoint"""
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "healthy", "service": "RAG Commercial Analytics API"}
 
-@patch('src.main.app.state.rag_service')
-@patch('src.main.app.state.guardrails_service')
-def test_process_query_success(mock_guardrails, mock_rag):
+def test_process_query_success():
     """Test successful query processing"""
     # Mock guardrails
-    mock_guardrails.sanitize_input.return_value = "test query"
-    mock_guardrails.check_relevance.return_value = True
-    mock_guardrails.validate_output.return_value = "test response"
+    mock_guardrails = Mock(
+        sanitize_input=AsyncMock(return_value="test query"),
+        check_relevance=AsyncMock(return_value=True),
+        validate_output=AsyncMock(return_value="test response")
+    )
     
     # Mock RAG service
-    mock_rag.process_query.return_value = {
-        "response": "test response",
-        "sources": [],
-        "confidence": 0.8
-    }
+    mock_rag = Mock(
+        retrieve=AsyncMock(return_value={"documents": [[]], "metadatas": [[]], "distances": [[]]}),
+        process_query=AsyncMock(return_value={
+            "response": "test response",
+            "sources": [],
+            "confidence": 0.8
+        })
+    )
     
     # Test request
-    response = client.post("/query", json={"query": "test query"})
+    with _query_state(mock_guardrails, mock_rag):
+        response = client.post("/query", json={"query": "test query"})
     
     assert response.status_code == 200
     data = response.json()
@@ -37,21 +54,22 @@ def test_process_query_success(mock_guardrails, mock_rag):
     assert data["response"] == "test response"
     assert data["confidence"] == 0.8
 
-@patch('src.main.app.state.guardrails_service')
-def test_process_query_irrelevant(mock_guardrails):
+def test_process_query_irrelevant():
     """Test query rejection for irrelevant content"""
-    mock_guardrails.sanitize_input.return_value = "irrelevant query"
-    mock_guardrails.check_relevance.return_value = False
+    mock_guardrails = Mock(
+        sanitize_input=AsyncMock(return_value="irrelevant query"),
+        check_relevance=AsyncMock(return_value=False)
+    )
     
-    response = client.post("/query", json={"query": "irrelevant query"})
+    with _query_state(mock_guardrails):
+        response = client.post("/query", json={"query": "irrelevant query"})
     
     assert response.status_code == 400
     assert "not relevant" in response.json()["detail"]
 
-@patch('src.main.app.state.rag_service')
-def test_ingest_documents_success(mock_rag):
-    """Test successful document ingestion"""
-    mock_rag.ingest_documents.return_value = 5
+def test_ingest_documents_success():
+    """Test that document ingestion is queued as a background job"""
+    queue = Mock(submit=AsyncMock(return_value={"job_id": "job1", "status": "queued", "queue_depth": 1}))
     
     test_documents = [
         {
@@ -62,32 +80,240 @@ def test_ingest_documents_success(mock_rag):
         }
     ]
     
-    response = client.post("/documents/ingest", json={"documents": test_documents})
+    with patch.multiple(app.state, create=True, ingestion_queue=queue):
+        response = client.post("/documents/ingest", json={"documents": test_documents})
     
-    assert response.status_code == 200
+    assert response.status_code == 202
     data = response.json()
-    assert data["status"] == "success"
-    assert data["processed"] == 5
+    assert data["status"] == "queued"
+    assert data["job_id"] == "job1"
 
-@patch('src.main.app.state.redis_client')
-def test_get_metrics(mock_redis):
-    """Test metrics endpoint"""
-    mock_redis.get.side_effect = lambda key: {"total_queries": "100", "successful_queries": "95"}.get(key, 0)
+def test_ingest_rejected_when_queue_is_full():
+    """Test that a full ingestion queue answers 429 with Retry-After"""
+    from src.services.ingestion_queue import QueueFullError
+    
+    queue = Mock(submit=AsyncMock(side_effect=QueueFullError("Ingestion queue is full (100 jobs)")))
+    with patch.multiple(app.state, create=True, ingestion_queue=queue):
+        response = client.post("/documents/ingest", json={"documents": [{"id": "doc1", "content": "x"}]})
+    
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "30"
+
+def test_ingest_stream_parses_ndjson_body():
+    """Test that the NDJSON endpoint feeds parsed documents to the streaming ingest"""
+    received = []
+    
+    async def fake_ingest_stream(documents, prune_missing=False, read_errors=None):
+        received.extend([doc async for doc in documents])
+        return {"processed": len(received), "chunks": len(received), "skipped": 0, "deleted": 0, "errors": list(read_errors)}
+    
+    rag = Mock(ingest_stream=fake_ingest_stream)
+    cache = Mock(invalidate=AsyncMock())
+    body = b'{"id": "doc1", "content": "a"}\n{"id": "doc2", "content": "b"}\n{broken\n'
     
+    with patch.multiple(app.state, create=True, rag_service=rag, response_cache=cache):
+        response = client.post("/documents/ingest/stream", content=body, headers={"Content-Type": "application/x-ndjson"})
+    
+    assert response.status_code == 200
+    assert [doc["id"] for doc in received] == ["doc1", "doc2"]
+    assert response.json()["status"] == "partial_success"
+    cache.invalidate.assert_awaited_once()
+
+def test_get_ingestion_job():
+    """Test job status lookup and 404 for unknown jobs"""
+    job = {"job_id": "job1", "status": "running", "total": 3, "processed": 1, "errors": []}
+    queue = Mock(get_job=AsyncMock(side_effect=lambda job_id: job if job_id == "job1" else None))
+    
+    with patch.multiple(app.state, create=True, ingestion_queue=queue):
+        found = client.get("/documents/jobs/job1")
+        missing = client.get("/documents/jobs/unknown")
+    
+    assert found.status_code == 200
+    assert found.json()["processed"] == 1
+    assert missing.status_code == 404
+
+def test_analytics_endpoints_read_rollups():
+    """Test the rollup-backed analytics endpoints and period validation"""
+    analytics = Mock(
+        agent_performance=AsyncMock(return_value=[{"agent_id": "AG-001", "total_sales": 1200.0}]),
+        quota_alerts=AsyncMock(return_value=[])
+    )
+    
+    with patch.multiple(app.state, create=True, sales_analytics=analytics):
+        response = client.get("/analytics/agent-performance", params={
+            "date_from": "2024-03-01", "date_to": "2024-03-31", "agent_id": ["AG-001", "AG-002"]
+        })
+        reversed_period = client.get("/analytics/agent-performance", params={
+            "date_from": "2024-03-31", "date_to": "2024-03-01"
+        })
+        alerts = client.get("/analytics/quota-alerts", params={"day": "2024-03-15", "threshold": 40})
+    
+    assert response.status_code == 200
+    assert response.json()["agents"][0]["agent_id"] == "AG-001"
+    assert analytics.agent_performance.await_args.kwargs == {"agent_ids": ["AG-001", "AG-002"]}
+    assert reversed_period.status_code == 400
+    assert alerts.status_code == 200
+    assert analytics.quota_alerts.await_args.args[1] == 40
+
+def test_get_metrics():
+    """Test metrics endpoint"""
     response = client.get("/metrics")
     
     assert response.status_code == 200
-    data = response.json()
-    assert data["total_queries"] == 100
-    assert data["successful_queries"] == 95
-    assert data["success_rate"] == 0.95
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "api_query_duration_seconds_bucket" in response.text
+    assert "api_query_stage_duration_seconds" in response.text
+    assert "api_upstream_errors_total" in response.text
 
 def test_query_validation():
     """Test query validation"""
-    # Test empty query
-    response = client.post("/query", json={})
-    assert response.status_code == 422  # Validation error
-    
-    # Test invalid JSON
-    response = client.post("/query", json={"query": ""})
-    # Should pass validation but might fail in processing
\ No newline at end of file
+    guardrails = Mock(sanitize_input=AsyncMock(side_effect=ValueError("Query cannot be empty")))
+    with _query_state(guardrails):
+        # Test empty query
+        response = client.post("/query", json={})
+        assert response.status_code == 422  # Validation error
+        
+        # Test invalid JSON
+        response = client.post("/query", json={"query": ""})
+    # Should pass validation but might fail in processing
+    assert response.status_code == 500
+    assert "cannot be empty" in response.json()["detail"]
+
+
+def test_stream_query_event_order():
+    """Test that /query/stream sends sources, tokens, then a complete event"""
+    async def fake_stream(query, query_embedding=None, retrieval_results=None, max_results=None):
+        yield {"event": "sources", "data": [{"content": "Q3 sales", "source": "crm", "relevance_score": 0.9}]}
+        yield {"event": "token", "data": "Sales "}
+        yield {"event": "token", "data": "grew"}
+        yield {"event": "complete", "data": {"confidence": 0.9}}
+
+    rag = Mock(retrieve=AsyncMock(return_value={"documents": [[]], "metadatas": [[]], "distances": [[]]}))
+    rag.stream_query = fake_stream
+    embedding = Mock(generate_single_embedding=AsyncMock(return_value=[0.1, 0.2]))
+    guardrails = Mock(
+        sanitize_input=AsyncMock(return_value="q3 sales"),
+        check_relevance=AsyncMock(return_value=True),
+        validate_output=AsyncMock(side_effect=lambda response: response["response"])
+    )
+    cache = Mock(lookup=AsyncMock(return_value=None), store=AsyncMock())
+    query_log = Mock()
+
+    with patch.multiple(app.state, create=True, rag_service=rag, embedding_service=embedding,
+                        guardrails_service=guardrails, response_cache=cache, query_log=query_log):
+        response = client.post("/query/stream", json={"query": "q3 sales"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n")[0][len("event: "):] for block in response.text.strip().split("\n\n")]
+    assert events == ["sources", "token", "token", "complete"]
+    assert '"validation_status": "valid"' in response.text
+    cache.store.assert_awaited_once()
+
+def test_query_runs_through_single_flight():
+    """Test that /query computes through the coalescer, keyed on the query and its retrieval options"""
+    from src.services.query_coalescer import QueryCoalescer
+
+    rag = Mock(
+        retrieve=AsyncMock(return_value={"documents": [[]], "metadatas": [[]], "distances": [[]]}),
+        process_query=AsyncMock(return_value={"response": "north leads", "sources": [], "confidence": 0.9})
+    )
+    embedding = Mock(generate_single_embedding=AsyncMock(return_value=[0.1, 0.2]))
+    guardrails = Mock(
+        sanitize_input=AsyncMock(return_value="q3 sales"),
+        check_relevance=AsyncMock(return_value=True),
+        validate_output=AsyncMock(side_effect=lambda response: response["response"])
+    )
+    cache = Mock(lookup=AsyncMock(return_value=None), store=AsyncMock())
+    coalescer = QueryCoalescer(distributed=False)
+    run = AsyncMock(side_effect=coalescer.run)
+
+    with patch.multiple(app.state, create=True, rag_service=rag, embedding_service=embedding,
+                        guardrails_service=guardrails, response_cache=cache, query_log=Mock(),
+                        query_coalescer=Mock(run=run, key=QueryCoalescer.key)):
+        response = client.post("/query", json={"query": "q3 sales", "max_results": 3})
+
+    assert response.status_code == 200
+    assert response.json()["response"] == "north leads"
+    assert run.await_args.args[0] == QueryCoalescer.key("Q3 sales", {"max_results": 3, "where": None})
+    cache.store.assert_awaited_once()
+
+def test_speculative_retrieval_is_cancelled_for_irrelevant_query():
+    """Test that retrieval starts with the relevance check and is discarded on rejection"""
+    import asyncio
+    from fastapi import HTTPException
+    from src.main import _relevance_gated_retrieval
+
+    retrieval_started = asyncio.Event()
+    retrieval_cancelled = False
+
+    async def slow_retrieve(query, query_embedding, max_results=None, where=None):
+        nonlocal retrieval_cancelled
+        retrieval_started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            retrieval_cancelled = True
+            raise
+
+    async def irrelevant(query, query_embedding=None):
+        await retrieval_started.wait()
+        return False
+
+    async def run():
+        rag = Mock(retrieve=slow_retrieve)
+        guardrails = Mock(check_relevance=irrelevant)
+        with pytest.raises(HTTPException) as exc_info:
+            await _relevance_gated_retrieval(
+                "weather in Rome", [0.1], rag, guardrails, {"max_results": 10, "where": None}
+            )
+        await asyncio.sleep(0)
+        return exc_info.value.status_code
+
+    assert asyncio.run(run()) == 400
+    assert retrieval_cancelled
+
+def test_filters_and_max_results_are_pushed_down():
+    """Test that context filters and max_results reach retrieval and scope the cache"""
+    reranked_to = []
+
+    async def fake_stream(query, query_embedding=None, retrieval_results=None, max_results=None):
+        reranked_to.append(max_results)
+        yield {"event": "complete", "data": {"confidence": 0.0}}
+
+    rag = Mock(retrieve=AsyncMock(return_value={"documents": [[]], "metadatas": [[]], "distances": [[]]}))
+    rag.stream_query = fake_stream
+    embedding = Mock(generate_single_embedding=AsyncMock(return_value=[0.1, 0.2]))
+    guardrails = Mock(
+        sanitize_input=AsyncMock(return_value="q3 sales"),
+        check_relevance=AsyncMock(return_value=True),
+        validate_output=AsyncMock(side_effect=lambda response: response["response"] or "empty")
+    )
+    cache = Mock(lookup=AsyncMock(return_value=None), store=AsyncMock())
+    query_log = Mock()
+
+    with patch.multiple(app.state, create=True, rag_service=rag, embedding_service=embedding,
+                        guardrails_service=guardrails, response_cache=cache, query_log=query_log):
+        response = client.post("/query/stream", json={
+            "query": "q3 sales",
+            "max_results": 3,
+            "context": {"date_from": "2024-07-01", "document_type": "sales", "audience": "board"}
+        })
+        invalid = client.post("/query/stream", json={
+            "query": "q3 sales",
+            "context": {"date_from": "2024-07-01", "date_to": "2024-01-01"}
+        })
+
+    assert response.status_code == 200
+    assert rag.retrieve.await_args.kwargs == {
+        "max_results": 3,
+        "where": {"$and": [{"type": {"$in": ["sales"]}}, {"date_key": {"$gte": 20240701}}]}
+    }
+    # The requested size also bounds the MMR selection
+    assert reranked_to == [3]
+    assert cache.lookup.await_args.kwargs["scope"] != ""
+    assert invalid.status_code == 422
+    # One query_logs entry for the streamed query, with its stage timings
+    query_log.record.assert_called_once()
+    assert query_log.record.call_args.kwargs["success"] is True
+    assert "query_embedding" in query_log.record.call_args.kwargs["stage_timings"]
@@ -0,0 +1,18 @@
+import numpy as np
+
+from src.services.mmr import maximal_marginal_relevance
+
+def test_near_duplicates_give_way_to_a_distinct_candidate():
+    """Test that a slightly less relevant but novel candidate beats a copy of the top one"""
+    embeddings = np.array([[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]])
+    relevance = np.array([0.95, 0.94, 0.7])
+    
+    assert maximal_marginal_relevance(relevance, embeddings, k=2, lambda_mult=0.5) == [0, 2]
+
+def test_full_relevance_weight_keeps_relevance_order():
+    """Test that lambda 1.0 reduces to a top-k by relevance, capped at the candidate count"""
+    embeddings = np.eye(3)
+    relevance = np.array([0.2, 0.9, 0.5])
+    
+    assert maximal_marginal_relevance(relevance, embeddings, k=5, lambda_mult=1.0) == [1, 2, 0]
+    assert maximal_marginal_relevance(relevance, embeddings, k=0) == []
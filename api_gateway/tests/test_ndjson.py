@@ -0,0 +1,29 @@
+import pytest
+
+from src.services.ndjson import iter_ndjson
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+@pytest.mark.asyncio
+async def test_lines_split_across_chunks_are_reassembled():
+    """Test that records spanning chunk boundaries parse and bad lines are reported, not fatal"""
+    errors = []
+    body = (b'{"id": "a", "cont', b'ent": "x"}\n\nnot json\n[1]\n{"id": "b"', b', "content": "y"}')
+    
+    docs = [doc async for doc in iter_ndjson(_chunks(*body), errors)]
+    
+    assert [doc["id"] for doc in docs] == ["a", "b"]
+    assert [error["error"].split(":")[0] for error in errors] == ["Line 3", "Line 4"]
+
+@pytest.mark.asyncio
+async def test_oversized_line_is_skipped():
+    """Test that a line past max_line_bytes is dropped without buffering it"""
+    errors = []
+    body = (b'{"id": "big", "content": "' + b"x" * 40, b"x" * 40 + b'"}\n{"id": "ok"}\n')
+    
+    docs = [doc async for doc in iter_ndjson(_chunks(*body), errors, max_line_bytes=32)]
+    
+    assert docs == [{"id": "ok"}]
+    assert errors[0]["error"].startswith("Line 1")
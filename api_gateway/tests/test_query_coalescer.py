@@ -0,0 +1,66 @@
+import json
+import asyncio
+import pytest
+from unittest.mock import Mock, AsyncMock
+
+from src.services.query_coalescer import QueryCoalescer
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_run():
+    """Test that identical queries in flight run once and a later one runs again"""
+    coalescer = QueryCoalescer(distributed=False)
+    calls = 0
+    
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"response": f"answer {calls}"}
+    
+    key = QueryCoalescer.key("Q3  sales by region", {"max_results": 10, "where": None})
+    assert key == QueryCoalescer.key("q3 sales BY region", {"where": None, "max_results": 10})
+    assert key != QueryCoalescer.key("q3 sales by region", {"max_results": 3, "where": None})
+    
+    results = await asyncio.gather(*[coalescer.run(key, compute) for _ in range(5)])
+    
+    assert calls == 1 and all(result == {"response": "answer 1"} for result in results)
+    assert await coalescer.run(key, compute) == {"response": "answer 2"}
+    assert coalescer._inflight == {}
+
+@pytest.mark.asyncio
+async def test_failure_is_shared_and_not_remembered():
+    """Test that waiting duplicates receive the error and the next query retries"""
+    coalescer = QueryCoalescer(distributed=False)
+    compute = AsyncMock(side_effect=[ValueError("upstream down"), {"response": "ok"}])
+    
+    outcomes = await asyncio.gather(coalescer.run("k", compute), coalescer.run("k", compute), return_exceptions=True)
+    
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert await coalescer.run("k", compute) == {"response": "ok"}
+
+@pytest.mark.asyncio
+async def test_waits_for_result_of_another_worker():
+    """Test that a worker finding the lock taken returns the holder's result without computing"""
+    pipe = Mock(execute=AsyncMock(side_effect=[["flight-a", None], [None, json.dumps({"response": "remote"})]]))
+    redis_client = Mock(set=AsyncMock(return_value="flight-a"), pipeline=Mock(return_value=pipe))
+    coalescer = QueryCoalescer(redis_client, distributed=True, poll_seconds=0.001)
+    compute = AsyncMock()
+    
+    assert await coalescer.run("k", compute) == {"response": "remote"}
+    compute.assert_not_awaited()
+    pipe.get.assert_any_call("rag:flight:result:flight-a")
+
+@pytest.mark.asyncio
+async def test_lock_holder_publishes_result_and_releases():
+    """Test that the worker taking the lock computes, writes its result and releases the lock"""
+    pipe = Mock(execute=AsyncMock())
+    redis_client = Mock(set=AsyncMock(return_value=None), pipeline=Mock(return_value=pipe))
+    coalescer = QueryCoalescer(redis_client, distributed=True)
+    
+    assert await coalescer.run("k", AsyncMock(return_value={"response": "local"})) == {"response": "local"}
+    
+    flight_id = redis_client.set.await_args.args[1]
+    assert redis_client.set.await_args.kwargs["nx"] is True
+    pipe.set.assert_called_once()
+    assert pipe.set.call_args.args[0] == f"rag:flight:result:{flight_id}"
+    assert pipe.eval.call_args.args[2:] == ("rag:flight:lock:k", flight_id)
@@ -0,0 +1,34 @@
+import asyncio
+import pytest
+from unittest.mock import Mock, AsyncMock
+
+from src.services.query_log import QueryLogWriter
+
+@pytest.mark.asyncio
+async def test_entries_are_flushed_in_batches():
+    """Test that queued entries reach Postgres as multi-row inserts on the size and time triggers"""
+    database = Mock(execute_values=AsyncMock())
+    writer = QueryLogWriter(database, batch_size=3, flush_seconds=0.05)
+    writer.start()
+    
+    for i in range(4):
+        writer.record(f"q{i}", 120.4, success=True, stage_timings={"vector_search": 12.5})
+    await asyncio.sleep(0.2)
+    await writer.stop()
+    
+    batches = [call.args[1] for call in database.execute_values.await_args_list]
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert batches[0][0][:3] == ("q0", 120, True)
+
+@pytest.mark.asyncio
+async def test_entries_are_dropped_when_database_or_queue_fails():
+    """Test that a failing database and a full queue drop entries instead of blocking"""
+    database = Mock(execute_values=AsyncMock(side_effect=ConnectionError("db down")))
+    writer = QueryLogWriter(database, max_queue=2, batch_size=10, flush_seconds=0.01)
+    
+    for i in range(3):
+        writer.record(f"q{i}", 5, success=False, error_message="boom")
+    assert writer.queue.qsize() == 2
+    
+    assert await writer._write(await writer._next_batch()) is False
+    assert writer.queue.empty()
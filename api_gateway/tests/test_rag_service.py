@@ -0,0 +1,164 @@
+import pytest
+from unittest.mock import Mock, AsyncMock
+
+from src.services.rag_service import RAGService
+from src.services.vector_store import NumpyVectorStore
+from src.services.bm25_index import BM25Index
+
+@pytest.mark.asyncio
+async def test_hybrid_retrieval_surfaces_exact_term_hits():
+    """Test that a BM25 hit far from the query embedding still reaches the context"""
+    vector_store = NumpyVectorStore()
+    lexical_index = BM25Index()
+    documents = {
+        "near": ("Regional sales grew in the north", [1.0, 0.0, 0.0]),
+        "sku": ("SKU-9931 shipped 40 units", [0.0, 1.0, 0.0]),
+    }
+    vector_store.upsert(
+        list(documents), [embedding for _, embedding in documents.values()],
+        [text for text, _ in documents.values()], [{"source": "crm"}] * 2
+    )
+    lexical_index.upsert(list(documents), [text for text, _ in documents.values()])
+    rag_service = RAGService(llm_client=Mock(), embedding_service=Mock(), vector_store=vector_store, lexical_index=lexical_index)
+
+    results = await rag_service.retrieve("units of SKU-9931", query_embedding=[0.95, 0.05, 0.0])
+    context = rag_service._assemble_context(results)
+
+    assert results["ids"][0][0] == "sku"
+    assert {ctx["content"] for ctx in context} == {text for text, _ in documents.values()}
+
+@pytest.mark.asyncio
+async def test_ingest_chunks_long_documents_and_removes_stale_chunks():
+    """Test that long documents are stored as chunks with parent ids and shrinking re-ingests leave no orphans"""
+    from src.services.chunker import Chunker
+
+    vector_store = NumpyVectorStore()
+    embedding_service = Mock(generate_embeddings=AsyncMock(
+        side_effect=lambda texts: [[1.0, float(len(text))] for text in texts]
+    ))
+    rag_service = RAGService(
+        llm_client=Mock(), embedding_service=embedding_service, vector_store=vector_store,
+        chunker=Chunker(chunk_tokens=20, overlap_tokens=5)
+    )
+    rag_service.ingest_batch_size = 2
+
+    long_report = " ".join(f"line{i}" for i in range(60))
+    result = await rag_service.ingest_documents([
+        {"id": "report", "content": long_report, "source": "erp", "date": "2024-03-31"},
+        {"id": "memo", "content": "Short memo", "source": "erp"}
+    ])
+
+    stored = vector_store.get(where={"parent_id": "report"})
+    assert result["processed"] == 2 and result["chunks"] == len(stored["ids"]) + 1
+    assert all(doc_id.startswith("report#") for doc_id in stored["ids"])
+    assert {m["chunk_index"] for m in stored["metadatas"]} == set(range(len(stored["ids"])))
+    assert vector_store.get(ids=["memo"])["metadatas"][0]["parent_id"] == "memo"
+
+    await rag_service.ingest_documents([{"id": "report", "content": "Revised summary", "source": "erp"}])
+    assert vector_store.get(where={"parent_id": "report"})["ids"] == ["report"]
+
+@pytest.mark.asyncio
+async def test_ingest_stream_batches_and_skips_prune_on_unreadable_records():
+    """Test that streamed documents are ingested in batches with continuous batch numbering"""
+
+    vector_store = NumpyVectorStore()
+    embedding_service = Mock(generate_embeddings=AsyncMock(side_effect=lambda texts: [[1.0, 0.5] for _ in texts]))
+    document_registry = Mock(get_hashes=AsyncMock(return_value={}), upsert=AsyncMock(), find_missing=AsyncMock())
+    rag_service = RAGService(
+        llm_client=Mock(), embedding_service=embedding_service, vector_store=vector_store,
+        document_registry=document_registry
+    )
+    rag_service.ingest_batch_size = 1
+
+    async def documents():
+        for i in range(5):
+            yield {"id": f"doc{i}", "content": f"Order {i}", "source": "erp"}
+
+    read_errors = [{"batch": None, "document_ids": [], "error": "Line 6: invalid JSON"}]
+    result = await rag_service.ingest_stream(documents(), prune_missing=True, batch_documents=2, read_errors=read_errors)
+
+    assert result["processed"] == 5 and vector_store.count() == 5
+    assert embedding_service.generate_embeddings.await_count == 5
+    assert result["errors"] == read_errors
+    document_registry.find_missing.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_non_text_and_unchunkable_documents_do_not_stall_the_ingest():
+    """Test that non-text content is reported but kept from pruning, and a document without chunks still completes"""
+    vector_store = NumpyVectorStore()
+    embedding_service = Mock(generate_embeddings=AsyncMock(side_effect=lambda texts: [[1.0, 0.5] for _ in texts]))
+    document_registry = Mock(
+        get_hashes=AsyncMock(return_value={}), upsert=AsyncMock(), find_missing=AsyncMock(return_value=[])
+    )
+    rag_service = RAGService(
+        llm_client=Mock(), embedding_service=embedding_service, vector_store=vector_store,
+        document_registry=document_registry
+    )
+    await rag_service.ingest_documents([{"id": "memo", "content": "Old memo", "source": "erp"}])
+
+    rag_service.chunker = Mock(iter_chunks=Mock(return_value=iter([])))
+    result = await rag_service.ingest_documents([
+        {"id": "memo", "content": "Revised memo", "source": "erp"},
+        {"id": "sheet", "content": {"rows": 3}, "source": "erp"},
+        {"id": "blank", "content": " \n\t", "source": "erp"}
+    ], prune_missing=True)
+
+    assert result["processed"] == 1 and vector_store.count() == 0
+    assert result["errors"] == [{"batch": None, "document_ids": ["sheet"], "error": "Content must be text, got dict"}]
+    assert document_registry.upsert.await_args.args[0][0]["document_id"] == "memo"
+    assert document_registry.find_missing.await_args.args[1] == ["memo", "sheet"]
+
+@pytest.mark.asyncio
+async def test_rerank_drops_near_copies_before_context_assembly():
+    """Test that MMR keeps one of several near-identical hits and fills the rest with distinct ones"""
+    vector_store = NumpyVectorStore()
+    documents = {
+        "daily-1": ("Daily summary: north region 120 orders", [0.8, 0.6, 0.0, 0.0]),
+        "daily-2": ("Daily summary: north region 120 orders.", [0.8, 0.59, 0.0, 0.05]),
+        "daily-3": ("Daily summary - north region 120 orders", [0.79, 0.6, 0.0, 0.03]),
+        "returns": ("Returns rose in the north region", [0.75, 0.0, 0.66, 0.0]),
+    }
+    vector_store.upsert(
+        list(documents), [embedding for _, embedding in documents.values()],
+        [text for text, _ in documents.values()], [{"source": "crm"}] * 4
+    )
+    rag_service = RAGService(llm_client=Mock(), embedding_service=Mock(), vector_store=vector_store)
+    rag_service.mmr_top_k = 2
+    
+    results = await rag_service.retrieve("north region orders", query_embedding=[1.0, 0.0, 0.0, 0.0])
+    reranked = rag_service._rerank(results)
+    
+    assert len(results["ids"][0]) == 4
+    assert reranked["ids"][0][0].startswith("daily") and reranked["ids"][0][1] == "returns"
+    assert len(reranked["embeddings"][0]) == 2
+    # An explicit max_results overrides MMR_TOP_K
+    assert len(rag_service._rerank(results, max_results=3)["ids"][0]) == 3
+
+@pytest.mark.asyncio
+async def test_hybrid_retrieval_reranks_the_fused_pool():
+    """Test that with lexical hits MMR still drops near-copies and keeps the exact-term hit"""
+    vector_store = NumpyVectorStore()
+    lexical_index = BM25Index()
+    documents = {
+        "daily-1": ("Daily summary: north region 120 orders", [0.8, 0.6, 0.0, 0.0, 0.0]),
+        "daily-2": ("Daily summary: north region 120 orders.", [0.8, 0.59, 0.0, 0.05, 0.0]),
+        "daily-3": ("Daily summary - north region 120 orders", [0.79, 0.6, 0.0, 0.03, 0.0]),
+        "daily-4": ("Daily summary, north region 120 orders", [0.8, 0.6, 0.01, 0.0, 0.0]),
+        "returns": ("Returns rose in the south", [0.75, 0.0, 0.66, 0.0, 0.0]),
+        "sku": ("SKU-9931 shipped 40 units", [0.0, 0.0, 0.0, 0.0, 1.0]),
+    }
+    vector_store.upsert(
+        list(documents), [embedding for _, embedding in documents.values()],
+        [text for text, _ in documents.values()], [{"source": "crm"}] * len(documents)
+    )
+    lexical_index.upsert(list(documents), [text for text, _ in documents.values()])
+    rag_service = RAGService(llm_client=Mock(), embedding_service=Mock(), vector_store=vector_store, lexical_index=lexical_index)
+    rag_service.mmr_top_k = 3
+    
+    results = await rag_service.retrieve("north region orders of SKU-9931", query_embedding=[1.0, 0.0, 0.0, 0.0, 0.0])
+    reranked = rag_service._rerank(results)
+    
+    assert results["lexical_ranks"][0] and len(results["ids"][0]) == len(documents)
+    kept = reranked["ids"][0]
+    assert len(kept) == 3 and {"returns", "sku"} <= set(kept)
+    assert sum(doc_id.startswith("daily") for doc_id in kept) == 1
@@ -0,0 +1,13 @@
+from unittest.mock import patch
+from redis.asyncio import BlockingConnectionPool
+
+from src.services.redis_client import redis_url
+
+def test_password_with_reserved_characters_survives_the_url():
+    """Test that a REDIS_PASSWORD containing @, : and / reaches the connection unchanged"""
+    env = {"REDIS_HOST": "cache", "REDIS_PORT": "6380", "REDIS_DB": "2", "REDIS_PASSWORD": "p@ss:w/rd%"}
+    with patch.dict("os.environ", env, clear=True):
+        url = redis_url()
+
+    kwargs = BlockingConnectionPool.from_url(url).connection_kwargs
+    assert (kwargs["host"], kwargs["port"], kwargs["db"], kwargs["password"]) == ("cache", 6380, 2, "p@ss:w/rd%")
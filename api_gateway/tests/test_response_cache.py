@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+from redis.exceptions import WatchError
+
+from src.services.response_cache import SemanticResponseCache
+
+def test_similar_embeddings_share_a_bucket():
+    """Test that near-identical query embeddings land in a common LSH bucket"""
+    cache = SemanticResponseCache(redis_client=None)
+    rng = np.random.default_rng(0)
+    base = cache._normalize(rng.standard_normal(256).tolist())
+    paraphrase = cache._normalize((base + 0.01 * rng.standard_normal(256)).tolist())
+    unrelated = cache._normalize(rng.standard_normal(256).tolist())
+
+    base_codes = cache._bucket_codes(base)
+    assert any(a == b for a, b in zip(base_codes, cache._bucket_codes(paraphrase)))
+    assert not any(a == b for a, b in zip(base_codes, cache._bucket_codes(unrelated)))
+
+def test_vector_encoding_roundtrip():
+    """Test that cached embeddings survive the Redis string encoding"""
+    vector = SemanticResponseCache._normalize([3.0, 4.0])
+    decoded = SemanticResponseCache._decode_vector(SemanticResponseCache._encode_vector(vector))
+    assert np.allclose(decoded, [0.6, 0.8])
+
+class FakeRedis:
+    """In-memory stand-in for the redis.asyncio commands the cache uses, with TTLs recorded but not enforced"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, "0")) + 1)
+        return int(self.data[key])
+
+    async def sunion(self, keys):
+        return set().union(*[self.data.get(key, set()) for key in keys])
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({field: str(value) for field, value in mapping.items()})
+
+    async def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    async def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    async def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    async def zpopmin(self, key, count):
+        members = sorted(self.data.get(key, {}).items(), key=lambda item: item[1])[:count]
+        for member, _ in members:
+            del self.data[key][member]
+        return members
+
+    async def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    """Queues commands until execute(); after watch() and before multi() they run immediately"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+        self.watched = None
+        self.immediate = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def watch(self, key):
+        self.watched = (key, self.redis.data.get(key))
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        command = getattr(self.redis, name)
+
+        def call(*args, **kwargs):
+            if self.immediate:
+                return command(*args, **kwargs)
+            self.commands.append((command, args, kwargs))
+            return self
+        return call
+
+    async def execute(self):
+        if self.watched and self.redis.data.get(self.watched[0]) != self.watched[1]:
+            raise WatchError("watched key changed")
+        return [await command(*args, **kwargs) for command, args, kwargs in self.commands]
+
+def _embedding(seed, dimension=64):
+    return np.random.default_rng(seed).standard_normal(dimension).tolist()
+
+@pytest.mark.asyncio
+async def test_hit_above_threshold_and_miss_below():
+    """Test that a near paraphrase is served and an unrelated query is not"""
+    redis_client = FakeRedis()
+    cache = SemanticResponseCache(redis_client, similarity_threshold=0.95, ttl_seconds=60)
+    stored = _embedding(1)
+    await cache.store(stored, "q3 sales", {"response": "north leads"}, compute_ms=1200)
+    
+    paraphrase = (np.asarray(stored) + 0.05 * np.asarray(_embedding(2))).tolist()
+    assert await cache.lookup(paraphrase) == {"response": "north leads"}
+    assert await cache.lookup(_embedding(3)) is None
+    # The same query in another scope is a separate entry
+    assert await cache.lookup(stored, scope="filtered") is None
+
+@pytest.mark.asyncio
+async def test_store_sets_ttl_on_every_key():
+    """Test that the entry, its buckets and the LRU index all expire"""
+    redis_client = FakeRedis()
+    cache = SemanticResponseCache(redis_client, ttl_seconds=60)
+    
+    await cache.store(_embedding(1), "q3 sales", {"response": "x"}, compute_ms=10)
+    
+    written = [key for key in redis_client.data if key != "rag:cache:epoch"]
+    assert len(written) == 1 + cache.bands + 1
+    assert all(redis_client.ttls.get(key) == 60 for key in written)
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entries_are_evicted_past_max_entries():
+    """Test that storing beyond max_entries drops the entry looked up least recently"""
+    redis_client = FakeRedis()
+    cache = SemanticResponseCache(redis_client, max_entries=2)
+    first, second, third = _embedding(1), _embedding(2), _embedding(3)
+    
+    await cache.store(first, "first", {"response": "1"}, compute_ms=10)
+    await cache.store(second, "second", {"response": "2"}, compute_ms=10)
+    assert await cache.lookup(first) == {"response": "1"}
+    await cache.store(third, "third", {"response": "3"}, compute_ms=10)
+    
+    assert await cache.lookup(second) is None
+    assert await cache.lookup(first) == {"response": "1"}
+    assert await cache.lookup(third) == {"response": "3"}
+
+@pytest.mark.asyncio
+async def test_invalidation_retires_entries_across_workers():
+    """Test that after an ingest bumps the epoch no worker serves or stores pre-ingest answers"""
+    redis_client = FakeRedis()
+    ingesting = SemanticResponseCache(redis_client)
+    serving = SemanticResponseCache(redis_client)
+    embedding = _embedding(1)
+    await serving.store(embedding, "q3 sales", {"response": "old"}, compute_ms=10)
+    assert await serving.lookup(embedding) == {"response": "old"}
+    
+    await ingesting.invalidate()
+    
+    # The serving worker still holds the old epoch locally
+    assert serving._epoch == "0"
+    assert await serving.lookup(_embedding(4)) is None
+    # Another ingest lands between this request's lookup and its store: the answer is not cached
+    await redis_client.incr("rag:cache:epoch")
+    await serving.store(embedding, "q3 sales", {"response": "computed before ingest"}, compute_ms=10)
+    assert await ingesting.lookup(embedding) is None
+    
+    await ingesting.store(embedding, "q3 sales", {"response": "new"}, compute_ms=10)
+    assert await serving.lookup(embedding) == {"response": "new"}
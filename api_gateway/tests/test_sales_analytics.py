@@ -0,0 +1,25 @@
+import pytest
+from datetime import date
+from unittest.mock import Mock, AsyncMock
+
+from src.services.sales_analytics import SalesAnalytics
+
+@pytest.mark.asyncio
+async def test_agent_performance_reads_daily_rollups():
+    """Test that period totals come from agent_performance, not raw_sales_data"""
+    database = Mock(fetch_all=AsyncMock(return_value=[{"agent_id": "AG-001", "total_sales": 1200}]))
+    analytics = SalesAnalytics(database)
+    
+    rows = await analytics.agent_performance(date(2024, 3, 1), date(2024, 3, 31), agent_ids=["AG-001"])
+    
+    sql, params = database.fetch_all.await_args.args
+    assert "FROM agent_performance" in sql and "raw_sales_data" not in sql
+    assert params == (date(2024, 3, 1), date(2024, 3, 31), ["AG-001"], ["AG-001"])
+    assert rows[0]["total_sales"] == 1200
+
+@pytest.mark.asyncio
+async def test_rollup_status_before_first_refresh():
+    """Test that a missing rollup_state row reads as None"""
+    analytics = SalesAnalytics(Mock(fetch_all=AsyncMock(return_value=[])))
+    
+    assert await analytics.rollup_status() is None
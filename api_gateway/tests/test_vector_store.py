@@ -0,0 +1,98 @@
+import numpy as np
+
+from src.services.vector_store import NumpyVectorStore
+
+def make_store(path=None):
+    store = NumpyVectorStore(path=path)
+    store.upsert(
+        ids=["north", "south", "east"],
+        embeddings=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.7, 0.7, 0.0]],
+        documents=["North sales", "South sales", "East sales"],
+        metadatas=[{"type": "sales"}, {"type": "sales"}, {"type": "report"}]
+    )
+    return store
+
+def test_query_returns_nearest_by_cosine_distance():
+    """Test that results are ordered by cosine distance and honour where filters"""
+    store = make_store()
+
+    results = store.query(query_embeddings=[[2.0, 0.1, 0.0]], n_results=2)
+    assert results["ids"] == [["north", "east"]]
+    assert np.isclose(results["distances"][0][0], 1 - 2.0 / np.sqrt(4.01))
+
+    filtered = store.query(query_embeddings=[[2.0, 0.1, 0.0]], n_results=2, where={"type": {"$in": ["report"]}})
+    assert filtered["ids"] == [["east"]]
+
+def test_upsert_delete_and_persist(tmp_path):
+    """Test that replacing, deleting and reloading keep ids and rows aligned"""
+    store = make_store(path=str(tmp_path))
+    store.upsert(ids=["north"], embeddings=[[0.0, 0.0, 1.0]], documents=["North v2"], metadatas=[{"type": "sales"}])
+    store.delete(["south", "missing"])
+    store.persist()
+
+    reloaded = NumpyVectorStore(path=str(tmp_path))
+    assert reloaded.count() == 2
+    results = reloaded.query(query_embeddings=[[0.0, 0.0, 1.0]], n_results=1)
+    assert results["ids"] == [["north"]]
+    assert results["documents"] == [["North v2"]]
+
+def test_reader_picks_up_another_workers_persisted_writes(tmp_path):
+    """Test that a store sharing the path reloads once the writer persists, but keeps its own unpersisted writes"""
+    writer = make_store(path=str(tmp_path))
+    writer.persist()
+    reader = NumpyVectorStore(path=str(tmp_path), refresh_seconds=0)
+    assert reader.count() == 3
+
+    writer.delete(["south"])
+    writer.persist()
+    assert reader.count() == 2
+    assert reader.get(ids=["south"])["ids"] == []
+
+    reader.upsert(ids=["west"], embeddings=[[0.0, 0.0, 1.0]], documents=["West sales"], metadatas=[{}])
+    writer.delete(["east"])
+    writer.persist()
+    assert reader.get(ids=["west", "east"])["ids"] == ["west", "east"]
+
+def test_quantized_search_rescoring_matches_exact(tmp_path):
+    """Test that int8 and float16 indexes return the exact top-k after full-precision rescoring"""
+    rng = np.random.default_rng(7)
+    vectors = rng.standard_normal((500, 64)).astype(np.float32)
+    ids = [f"doc_{i}" for i in range(500)]
+    query = rng.standard_normal((1, 64)).tolist()
+
+    exact = NumpyVectorStore()
+    exact.upsert(ids, vectors.tolist(), ids, [{}] * 500)
+    expected = exact.query(query, n_results=5)
+
+    for quantization in ("int8", "float16"):
+        store = NumpyVectorStore(path=str(tmp_path / quantization), quantization=quantization)
+        store.upsert(ids[:300], vectors[:300].tolist(), ids[:300], [{}] * 300)
+        store.persist()
+        # Mix persisted (memory-mapped) and pending rows, and move rows with a delete
+        store.upsert(ids[300:] + ["extra"], vectors[300:].tolist() + [[1.0] * 64], ids[300:] + ["extra"], [{}] * 201)
+        store.delete(["extra"])
+
+        results = store.query(query, n_results=5)
+        assert results["ids"] == expected["ids"]
+        assert np.allclose(results["distances"], expected["distances"], atol=1e-5)
+
+        store.persist()
+        reloaded = NumpyVectorStore(path=str(tmp_path / quantization), quantization=quantization)
+        assert reloaded.query(query, n_results=5)["ids"] == expected["ids"]
+
+def test_date_range_filter():
+    """Test that numeric date ranges combine with other clauses"""
+    store = NumpyVectorStore()
+    store.upsert(
+        ids=["q1", "q3", "q3_report"],
+        embeddings=[[1.0, 0.0], [1.0, 0.1], [1.0, 0.2]],
+        documents=["Q1", "Q3", "Q3 report"],
+        metadatas=[
+            {"type": "sales", "date_key": 20240215},
+            {"type": "sales", "date_key": 20240815},
+            {"type": "report", "date_key": 20240820}
+        ]
+    )
+
+    where = {"$and": [{"type": {"$in": ["sales"]}}, {"date_key": {"$gte": 20240701}}]}
+    assert store.query(query_embeddings=[[1.0, 0.0]], n_results=5, where=where)["ids"] == [["q3"]]
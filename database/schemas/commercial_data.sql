@@ -1,9 +1,19 @@
 -- Commercial Data Schema
--- RAG Commercial Analytics Database
+-- RAG Commercial Analytics Database (PostgreSQL 12+)
+--
+-- raw_sales_data, query_logs and system_metrics are range-partitioned by
+-- month on their time column. scripts/init_db.py creates the monthly
+-- partitions (<table>_pYYYYMM) and a DEFAULT partition for rows outside
+-- them; re-run it monthly to stay ahead. Retention is a DETACH PARTITION
+-- of whole months instead of a bulk DELETE.
+-- Partitioned tables key on (id, time column), as PostgreSQL requires the
+-- partition key in every unique constraint.
 
 -- Raw sales data table
 CREATE TABLE IF NOT EXISTS raw_sales_data (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
+    -- transaction_id of the extract, or a hash of the identifying fields (scripts/load_sales_data.py)
+    record_key VARCHAR(64),
     agent_id VARCHAR(50) NOT NULL,
     sales_amount DECIMAL(10,2) NOT NULL,
     date DATE NOT NULL,
@@ -14,10 +24,17 @@ CREATE TABLE IF NOT EXISTS raw_sales_data (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
-    INDEX idx_agent_id (agent_id),
-    INDEX idx_date (date),
-    INDEX idx_region (region)
-);
+    PRIMARY KEY (id, date),
+    UNIQUE (record_key, date)
+) PARTITION BY RANGE (date);
+
+-- Rows arrive roughly in date order, so a BRIN index stays a few pages per partition
+CREATE INDEX IF NOT EXISTS idx_raw_sales_date_brin ON raw_sales_data USING BRIN (date);
+-- Per-agent totals over a period (reports, quota alerts) without touching the heap
+CREATE INDEX IF NOT EXISTS idx_raw_sales_agent_date ON raw_sales_data (agent_id, date) INCLUDE (sales_amount);
+CREATE INDEX IF NOT EXISTS idx_raw_sales_region_date ON raw_sales_data (region, date);
+-- Finds the rows changed since the last rollup refresh (scripts/refresh_rollups.py)
+CREATE INDEX IF NOT EXISTS idx_raw_sales_updated_at_brin ON raw_sales_data USING BRIN (updated_at);
 
 -- Processed commercial metrics
 CREATE TABLE IF NOT EXISTS commercial_metrics (
@@ -27,12 +44,14 @@ CREATE TABLE IF NOT EXISTS commercial_metrics (
     metric_value DECIMAL(12,2) NOT NULL,
     period_start DATE NOT NULL,
     period_end DATE NOT NULL,
-    calculation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    
-    INDEX idx_agent_metric (agent_id, metric_type),
-    INDEX idx_period (period_start, period_end)
+    calculation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- One value per agent, metric and period, maintained by scripts/refresh_rollups.py
+CREATE UNIQUE INDEX IF NOT EXISTS idx_commercial_metrics_agent_metric_period
+    ON commercial_metrics (agent_id, metric_type, period_start, period_end);
+CREATE INDEX IF NOT EXISTS idx_commercial_metrics_period ON commercial_metrics (period_start, period_end);
+
 -- Document metadata for RAG
 CREATE TABLE IF NOT EXISTS document_metadata (
     id SERIAL PRIMARY KEY,
@@ -42,27 +61,33 @@ CREATE TABLE IF NOT EXISTS document_metadata (
     title VARCHAR(500),
     content_hash VARCHAR(64),
     indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    
-    INDEX idx_document_id (document_id),
-    INDEX idx_source (source),
-    INDEX idx_type (document_type)
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE INDEX IF NOT EXISTS idx_document_metadata_source ON document_metadata (source);
+CREATE INDEX IF NOT EXISTS idx_document_metadata_type ON document_metadata (document_type);
+
 -- Query logs for monitoring
 CREATE TABLE IF NOT EXISTS query_logs (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     query_text TEXT NOT NULL,
     response_time_ms INTEGER,
     success BOOLEAN DEFAULT true,
     error_message TEXT,
     user_id VARCHAR(50),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Milliseconds per pipeline stage, written in batches by the API gateway
+    stage_timings JSONB,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     
-    INDEX idx_timestamp (timestamp),
-    INDEX idx_user_id (user_id),
-    INDEX idx_success (success)
-);
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+ALTER TABLE query_logs ADD COLUMN IF NOT EXISTS stage_timings JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_query_logs_timestamp_brin ON query_logs USING BRIN (timestamp);
+CREATE INDEX IF NOT EXISTS idx_query_logs_user_timestamp ON query_logs (user_id, timestamp);
+-- Failures are rare, so a partial index is far smaller than one on success
+CREATE INDEX IF NOT EXISTS idx_query_logs_failures ON query_logs (timestamp) WHERE NOT success;
 
 -- Agent performance tracking
 CREATE TABLE IF NOT EXISTS agent_performance (
@@ -73,19 +98,64 @@ CREATE TABLE IF NOT EXISTS agent_performance (
     target_total DECIMAL(10,2) DEFAULT 0,
     quota_percentage DECIMAL(5,2) DEFAULT 0,
     commission_earned DECIMAL(10,2) DEFAULT 0,
+    transaction_count INTEGER DEFAULT 0,
     
-    UNIQUE KEY unique_agent_date (agent_id, performance_date),
-    INDEX idx_agent_id (agent_id),
-    INDEX idx_performance_date (performance_date)
+    -- Also serves lookups by agent_id alone
+    UNIQUE (agent_id, performance_date)
 );
 
+-- Tables created before the rollups existed
+ALTER TABLE agent_performance ADD COLUMN IF NOT EXISTS transaction_count INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_agent_performance_date ON agent_performance (performance_date);
+
+-- Rollup bookkeeping: raw_sales_data rows updated at or after high_water_mark
+-- are not yet reflected in agent_performance and commercial_metrics
+CREATE TABLE IF NOT EXISTS rollup_state (
+    rollup_name VARCHAR(100) PRIMARY KEY,
+    high_water_mark TIMESTAMP NOT NULL DEFAULT '-infinity',
+    refreshed_at TIMESTAMP,
+    last_groups_refreshed INTEGER DEFAULT 0
+);
+
+-- Agent/day groups that lost a row: the previous group of rows whose agent_id
+-- or date changed, and the group of deleted rows. updated_at only reveals the
+-- group a row is in now, so scripts/refresh_rollups.py recomputes these too.
+-- Append-only, so concurrent writers never wait on each other; partitions
+-- detached for retention fire no trigger and keep their rollups.
+CREATE TABLE IF NOT EXISTS rollup_vacated_groups (
+    agent_id VARCHAR(50) NOT NULL,
+    date DATE NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION record_vacated_sales_group() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO rollup_vacated_groups (agent_id, date) VALUES (OLD.agent_id, OLD.date);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER raw_sales_group_changed
+    AFTER UPDATE OF agent_id, date ON raw_sales_data
+    FOR EACH ROW
+    WHEN (OLD.agent_id IS DISTINCT FROM NEW.agent_id OR OLD.date IS DISTINCT FROM NEW.date)
+    EXECUTE FUNCTION record_vacated_sales_group();
+
+CREATE OR REPLACE TRIGGER raw_sales_deleted
+    AFTER DELETE ON raw_sales_data
+    FOR EACH ROW
+    EXECUTE FUNCTION record_vacated_sales_group();
+
 -- System metrics
 CREATE TABLE IF NOT EXISTS system_metrics (
-    id SERIAL PRIMARY KEY,
+    id BIGSERIAL,
     metric_name VARCHAR(100) NOT NULL,
     metric_value DECIMAL(12,4) NOT NULL,
-    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     
-    INDEX idx_metric_name (metric_name),
-    INDEX idx_recorded_at (recorded_at)
-);
\ No newline at end of file
+    PRIMARY KEY (id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
+CREATE INDEX IF NOT EXISTS idx_system_metrics_recorded_at_brin ON system_metrics USING BRIN (recorded_at);
+-- System alerts read the last minutes of a few named metrics
+CREATE INDEX IF NOT EXISTS idx_system_metrics_name_recorded_at ON system_metrics (metric_name, recorded_at);
\ No newline at end of file
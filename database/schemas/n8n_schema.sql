@@ -12,13 +12,13 @@ CREATE TABLE IF NOT EXISTS workflow_executions (
     execution_time_ms INTEGER,
     error_message TEXT,
     input_data JSON,
-    output_data JSON,
-    
-    INDEX idx_workflow_id (workflow_id),
-    INDEX idx_status (execution_status),
-    INDEX idx_started_at (started_at)
+    output_data JSON
 );
 
+CREATE INDEX IF NOT EXISTS idx_workflow_executions_workflow_id ON workflow_executions (workflow_id);
+CREATE INDEX IF NOT EXISTS idx_workflow_executions_status ON workflow_executions (execution_status);
+CREATE INDEX IF NOT EXISTS idx_workflow_executions_started_at ON workflow_executions (started_at);
+
 -- Workflow performance metrics
 CREATE TABLE IF NOT EXISTS workflow_metrics (
     id SERIAL PRIMARY KEY,
@@ -29,11 +29,11 @@ CREATE TABLE IF NOT EXISTS workflow_metrics (
     failed_executions INTEGER DEFAULT 0,
     avg_execution_time_ms DECIMAL(10,2) DEFAULT 0,
     
-    UNIQUE KEY unique_workflow_date (workflow_id, metric_date),
-    INDEX idx_workflow_id (workflow_id),
-    INDEX idx_metric_date (metric_date)
+    UNIQUE (workflow_id, metric_date)
 );
 
+CREATE INDEX IF NOT EXISTS idx_workflow_metrics_metric_date ON workflow_metrics (metric_date);
+
 -- Agent workflow states
 CREATE TABLE IF NOT EXISTS agent_states (
     id SERIAL PRIMARY KEY,
@@ -42,11 +42,11 @@ CREATE TABLE IF NOT EXISTS agent_states (
     state_data JSON NOT NULL,
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
-    UNIQUE KEY unique_agent_workflow (agent_id, workflow_id),
-    INDEX idx_agent_id (agent_id),
-    INDEX idx_workflow_id (workflow_id)
+    UNIQUE (agent_id, workflow_id)
 );
 
+CREATE INDEX IF NOT EXISTS idx_agent_states_workflow_id ON agent_states (workflow_id);
+
 -- Data quality checks
 CREATE TABLE IF NOT EXISTS data_quality_checks (
     id SERIAL PRIMARY KEY,
@@ -55,9 +55,9 @@ CREATE TABLE IF NOT EXISTS data_quality_checks (
     data_source VARCHAR(100) NOT NULL,
     check_result BOOLEAN NOT NULL,
     check_details JSON,
-    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    
-    INDEX idx_check_name (check_name),
-    INDEX idx_data_source (data_source),
-    INDEX idx_checked_at (checked_at)
-);
\ No newline at end of file
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_data_quality_checks_check_name ON data_quality_checks (check_name);
+CREATE INDEX IF NOT EXISTS idx_data_quality_checks_data_source ON data_quality_checks (data_source);
+CREATE INDEX IF NOT EXISTS idx_data_quality_checks_checked_at ON data_quality_checks (checked_at);
\ No newline at end of file
@@ -4,7 +4,9 @@ Database initialization script for RAG Commercial Analytics
 """
 
 import os
+import re
 import sys
+from datetime import date
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import logging
@@ -33,6 +35,70 @@ def execute_sql_file(cursor, filepath):
         logger.error(f"Error executing {filepath}: {e}")
         raise
 
+# Monthly range-partitioned tables and their partition key
+PARTITIONED_TABLES = {
+    'raw_sales_data': 'date',
+    'query_logs': 'timestamp',
+    'system_metrics': 'recorded_at'
+}
+
+def add_months(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def ensure_partitions(cursor, months_back=None, months_ahead=None):
+    """Create the monthly partitions around the current month, plus a DEFAULT partition"""
+    months_back = months_back if months_back is not None else int(os.getenv('PARTITION_MONTHS_BACK', '12'))
+    months_ahead = months_ahead if months_ahead is not None else int(os.getenv('PARTITION_MONTHS_AHEAD', '3'))
+    current = date.today().replace(day=1)
+
+    for table in PARTITIONED_TABLES:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+        row = cursor.fetchone()
+        if not row or row[0] != 'p':
+            # A table created before partitioning has to be migrated by hand
+            logger.error(f"{table} is not partitioned; recreate it from the schema and copy the rows over")
+            continue
+
+        for offset in range(-months_back, months_ahead + 1):
+            start = add_months(current, offset)
+            end = add_months(start, 1)
+            partition = f"{table}_p{start:%Y%m}"
+            try:
+                cursor.execute(
+                    f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                )
+            except psycopg2.Error as e:
+                # Typically rows for this month already sit in the DEFAULT partition
+                logger.error(f"Could not create partition {partition}: {e}")
+
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+        logger.info(f"Partitions of {table} ensured from {add_months(current, -months_back)} to {add_months(current, months_ahead + 1)}")
+
+def detach_expired_partitions(cursor, table, retention_months):
+    """Detach monthly partitions older than retention_months; they stay as plain tables to archive or drop"""
+    cutoff = add_months(date.today().replace(day=1), -retention_months)
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+    """, (table,))
+
+    detached = []
+    for (partition,) in cursor.fetchall():
+        match = re.fullmatch(rf"{table}_p(\d{{4}})(\d{{2}})", partition)
+        if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            # Only touches the catalog, unlike a DELETE of the expired rows
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+            detached.append(partition)
+
+    if detached:
+        logger.info(f"Detached {len(detached)} partitions of {table} older than {cutoff}: {', '.join(sorted(detached))}")
+    return detached
+
 def initialize_database():
     """Initialize database with schemas"""
     try:
@@ -50,6 +116,14 @@ def initialize_database():
             filepath = os.path.join(os.path.dirname(__file__), '..', schema_file)
             execute_sql_file(cursor, filepath)
         
+        ensure_partitions(cursor)
+        
+        # Retention is opt-in per table, e.g. QUERY_LOGS_RETENTION_MONTHS=6
+        for table in PARTITIONED_TABLES:
+            retention_months = os.getenv(f'{table.upper()}_RETENTION_MONTHS')
+            if retention_months:
+                detach_expired_partitions(cursor, table, int(retention_months))
+        
         # Insert initial data if needed
         cursor.execute("""
             INSERT INTO system_metrics (metric_name, metric_value) 
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Bulk loader for raw_sales_data
+
+Streams a CSV, JSON array or NDJSON sales extract into a temporary staging
+table with COPY, validates it set-wise in SQL and upserts the valid rows in
+one statement. Rows are identified by the extract's transaction_id, so
+reloading an extract updates rows instead of duplicating them. Rows without
+one are keyed on a hash of all their fields and their occurrence among
+identical rows of the extract: reloading stays idempotent and repeated
+identical sales stay separate rows, but a corrected value loads as a new
+row, so extracts that revise sales must carry transaction ids.
+
+Usage:
+    python load_sales_data.py sales_2024_03.csv
+    python load_sales_data.py --format ndjson - < extract.ndjson
+"""
+
+import os
+import io
+import sys
+import csv
+import json
+import time
+import argparse
+import logging
+
+from init_db import get_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    'transaction_id', 'agent_id', 'sales_amount', 'date',
+    'product_category', 'customer_id', 'region', 'channel'
+]
+
+# Evaluated in order, so the casts only see values the patterns accepted
+REJECT_REASON = """
+    CASE
+        WHEN nullif(trim(agent_id), '') IS NULL THEN 'missing agent_id'
+        WHEN length(trim(agent_id)) > 50 THEN 'agent_id longer than 50 characters'
+        WHEN trim(sales_amount) !~ '^-?[0-9]{1,8}(\\.[0-9]+)?$' THEN 'invalid sales_amount'
+        WHEN trim(date) !~ '^[1-9][0-9]{3}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])$' THEN 'invalid date'
+        WHEN substr(trim(date), 9, 2)::int > extract(day FROM
+            make_date(substr(trim(date), 1, 4)::int, substr(trim(date), 6, 2)::int, 1)
+            + interval '1 month - 1 day') THEN 'invalid date'
+        WHEN length(product_category) > 100 OR length(customer_id) > 50
+            OR length(region) > 50 OR length(channel) > 50 THEN 'field too long'
+        WHEN length(transaction_id) > 64 THEN 'transaction_id longer than 64 characters'
+    END
+"""
+
+CREATE_STAGING = """
+    CREATE TEMP TABLE sales_staging (
+        line_no BIGINT,
+        transaction_id TEXT,
+        agent_id TEXT,
+        sales_amount TEXT,
+        date TEXT,
+        product_category TEXT,
+        customer_id TEXT,
+        region TEXT,
+        channel TEXT
+    ) ON COMMIT DROP
+"""
+
+# The last occurrence of a transaction_id in the extract wins; unchanged rows are not rewritten
+UPSERT = f"""
+    WITH typed AS (
+        SELECT
+            line_no,
+            nullif(trim(transaction_id), '') AS transaction_id,
+            trim(agent_id) AS agent_id,
+            -- Rounded to the column's scale so 10.5 and 10.50 hash alike
+            round(trim(sales_amount)::numeric, 2) AS sales_amount,
+            trim(date)::date AS date,
+            product_category, customer_id, region, channel
+        FROM sales_staging
+        WHERE ({REJECT_REASON}) IS NULL
+    ),
+    keyed AS (
+        SELECT
+            line_no,
+            transaction_id,
+            coalesce(
+                transaction_id,
+                md5(concat_ws('|',
+                    agent_id, date, sales_amount, coalesce(customer_id, ''), coalesce(product_category, ''),
+                    coalesce(region, ''), coalesce(channel, ''),
+                    row_number() OVER (
+                        PARTITION BY transaction_id, agent_id, date, sales_amount,
+                            customer_id, product_category, region, channel
+                        ORDER BY line_no
+                    )
+                ))
+            ) AS record_key,
+            agent_id, sales_amount, date, product_category, customer_id, region, channel
+        FROM typed
+    ),
+    valid AS (
+        SELECT DISTINCT ON (record_key, date)
+            record_key, agent_id, sales_amount, date, product_category, customer_id, region, channel
+        FROM keyed
+        ORDER BY record_key, date, line_no DESC
+    ),
+    upserted AS (
+        INSERT INTO raw_sales_data (
+            record_key, agent_id, sales_amount, date, product_category, customer_id, region, channel
+        )
+        SELECT * FROM valid
+        ON CONFLICT (record_key, date) DO UPDATE SET
+            agent_id = EXCLUDED.agent_id,
+            sales_amount = EXCLUDED.sales_amount,
+            product_category = EXCLUDED.product_category,
+            customer_id = EXCLUDED.customer_id,
+            region = EXCLUDED.region,
+            channel = EXCLUDED.channel,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE (raw_sales_data.agent_id, raw_sales_data.sales_amount, raw_sales_data.product_category,
+               raw_sales_data.customer_id, raw_sales_data.region, raw_sales_data.channel)
+            IS DISTINCT FROM
+              (EXCLUDED.agent_id, EXCLUDED.sales_amount, EXCLUDED.product_category,
+               EXCLUDED.customer_id, EXCLUDED.region, EXCLUDED.channel)
+        -- xmax cannot be read through a partitioned table; an update stamps
+        -- updated_at with this transaction's time, past the row's created_at
+        RETURNING (created_at = updated_at) AS inserted
+    )
+    SELECT
+        (SELECT count(*) FROM valid),
+        count(*) FILTER (WHERE inserted),
+        count(*) FILTER (WHERE NOT inserted),
+        (SELECT count(*) FROM keyed WHERE transaction_id IS NULL)
+    FROM upserted
+"""
+
+def iter_csv(stream):
+    for row in csv.DictReader(stream):
+        yield row
+
+def iter_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """Yield the objects of a top-level JSON array without loading the whole document"""
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    started = eof = False
+
+    while True:
+        # Skip whitespace, and the separators between elements once inside the array
+        separators = ' \t\r\n,' if started else ' \t\r\n\ufeff'
+        while True:
+            while position < len(buffer) and buffer[position] in separators:
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            buffer, position = stream.read(chunk_size), 0
+            eof = not buffer
+
+        if position >= len(buffer):
+            raise ValueError("Unexpected end of JSON array")
+        if not started:
+            if buffer[position] != '[':
+                raise ValueError("Expected a JSON array of sales records")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            if eof:
+                raise
+            end = None
+        # An element ending exactly at the buffer boundary may be a truncated number
+        if end is not None and (end < len(buffer) or eof):
+            yield record
+            position = end
+            continue
+
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer, position = buffer[position:] + chunk, 0
+
+READERS = {'csv': iter_csv, 'ndjson': iter_ndjson, 'json': iter_json_array}
+
+class CopyStream:
+    """File-like object producing CSV for COPY FROM STDIN from a record iterator, one read at a time"""
+
+    def __init__(self, records):
+        self.records = enumerate(records, start=1)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator='\n')
+        self.rows = 0
+
+    def read(self, size=-1):
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        for line_no, record in self.records:
+            if not isinstance(record, dict):
+                record = {}
+            # Empty unquoted CSV fields are loaded as NULL
+            self.writer.writerow([line_no] + [
+                '' if record.get(column) is None else str(record[column]).replace('\x00', '')
+                for column in COLUMNS
+            ])
+            self.rows += 1
+            if size > 0 and self.buffer.tell() >= size:
+                break
+        return self.buffer.getvalue()
+
+def load_sales(conn, records, min_valid_ratio=0.8, sample_rejections=20):
+    """Load sales records into raw_sales_data in one transaction and return load statistics.
+
+    Nothing is written when fewer than min_valid_ratio of the rows are valid.
+    """
+    started = time.monotonic()
+    stream = CopyStream(records)
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_STAGING)
+            cursor.copy_expert(
+                f"COPY sales_staging (line_no, {', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                stream
+            )
+            copied = time.monotonic()
+
+            cursor.execute(f"""
+                SELECT reason, count(*), (array_agg(line_no ORDER BY line_no))[1:%s]
+                FROM (SELECT line_no, {REJECT_REASON} AS reason FROM sales_staging) checked
+                WHERE reason IS NOT NULL
+                GROUP BY reason
+            """, (sample_rejections,))
+            rejections = {reason: {"count": count, "lines": lines} for reason, count, lines in cursor.fetchall()}
+            rejected = sum(rejection["count"] for rejection in rejections.values())
+
+            stats = {
+                "rows_read": stream.rows,
+                "rejected": rejected,
+                "rejections": rejections
+            }
+            # Raising inside the transaction block rolls back the staged rows
+            if stream.rows and (stream.rows - rejected) / stream.rows < min_valid_ratio:
+                raise ValueError(
+                    f"Data quality below threshold: {rejected} of {stream.rows} rows rejected - "
+                    f"human intervention required ({json.dumps(rejections)})"
+                )
+
+            cursor.execute(UPSERT)
+            distinct, inserted, updated, without_transaction_id = cursor.fetchone()
+
+    elapsed = time.monotonic() - started
+    stats.update({
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": distinct - inserted - updated,
+        "duplicates": stream.rows - rejected - distinct,
+        # Loaded under a content hash: reloads are idempotent but corrections add rows
+        "without_transaction_id": without_transaction_id,
+        "copy_seconds": round(copied - started, 3),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(stream.rows / elapsed) if elapsed else stream.rows
+    })
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load a sales extract into raw_sales_data")
+    parser.add_argument('path', help="CSV, JSON array or NDJSON file, or - for stdin")
+    parser.add_argument('--format', choices=sorted(READERS), help="Defaults to the file extension")
+    parser.add_argument('--min-valid-ratio', type=float,
+                        default=float(os.getenv('SALES_LOAD_MIN_VALID_RATIO', '0.8')))
+    args = parser.parse_args()
+
+    data_format = args.format or os.path.splitext(args.path)[1].lstrip('.').lower()
+    if data_format == 'jsonl':
+        data_format = 'ndjson'
+    if data_format not in READERS:
+        parser.error("Cannot infer the format; pass --format csv, json or ndjson")
+
+    stream = sys.stdin if args.path == '-' else open(args.path, 'r', encoding='utf-8', newline='')
+    conn = None
+    try:
+        conn = get_db_connection()
+        stats = load_sales(conn, READERS[data_format](stream), min_valid_ratio=args.min_valid_ratio)
+        logger.info(
+            f"Loaded {stats['rows_read']} rows in {stats['seconds']}s ({stats['rows_per_second']} rows/s): "
+            f"{stats['inserted']} inserted, {stats['updated']} updated, {stats['rejected']} rejected"
+        )
+        if stats['without_transaction_id']:
+            logger.warning(
+                f"{stats['without_transaction_id']} rows had no transaction_id and were keyed by content; "
+                f"corrections to them will load as new rows"
+            )
+        # One JSON line on stdout for the ingestion workflow
+        print(json.dumps(stats))
+    except Exception as e:
+        logger.error(f"Sales load failed: {e}")
+        sys.exit(1)
+    finally:
+        if conn is not None:
+            conn.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Incremental refresh of the sales rollups
+
+Keeps agent_performance (per agent and day) and commercial_metrics (per
+agent and calendar month) in step with raw_sales_data. Only the agent/day
+groups touched by rows updated since the stored high-water mark, plus the
+groups rows moved out of or were deleted from (rollup_vacated_groups), are
+recomputed, each from its (agent_id, date) index range; a group left
+without rows drops to zero. Only the months containing those days are
+re-summed from agent_performance.
+
+Usage:
+    python refresh_rollups.py           # apply changes since the last run
+    python refresh_rollups.py --full    # rebuild from all raw sales
+"""
+
+import sys
+import json
+import time
+import argparse
+import logging
+
+from init_db import get_db_connection
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ROLLUP_NAME = 'sales'
+
+# Rows stamped by transactions still running when the refresh starts become
+# visible only after it finishes, with updated_at before their commit. The
+# mark therefore never moves past the start of the oldest open transaction,
+# and groups at the mark are refreshed again on the next run, which is harmless.
+NEXT_HIGH_WATER_MARK = """
+    SELECT least(
+        (SELECT max(last_updated_at) FROM rollup_delta),
+        (SELECT min(xact_start)::timestamp FROM pg_stat_activity
+         WHERE xact_start IS NOT NULL AND pid <> pg_backend_pid())
+    )
+"""
+
+COLLECT_DELTA = """
+    CREATE TEMP TABLE rollup_delta ON COMMIT DROP AS
+    SELECT agent_id, date, max(updated_at) AS last_updated_at
+    FROM raw_sales_data
+    WHERE updated_at >= (SELECT high_water_mark FROM rollup_state WHERE rollup_name = %s)
+    GROUP BY agent_id, date
+"""
+
+# Consumes the markers visible to this transaction; those of writers still
+# running stay for the next run
+COLLECT_VACATED = """
+    WITH vacated AS (
+        DELETE FROM rollup_vacated_groups RETURNING agent_id, date
+    )
+    INSERT INTO rollup_delta (agent_id, date)
+    SELECT DISTINCT v.agent_id, v.date
+    FROM vacated v
+    WHERE NOT EXISTS (SELECT 1 FROM rollup_delta d WHERE d.agent_id = v.agent_id AND d.date = v.date)
+"""
+
+# A full rebuild also revisits every rolled-up group, so groups emptied
+# before their removal was recorded drop to zero as well
+COLLECT_ROLLED_UP = """
+    INSERT INTO rollup_delta (agent_id, date)
+    SELECT p.agent_id, p.performance_date
+    FROM agent_performance p
+    WHERE NOT EXISTS (SELECT 1 FROM rollup_delta d WHERE d.agent_id = p.agent_id AND d.date = p.performance_date)
+"""
+
+REFRESH_AGENT_PERFORMANCE = """
+    INSERT INTO agent_performance (agent_id, performance_date, sales_total, transaction_count)
+    SELECT d.agent_id, d.date, coalesce(sum(r.sales_amount), 0), count(r.id)
+    FROM rollup_delta d
+    LEFT JOIN raw_sales_data r ON r.agent_id = d.agent_id AND r.date = d.date
+    GROUP BY d.agent_id, d.date
+    ON CONFLICT (agent_id, performance_date) DO UPDATE SET
+        sales_total = EXCLUDED.sales_total,
+        transaction_count = EXCLUDED.transaction_count,
+        -- Targets are maintained separately; quota follows the new total
+        quota_percentage = CASE
+            WHEN agent_performance.target_total > 0
+            THEN least(999.99, EXCLUDED.sales_total / agent_performance.target_total * 100)
+            ELSE 0
+        END
+"""
+
+REFRESH_COMMERCIAL_METRICS = """
+    WITH months AS (
+        SELECT DISTINCT
+            agent_id,
+            date_trunc('month', date)::date AS period_start,
+            (date_trunc('month', date) + interval '1 month - 1 day')::date AS period_end
+        FROM rollup_delta
+    ),
+    totals AS (
+        SELECT m.agent_id, m.period_start, m.period_end,
+               sum(p.sales_total) AS sales_total,
+               sum(p.transaction_count) AS transaction_count
+        FROM months m
+        JOIN agent_performance p
+            ON p.agent_id = m.agent_id AND p.performance_date BETWEEN m.period_start AND m.period_end
+        GROUP BY m.agent_id, m.period_start, m.period_end
+    )
+    INSERT INTO commercial_metrics (agent_id, metric_type, metric_value, period_start, period_end, calculation_date)
+    SELECT t.agent_id, metric.metric_type, metric.metric_value, t.period_start, t.period_end, CURRENT_TIMESTAMP
+    FROM totals t
+    CROSS JOIN LATERAL (VALUES
+        ('sales_total', t.sales_total),
+        ('transaction_count', t.transaction_count),
+        -- A month whose sales were all removed averages zero like its totals
+        ('avg_transaction', coalesce(round(t.sales_total / nullif(t.transaction_count, 0), 2), 0))
+    ) AS metric(metric_type, metric_value)
+    ON CONFLICT (agent_id, metric_type, period_start, period_end) DO UPDATE SET
+        metric_value = EXCLUDED.metric_value,
+        calculation_date = EXCLUDED.calculation_date
+"""
+
+def refresh_rollups(conn, full=False):
+    """Apply raw_sales_data changes since the high-water mark in one transaction; None if a refresh is already running"""
+    started = time.monotonic()
+
+    with conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('refresh_rollups'))")
+            if not cursor.fetchone()[0]:
+                return None
+
+            cursor.execute(
+                "INSERT INTO rollup_state (rollup_name) VALUES (%s) ON CONFLICT (rollup_name) DO NOTHING",
+                (ROLLUP_NAME,)
+            )
+            if full:
+                cursor.execute(
+                    "UPDATE rollup_state SET high_water_mark = '-infinity' WHERE rollup_name = %s",
+                    (ROLLUP_NAME,)
+                )
+            cursor.execute(COLLECT_DELTA, (ROLLUP_NAME,))
+            groups = cursor.rowcount
+            cursor.execute(COLLECT_VACATED)
+            groups += cursor.rowcount
+            if full:
+                cursor.execute(COLLECT_ROLLED_UP)
+                groups += cursor.rowcount
+
+            metrics = 0
+            if groups:
+                cursor.execute(REFRESH_AGENT_PERFORMANCE)
+                cursor.execute(REFRESH_COMMERCIAL_METRICS)
+                metrics = cursor.rowcount
+
+            # The mark stays in SQL: psycopg2 cannot represent the initial -infinity
+            cursor.execute(f"""
+                UPDATE rollup_state SET
+                    high_water_mark = greatest(high_water_mark, coalesce(({NEXT_HIGH_WATER_MARK}), high_water_mark)),
+                    refreshed_at = CURRENT_TIMESTAMP,
+                    last_groups_refreshed = %s
+                WHERE rollup_name = %s
+                RETURNING high_water_mark::text
+            """, (groups, ROLLUP_NAME))
+            high_water_mark = cursor.fetchone()[0]
+
+    return {
+        "agent_days_refreshed": groups,
+        "metrics_refreshed": metrics,
+        "high_water_mark": high_water_mark,
+        "seconds": round(time.monotonic() - started, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh agent_performance and commercial_metrics from raw_sales_data")
+    parser.add_argument('--full', action='store_true', help="Recompute every agent and day")
+    args = parser.parse_args()
+
+    conn = None
+    try:
+        conn = get_db_connection()
+        stats = refresh_rollups(conn, full=args.full)
+        if stats is None:
+            logger.info("Another rollup refresh is running, skipping")
+            stats = {"skipped": True}
+        else:
+            logger.info(
+                f"Refreshed {stats['agent_days_refreshed']} agent days and {stats['metrics_refreshed']} "
+                f"monthly metrics in {stats['seconds']}s"
+            )
+        print(json.dumps(stats))
+    except Exception as e:
+        logger.error(f"Rollup refresh failed: {e}")
+        sys.exit(1)
+    finally:
+        if conn is not None:
+            conn.close()
+
+if __name__ == "__main__":
+    main()